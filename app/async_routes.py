@@ -0,0 +1,141 @@
+from typing import List, Literal, Optional, Union
+
+from fastapi import APIRouter, Depends, Query, Request, Response, status
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from . import routes
+from .dependencies import get_async_db, get_async_write_db
+from .pagination import MAX_PAGE_SIZE
+from .routes import (
+    NoteBatch, NoteCreate, NoteOut, NotePatch, NoteSummaryOut, NoteUpdate, PieceOut, TodoBatch, TodoCreate,
+    TodoFilters, TodoOut, TodoUpdate,
+)
+
+# Async versions of the notes and todos endpoints, declared like the ones in
+# routes.py so both modes publish the same OpenAPI schema. The handler bodies
+# are the sync ones, run through AsyncSession.run_sync: their queries are
+# awaited on the async driver instead of blocking a threadpool worker, but the
+# Python in between runs on the event loop thread. The CPU-heavy steps (piece
+# diffs, revision and response encoding) are handed to the threadpool by
+# app/concurrency.py; the rest (building rows into payloads) still holds the
+# loop, which is the price of sharing one implementation with the sync path.
+
+notes_router = APIRouter()
+todos_router = APIRouter()
+
+
+async def run_handler(db: AsyncSession, handler, **kwargs):
+    return await db.run_sync(lambda session: handler(db=session, **kwargs))
+
+
+@notes_router.post('/notes', status_code=status.HTTP_201_CREATED)
+async def create_note(note_data: NoteCreate, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.create_note, note_data=note_data)
+
+
+@notes_router.post('/notes/batch')
+async def batch_notes(batch: NoteBatch, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.batch_notes, batch=batch)
+
+
+@notes_router.get('/notes', response_model=List[NoteOut])
+async def get_all_notes(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await run_handler(db, routes.get_all_notes, request=request, response=response, limit=limit, after=after)
+
+
+@notes_router.get('/notes/{note_id}', response_model=Union[NoteOut, NoteSummaryOut])
+async def get_single_note(
+    note_id: int,
+    request: Request,
+    response: Response,
+    include_pieces: bool = True,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await run_handler(
+        db, routes.get_single_note, note_id=note_id, request=request, response=response, include_pieces=include_pieces
+    )
+
+
+@notes_router.get('/notes/{note_id}/pieces', response_model=List[PieceOut])
+async def get_note_pieces(
+    note_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await run_handler(
+        db, routes.get_note_pieces, note_id=note_id, request=request, response=response,
+        limit=limit, offset=offset, after=after,
+    )
+
+
+@notes_router.put('/notes/{note_id}')
+async def update_note(note_id: int, note_data: NoteUpdate, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.update_note, note_id=note_id, note_data=note_data)
+
+
+@notes_router.patch('/notes/{note_id}/pieces')
+async def patch_note_pieces(note_id: int, patch: NotePatch, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.patch_note_pieces, note_id=note_id, patch=patch)
+
+
+@notes_router.delete('/notes/{note_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def delete_note(note_id: int, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.delete_note, note_id=note_id)
+
+
+@todos_router.post('/todos/', status_code=status.HTTP_201_CREATED)
+async def create_todo(todo_data: TodoCreate, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.create_todo, todo_data=todo_data)
+
+
+@todos_router.post('/todos/batch')
+async def batch_todos(batch: TodoBatch, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.batch_todos, batch=batch)
+
+
+@todos_router.get('/todos/count')
+async def count_todos(filters: TodoFilters = Depends(), db: AsyncSession = Depends(get_async_db)):
+    return await run_handler(db, routes.count_todos, filters=filters)
+
+
+@todos_router.get('/todos/', response_model=List[TodoOut])
+async def get_all_todos(
+    request: Request,
+    response: Response,
+    filters: TodoFilters = Depends(),
+    sort: Literal["created", "-created", "completed", "-completed"] = "created",
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: AsyncSession = Depends(get_async_db)
+):
+    return await run_handler(
+        db, routes.get_all_todos,
+        request=request, response=response, filters=filters, sort=sort, limit=limit, after=after
+    )
+
+
+@todos_router.get('/todos/{todo_id}', response_model=TodoOut)
+async def get_single_todo(
+    todo_id: int, request: Request, response: Response, db: AsyncSession = Depends(get_async_db)
+):
+    return await run_handler(db, routes.get_single_todo, todo_id=todo_id, request=request, response=response)
+
+
+@todos_router.put('/todos/{todo_id}')
+async def update_todo(todo_id: int, todo_data: TodoUpdate, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.update_todo, todo_id=todo_id, todo_data=todo_data)
+
+
+@todos_router.delete('/todos/{todo_id}', status_code=status.HTTP_204_NO_CONTENT)
+async def delete_todo(todo_id: int, db: AsyncSession = Depends(get_async_write_db)):
+    return await run_handler(db, routes.delete_todo, todo_id=todo_id)
@@ -0,0 +1,127 @@
+import threading
+from collections import OrderedDict
+
+from fastapi import APIRouter, Response
+
+from .concurrency import offload
+from .config import CACHE_ENABLED, CACHE_MAX_BYTES
+from .responses import encode_json, json_response
+
+# In-process cache of serialized GET payloads.
+#
+# Keys are ("note", id), ("notes", limit, after), ("todo", id) and ("todos", query string).
+# Every entry remembers the ETag it was built under: a hit only counts when
+# that still matches the current one, so an entry filled by a request racing a
+# write (or by another worker process) can never be served stale. The write
+# handlers additionally drop the entries they affect, which keeps memory for
+# live data.
+
+
+class LRUCache:
+    def __init__(self, max_bytes: int, enabled: bool = True):
+        self.max_bytes = max_bytes
+        self.enabled = enabled
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key, etag):
+        if not self.enabled:
+            return None
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != etag:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key, etag, value, size: int):
+        if not self.enabled or size > self.max_bytes:
+            return
+        with self._lock:
+            self._discard(key)
+            self._entries[key] = (etag, value, size)
+            self.size += size
+            while self.size > self.max_bytes:
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.size -= evicted_size
+                self.evictions += 1
+
+    def _discard(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def invalidate(self, key):
+        with self._lock:
+            self._discard(key)
+
+    def invalidate_namespace(self, namespace: str):
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == namespace]:
+                self._discard(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size = 0
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "size_bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+
+response_cache = LRUCache(CACHE_MAX_BYTES, enabled=CACHE_ENABLED)
+
+
+def cached_response(key, etag):
+    entry = response_cache.get(key, etag)
+    if entry is None:
+        return None
+    body, raw_headers = entry
+    return json_response(body, raw_headers)
+
+
+def store_response(key, etag, payload, response: Response) -> Response:
+    body = offload(encode_json, payload)
+    raw_headers = list(response.headers.raw)
+    response_cache.set(key, etag, (body, raw_headers), len(body))
+    return json_response(body, raw_headers)
+
+
+def invalidate_note(note_id=None):
+    if note_id is not None:
+        response_cache.invalidate(("note", note_id))
+    response_cache.invalidate_namespace("notes")
+
+
+def invalidate_todo(todo_id=None):
+    if todo_id is not None:
+        response_cache.invalidate(("todo", todo_id))
+    response_cache.invalidate_namespace("todos")
+
+
+cache_router = APIRouter()
+
+
+@cache_router.get('/cache/stats')
+def get_cache_stats():
+    return response_cache.stats()
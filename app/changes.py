@@ -0,0 +1,207 @@
+import asyncio
+import itertools
+import threading
+from contextlib import suppress
+from datetime import datetime
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Header, WebSocket
+from fastapi.responses import StreamingResponse
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from .config import CHANGE_LOG_SIZE, CHANGES_HEARTBEAT
+from .database import DBChange
+from .dependencies import get_db
+from .responses import encode_json
+
+# Change feed. Write handlers append a row to the `changes` table in the same
+# transaction as the write, so the sequence numbers follow commit order and a
+# client that reconnects with the last one it saw misses nothing. Open streams
+# sleep until a commit wakes them up instead of polling; the only idle work is
+# a heartbeat, which also re-reads the log to pick up writes made by other
+# processes.
+
+# Changes sent per read of the log
+CHANGES_PAGE_SIZE = 500
+# The log is trimmed to CHANGE_LOG_SIZE entries every this many recorded changes
+PRUNE_EVERY = 100
+
+changes_router = APIRouter()
+
+
+class Subscription:
+    def __init__(self, loop):
+        self.loop = loop
+        self.event = asyncio.Event()
+
+    async def wait(self, timeout: float) -> bool:
+        try:
+            await asyncio.wait_for(self.event.wait(), timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+
+class ChangeNotifier:
+    # Commits happen in threadpool workers while streams wait on an event
+    # loop, so subscribers are woken through call_soon_threadsafe
+    def __init__(self):
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self) -> Subscription:
+        subscription = Subscription(asyncio.get_running_loop())
+        with self._lock:
+            self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription: Subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def notify(self):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            with suppress(RuntimeError):  # the loop has been closed
+                subscription.loop.call_soon_threadsafe(subscription.event.set)
+
+
+notifier = ChangeNotifier()
+_recorded = itertools.count(1)
+
+
+def record_change(db: Session, entity: str, entity_id: int, action: str):
+    db.add(DBChange(entity=entity, entity_id=entity_id, action=action, timestamp=datetime.now()))
+    db.info["changes_recorded"] = True
+    if next(_recorded) % PRUNE_EVERY == 0:
+        prune_changes(db)
+
+
+def prune_changes(db: Session, keep: int = CHANGE_LOG_SIZE):
+    newest = db.query(func.max(DBChange.seq)).scalar()
+    if newest is not None:
+        db.query(DBChange).filter(DBChange.seq <= newest - keep).delete(synchronize_session=False)
+
+
+@event.listens_for(Session, "after_commit")
+def notify_after_commit(session):
+    if session.info.pop("changes_recorded", False):
+        notifier.notify()
+
+
+@event.listens_for(Session, "after_rollback")
+def forget_after_rollback(session):
+    session.info.pop("changes_recorded", None)
+
+
+def read_changes(bind, after: Optional[int], limit: int = CHANGES_PAGE_SIZE):
+    # A fresh session per read: a stream must not keep one snapshot open
+    with Session(bind=bind) as db:
+        oldest, newest = db.query(func.min(DBChange.seq), func.max(DBChange.seq)).one()
+        rows = []
+        if after is not None:
+            rows = db.execute(
+                select(DBChange.seq, DBChange.entity, DBChange.entity_id, DBChange.action, DBChange.timestamp)
+                .where(DBChange.seq > after)
+                .order_by(DBChange.seq)
+                .limit(limit)
+            ).all()
+    return oldest, newest or 0, rows
+
+
+async def iter_changes(bind, after: Optional[int], heartbeat: float = CHANGES_HEARTBEAT):
+    # Yields ("change", payload), ("reset", {"seq"}) when the client is too far
+    # behind to catch up from the log, and ("heartbeat", None) on idle streams.
+    # Without `after` the stream starts at the current end of the log.
+    subscription = notifier.subscribe()
+    try:
+        while True:
+            # Cleared before reading, so a commit landing during the read
+            # wakes the next wait right away
+            subscription.event.clear()
+            oldest, newest, rows = await run_in_threadpool(read_changes, bind, after)
+
+            if after is None or after > newest or (oldest is not None and oldest > after + 1):
+                if after is not None:
+                    yield "reset", {"seq": newest}
+                after = newest
+                continue
+
+            for seq, entity, entity_id, action, timestamp in rows:
+                yield "change", {
+                    "seq": seq, "entity": entity, "id": entity_id, "action": action, "timestamp": timestamp
+                }
+                after = seq
+            if len(rows) == CHANGES_PAGE_SIZE:
+                continue
+
+            if not await subscription.wait(heartbeat):
+                yield "heartbeat", None
+    finally:
+        notifier.unsubscribe(subscription)
+
+
+def format_event(kind: str, payload) -> bytes:
+    if kind == "heartbeat":
+        return b": heartbeat\n\n"
+    return b"id: %d\nevent: %s\ndata: %s\n\n" % (payload["seq"], kind.encode(), encode_json(payload))
+
+
+async def event_stream(bind, after: Optional[int]):
+    yield b"retry: 3000\n\n"
+    async for kind, payload in iter_changes(bind, after):
+        yield format_event(kind, payload)
+
+
+@changes_router.get('/changes')
+def stream_changes(
+    after: Optional[int] = None,
+    last_event_id: Optional[int] = Header(None),
+    db: Session = Depends(get_db)
+):
+    # Server-sent events. EventSource resends the last id it received as
+    # Last-Event-ID when reconnecting; `after` does the same for the first connection.
+    if last_event_id is not None:
+        after = last_event_id
+    return StreamingResponse(
+        event_stream(db.get_bind(), after),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@changes_router.websocket('/changes/ws')
+async def changes_websocket(websocket: WebSocket, after: Optional[int] = None, db: Session = Depends(get_db)):
+    # The same events as JSON messages ({"type": "change" | "reset", ...});
+    # the protocol's own pings replace the heartbeats
+    await websocket.accept()
+    changes = iter_changes(db.get_bind(), after)
+    item_task = None
+    # Reading the socket is what notices the client going away
+    receive_task = asyncio.ensure_future(websocket.receive())
+    try:
+        while True:
+            if item_task is None:
+                item_task = asyncio.ensure_future(changes.__anext__())
+            done, _ = await asyncio.wait({item_task, receive_task}, return_when=asyncio.FIRST_COMPLETED)
+
+            if receive_task in done:
+                if receive_task.result()["type"] == "websocket.disconnect":
+                    break
+                receive_task = asyncio.ensure_future(websocket.receive())
+
+            if item_task in done:
+                kind, payload = item_task.result()
+                item_task = None
+                if kind != "heartbeat":
+                    await websocket.send_text(encode_json({"type": kind, **payload}).decode())
+    finally:
+        for task in (item_task, receive_task):
+            if task is not None:
+                task.cancel()
+                with suppress(asyncio.CancelledError, StopAsyncIteration):
+                    await task
+        await changes.aclose()
@@ -0,0 +1,199 @@
+import zlib
+from typing import Optional
+
+from starlette.datastructures import Headers, MutableHeaders
+
+from .config import BROTLI_QUALITY, COMPRESSION_ENABLED, COMPRESSION_MINIMUM_SIZE, GZIP_LEVEL
+from .metrics import MetricsRegistry, registry
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - brotli is optional
+    brotli = None
+
+# Response compression, negotiated from Accept-Encoding: brotli when the
+# package is installed and the client takes it, gzip otherwise.
+#
+# A response sent in one piece is compressed whole, and only when it is at
+# least `minimum_size` bytes long. A streamed one (the export, the change
+# feed) is compressed as it goes: each chunk is flushed through the
+# compressor, so the client can decode everything it has received so far and
+# an event on the change feed is not held back waiting for more data.
+#
+# ETags stay as they are: they are all weak, and weak validators are allowed
+# to match across content codings.
+
+COMPRESSIBLE_TYPES = {"application/json", "application/x-ndjson", "application/javascript", "application/xml"}
+
+
+def is_compressible(content_type: str) -> bool:
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    return (
+        media_type.startswith("text/") or media_type in COMPRESSIBLE_TYPES
+        or media_type.endswith("+json") or media_type.endswith("+xml")
+    )
+
+
+def negotiate(accept_encoding: str, brotli_available: bool = brotli is not None) -> Optional[str]:
+    # The preferred coding out of the ones we can produce, None for identity
+    weights = {}
+    for item in accept_encoding.split(","):
+        coding, _, params = item.strip().partition(";")
+        weight = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[coding.strip().lower()] = weight
+
+    candidates = ["br", "gzip"] if brotli_available else ["gzip"]
+    best, best_weight = None, 0.0
+    for coding in candidates:
+        weight = weights.get(coding, weights.get("*", 0.0))
+        if weight > best_weight:
+            best, best_weight = coding, weight
+    return best
+
+
+class GzipStream:
+    def __init__(self, level: int):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self._compressor.compress(data) + self._compressor.flush(zlib.Z_FINISH)
+        if not data:
+            return b""
+        return self._compressor.compress(data) + self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+
+class BrotliStream:
+    def __init__(self, quality: int):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        if final:
+            return self._compressor.process(data) + self._compressor.finish()
+        if not data:
+            return b""
+        return self._compressor.process(data) + self._compressor.flush()
+
+
+class CompressionMiddleware:
+    # Plain ASGI middleware, like MetricsMiddleware: Starlette's GZipMiddleware
+    # only does gzip and keeps no account of what it saved
+    def __init__(
+        self,
+        app,
+        minimum_size: int = COMPRESSION_MINIMUM_SIZE,
+        gzip_level: int = GZIP_LEVEL,
+        brotli_quality: int = BROTLI_QUALITY,
+        enabled: bool = COMPRESSION_ENABLED,
+        registry: MetricsRegistry = registry,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.gzip_level = gzip_level
+        self.brotli_quality = brotli_quality
+        self.enabled = enabled
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.enabled:
+            await self.app(scope, receive, send)
+            return
+        encoding = negotiate(Headers(scope=scope).get("accept-encoding", ""))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+        await self.app(scope, receive, CompressingSender(self, send, encoding).send)
+
+    def stream(self, encoding: str):
+        if encoding == "br":
+            return BrotliStream(self.brotli_quality)
+        return GzipStream(self.gzip_level)
+
+
+class CompressingSender:
+    # Holds back the response start until the first body message shows
+    # whether the response is worth compressing
+    def __init__(self, middleware: CompressionMiddleware, send, encoding: str):
+        self.middleware = middleware
+        self._send = send
+        self.encoding = encoding
+        self.start = None
+        self.stream = None
+        self.passthrough = False
+        self.bytes_in = 0
+        self.bytes_out = 0
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            self.start = message
+            return
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+        if self.stream is None:
+            await self._first_body(message)
+            return
+        await self._send_compressed(message.get("body", b""), message.get("more_body", False))
+
+    async def _flush_start(self):
+        if self.start is not None:
+            start, self.start = self.start, None
+            await self._send(start)
+
+    async def _first_body(self, message):
+        headers = MutableHeaders(raw=self.start["headers"])
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if (
+            not is_compressible(headers.get("content-type", ""))
+            or "content-encoding" in headers
+            or "content-range" in headers
+        ):
+            self.passthrough = True
+        else:
+            # Whether or not this one gets compressed, the response depends
+            # on Accept-Encoding for caches
+            headers.add_vary_header("Accept-Encoding")
+            self.passthrough = not more_body and len(body) < self.middleware.minimum_size
+        if self.passthrough:
+            await self._flush_start()
+            await self._send(message)
+            return
+
+        self.stream = self.middleware.stream(self.encoding)
+        headers["Content-Encoding"] = self.encoding
+        if more_body:
+            # The length is unknown until the stream ends
+            del headers["Content-Length"]
+            await self._flush_start()
+            await self._send_compressed(body, more_body)
+        else:
+            compressed = self._compress(body, final=True)
+            headers["Content-Length"] = str(len(compressed))
+            await self._flush_start()
+            await self._send({"type": "http.response.body", "body": compressed})
+            self._record()
+
+    def _compress(self, body: bytes, final: bool) -> bytes:
+        compressed = self.stream.compress(body, final)
+        self.bytes_in += len(body)
+        self.bytes_out += len(compressed)
+        return compressed
+
+    async def _send_compressed(self, body: bytes, more_body: bool):
+        compressed = self._compress(body, final=not more_body)
+        if compressed or not more_body:
+            await self._send({"type": "http.response.body", "body": compressed, "more_body": more_body})
+        if not more_body:
+            self._record()
+
+    def _record(self):
+        if self.middleware.registry.enabled:
+            self.middleware.registry.record_compression(self.encoding, self.bytes_in, self.bytes_out)
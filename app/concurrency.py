@@ -0,0 +1,16 @@
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+
+# The async request path runs the handler bodies of routes.py through
+# AsyncSession.run_sync: on the event loop thread, in a greenlet that awaits
+# each query. CPU-bound steps (diffing piece lists, encoding revisions and
+# response bodies) would stall every other request there, so they go through
+# offload(), which hands them to the threadpool from such a greenlet and
+# simply calls them anywhere else (the sync handlers already run in a worker).
+
+
+def offload(fn, *args):
+    if in_greenlet():
+        return await_only(run_in_threadpool(fn, *args))
+    return fn(*args)
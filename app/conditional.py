@@ -0,0 +1,60 @@
+import hashlib
+from datetime import timezone
+from email.utils import format_datetime, parsedate_to_datetime
+
+from fastapi import Request, Response, status
+
+# Conditional GET support: handlers compute a validator from a cheap aggregate
+# (row count, latest update) and answer 304 before loading any rows. Only
+# single rows send Last-Modified: a list's latest update does not move when a
+# row is deleted or leaves the list, so lists are validated by ETag alone.
+
+
+def make_etag(*parts) -> str:
+    digest = hashlib.blake2b("|".join(str(part) for part in parts).encode(), digest_size=12)
+    return f'W/"{digest.hexdigest()}"'
+
+
+def http_date(timestamp) -> str:
+    # Stored timestamps are naive local times
+    return format_datetime(timestamp.astimezone(timezone.utc), usegmt=True)
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def is_not_modified(request: Request, etag: str, last_modified=None) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # Weak comparison, as required for If-None-Match
+        tags = {_opaque_tag(tag.strip()) for tag in if_none_match.split(",")}
+        return "*" in tags or _opaque_tag(etag) in tags
+
+    # If-Modified-Since only counts when there is no If-None-Match (RFC 9110)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is None or last_modified is None:
+        return False
+    try:
+        since = parsedate_to_datetime(if_modified_since)
+    except (TypeError, ValueError):
+        return False
+    if since.tzinfo is None:
+        since = since.replace(tzinfo=timezone.utc)
+    # HTTP dates have a resolution of one second: an update within the second
+    # the date names may be newer than the client's copy, so only an update
+    # before it is not modified. Clients polling faster send the ETag.
+    return last_modified.astimezone(timezone.utc) < since
+
+
+def conditional_response(request: Request, response: Response, etag: str, last_modified=None):
+    # Returns a 304 response when the client's copy is current; otherwise sets
+    # the validators on `response` and returns None
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if last_modified is not None:
+        headers["Last-Modified"] = http_date(last_modified)
+
+    if is_not_modified(request, etag, last_modified):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    response.headers.update(headers)
+    return None
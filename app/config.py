@@ -0,0 +1,87 @@
+import os
+
+
+def env_bool(name: str, default: bool = False) -> bool:
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ("1", "true", "yes", "on")
+
+
+def env_int(name: str, default: int) -> int:
+    value = os.environ.get(name)
+    return default if value is None else int(value)
+
+
+# Database: any SQLAlchemy URL (sqlite:///..., postgresql://... for psycopg2),
+# the SQLite file in app/database.py when unset. The async path uses
+# NOTES_ASYNC_DATABASE_URL, by default the same database through aiosqlite,
+# asyncpg or psycopg's async mode.
+DATABASE_URL = os.environ.get("NOTES_DATABASE_URL")
+ASYNC_DATABASE_URL = os.environ.get("NOTES_ASYNC_DATABASE_URL")
+
+# Connection pool of server databases (SQLite keeps SQLAlchemy's defaults):
+# pool_recycle is in seconds, -1 keeps connections forever
+DATABASE_POOL_SIZE = env_int("NOTES_DATABASE_POOL_SIZE", 5)
+DATABASE_MAX_OVERFLOW = env_int("NOTES_DATABASE_MAX_OVERFLOW", 10)
+DATABASE_POOL_PRE_PING = env_bool("NOTES_DATABASE_POOL_PRE_PING", True)
+DATABASE_POOL_RECYCLE = env_int("NOTES_DATABASE_POOL_RECYCLE", 1800)
+
+# Serve the notes and todos endpoints with async handlers on an aiosqlite engine
+ASYNC_DATABASE = env_bool("NOTES_ASYNC_DATABASE")
+
+# SQLite connection tuning: a profile from app/sqlite_pragmas.py, with single
+# pragmas overridable as NOTES_SQLITE_JOURNAL_MODE, NOTES_SQLITE_SYNCHRONOUS, ...
+SQLITE_PROFILE = os.environ.get("NOTES_SQLITE_PROFILE", "production")
+
+# In-process cache of serialized note and todo payloads
+CACHE_ENABLED = env_bool("NOTES_CACHE_ENABLED", True)
+CACHE_MAX_BYTES = env_int("NOTES_CACHE_MAX_BYTES", 64 * 1024 * 1024)
+
+# Change feed: entries kept in the change log, and seconds between heartbeats
+# on idle streams (each also re-checks the log for writes from other processes)
+CHANGE_LOG_SIZE = env_int("NOTES_CHANGE_LOG_SIZE", 10000)
+CHANGES_HEARTBEAT = env_int("NOTES_CHANGES_HEARTBEAT", 15)
+
+# Days a deletion stays listed by GET /sync. A client whose token is older
+# than the pruned tombstones gets a full sync (0 keeps them forever).
+TOMBSTONE_RETENTION_DAYS = env_int("NOTES_TOMBSTONE_RETENTION_DAYS", 30)
+
+# Per-route request metrics at /metrics, and a warning with the request's SQL
+# for requests slower than NOTES_SLOW_REQUEST_MS (0 turns the log off)
+METRICS_ENABLED = env_bool("NOTES_METRICS_ENABLED", True)
+SLOW_REQUEST_MS = env_int("NOTES_SLOW_REQUEST_MS", 0)
+
+# Worker processes for `python main.py`. Writers take SQLite's write lock up
+# front and wait for it up to busy_timeout; NOTES_WRITE_RETRIES more attempts,
+# backing off from NOTES_WRITE_RETRY_BACKOFF_MS, come before a 503.
+WORKERS = env_int("NOTES_WORKERS", 1)
+WRITE_RETRIES = env_int("NOTES_WRITE_RETRIES", 2)
+WRITE_RETRY_BACKOFF_MS = env_int("NOTES_WRITE_RETRY_BACKOFF_MS", 50)
+
+# Write-behind for note and todo updates (sync handlers only, see
+# app/write_behind.py): queued updates are written every
+# NOTES_WRITE_BEHIND_INTERVAL_MS, or once NOTES_WRITE_BEHIND_MAX_PENDING wait
+WRITE_BEHIND = env_bool("NOTES_WRITE_BEHIND", False)
+WRITE_BEHIND_INTERVAL_MS = env_int("NOTES_WRITE_BEHIND_INTERVAL_MS", 250)
+WRITE_BEHIND_MAX_PENDING = env_int("NOTES_WRITE_BEHIND_MAX_PENDING", 200)
+
+# Response compression: gzip, or brotli when the brotli package is installed.
+# Bodies smaller than the minimum size are sent as they are.
+COMPRESSION_ENABLED = env_bool("NOTES_COMPRESSION_ENABLED", True)
+COMPRESSION_MINIMUM_SIZE = env_int("NOTES_COMPRESSION_MINIMUM_SIZE", 1024)
+GZIP_LEVEL = env_int("NOTES_GZIP_LEVEL", 6)
+BROTLI_QUALITY = env_int("NOTES_BROTLI_QUALITY", 4)
+
+# Note revision history (see app/revisions.py): a full snapshot every
+# NOTES_REVISION_SNAPSHOT_EVERY revisions, deltas in between. Every
+# NOTES_REVISION_COMPACT_EVERY revisions a note's history is compacted:
+# revisions older than NOTES_REVISION_COMPACT_AFTER_HOURS are thinned to one
+# per hour, and at most NOTES_REVISION_KEEP revisions (0: all) no older than
+# NOTES_REVISION_MAX_AGE_DAYS (0: any age) are kept.
+REVISIONS_ENABLED = env_bool("NOTES_REVISIONS_ENABLED", True)
+REVISION_SNAPSHOT_EVERY = env_int("NOTES_REVISION_SNAPSHOT_EVERY", 50)
+REVISION_COMPACT_EVERY = env_int("NOTES_REVISION_COMPACT_EVERY", 100)
+REVISION_COMPACT_AFTER_HOURS = env_int("NOTES_REVISION_COMPACT_AFTER_HOURS", 24)
+REVISION_KEEP = env_int("NOTES_REVISION_KEEP", 1000)
+REVISION_MAX_AGE_DAYS = env_int("NOTES_REVISION_MAX_AGE_DAYS", 0)
@@ -1,15 +1,112 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, Boolean
+import asyncio
+import itertools
+import random
+import threading
+import time
+from bisect import bisect_left
+from collections import Counter
+from datetime import datetime, timedelta
+
+from sqlalchemy import (
+    bindparam, create_engine, delete, event, func, inspect, make_url, select, text, update, BigInteger, Column, Date,
+    Float, Integer, String, DateTime, ForeignKey, Boolean, Index, LargeBinary, DDL,
+)
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import sessionmaker, relationship
+from sqlalchemy.orm import Session, sessionmaker, relationship
+
+from .config import (
+    ASYNC_DATABASE_URL, DATABASE_MAX_OVERFLOW, DATABASE_POOL_PRE_PING, DATABASE_POOL_RECYCLE, DATABASE_POOL_SIZE,
+    DATABASE_URL, SQLITE_PROFILE, TOMBSTONE_RETENTION_DAYS, WRITE_RETRIES, WRITE_RETRY_BACKOFF_MS,
+)
+from .migrations import upgrade_schema
+from .sqlite_pragmas import install_pragmas, resolve_pragmas
 
 PATH_TO_DATABASE = '/home/fabio/PycharmProjects/notes/app.db'
+
+
+def database_url(url: str) -> str:
+    # A bare postgresql:// URL means psycopg2 in SQLAlchemy 2.0 but psycopg 3
+    # from 2.1 on: pin it to psycopg2, the driver in the Pipfile
+    url = make_url(url)
+    if url.drivername == "postgresql":
+        url = url.set(drivername="postgresql+psycopg2")
+    return url.render_as_string(hide_password=False)
+
+
+def async_database_url(url: str) -> str:
+    # The same database through a driver the async engine can use: aiosqlite,
+    # or asyncpg for PostgreSQL unless the URL names psycopg (3), which has an
+    # async mode of its own
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        url = url.set(drivername="sqlite+aiosqlite")
+    elif url.get_backend_name() == "postgresql" and url.get_driver_name() != "psycopg":
+        url = url.set(drivername="postgresql+asyncpg")
+    return url.render_as_string(hide_password=False)
+
+
 # Original database configuration
-SQLALCHEMY_DATABASE_URL = f"sqlite:///{PATH_TO_DATABASE}"
+SQLALCHEMY_DATABASE_URL = database_url(DATABASE_URL or f"sqlite:///{PATH_TO_DATABASE}")
+ASYNC_SQLALCHEMY_DATABASE_URL = ASYNC_DATABASE_URL or async_database_url(SQLALCHEMY_DATABASE_URL)
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+SQLITE_PRAGMAS = resolve_pragmas(SQLITE_PROFILE)
+
+
+def engine_options(url: str) -> dict:
+    if make_url(url).get_backend_name() == "sqlite":
+        return {"connect_args": {"check_same_thread": False}}
+    return {
+        "pool_size": DATABASE_POOL_SIZE,
+        "max_overflow": DATABASE_MAX_OVERFLOW,
+        "pool_pre_ping": DATABASE_POOL_PRE_PING,
+        "pool_recycle": DATABASE_POOL_RECYCLE,
+    }
+
+
+def configure_engine(engine):
+    # Pragmas for SQLite and the metrics hooks, on the sync and async engines
+    # alike. app.metrics is imported here, not at the top: it brings FastAPI
+    # with it, which scripts importing the models do not need.
+    from .metrics import install_metrics
+
+    if engine.dialect.name == "sqlite":
+        install_pragmas(engine, SQLITE_PRAGMAS)
+    install_metrics(engine)
+
+
+# Engines and sessionmakers are built on first use rather than on import, so
+# importing the models (tests, scripts, worker start-up) opens no database.
+# `engine` and `SessionLocal` remain importable names, see __getattr__ below.
+_engine = None
+_session_local = None
+_engine_lock = threading.Lock()
+
+
+def get_engine():
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                engine = create_engine(SQLALCHEMY_DATABASE_URL, **engine_options(SQLALCHEMY_DATABASE_URL))
+                configure_engine(engine)
+                _engine = engine
+    return _engine
+
+
+def get_sessionmaker():
+    global _session_local
+    if _session_local is None:
+        _session_local = sessionmaker(autocommit=False, autoflush=False, bind=get_engine())
+    return _session_local
+
+
+def __getattr__(name):
+    if name == "engine":
+        return get_engine()
+    if name == "SessionLocal":
+        return get_sessionmaker()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Base class for models
 Base = declarative_base()
@@ -21,13 +118,28 @@ class DBPiece(Base):
     text = Column(String)
     timestamp = Column(DateTime)
     note_id = Column(Integer, ForeignKey("notes.id"))
+    # Sparse ordering key within the note, see app/pieces.py
+    position = Column(Integer)
+    # Sync version of the last write, see stamp_sync_versions
+    version = Column(Integer, nullable=False, server_default="0", index=True)
+
+    __table_args__ = (
+        Index("ix_pieces_note_id_position", "note_id", "position"),
+        {"sqlite_autoincrement": True},
+    )
 
 class DBNote(Base):
     __tablename__ = "notes"
     id = Column(Integer, primary_key=True, index=True)
     creation_timestamp = Column(DateTime)
     last_update_timestamp = Column(DateTime)
-    pieces = relationship("DBPiece", backref="note")
+    version = Column(Integer, nullable=False, server_default="0", index=True)
+    pieces = relationship("DBPiece", backref="note", order_by="(DBPiece.position, DBPiece.id)")
+
+    __table_args__ = (
+        Index("ix_notes_last_update_timestamp_id", "last_update_timestamp", "id"),
+        {"sqlite_autoincrement": True},
+    )
 
 class DBTodo(Base):
     __tablename__ = "todos"
@@ -36,17 +148,440 @@ class DBTodo(Base):
     timestamp = Column(DateTime)
     completed = Column(Boolean)
     completion_timestamp = Column(DateTime)
+    last_update_timestamp = Column(DateTime, index=True)
+    version = Column(Integer, nullable=False, server_default="0", index=True)
+
+    __table_args__ = (
+        Index("ix_todos_completed_timestamp", "completed", "timestamp"),
+        Index("ix_todos_completed_completion_timestamp", "completed", "completion_timestamp"),
+        Index("ix_todos_timestamp_id", "timestamp", "id"),
+        {"sqlite_autoincrement": True},
+    )
+
+class DBNoteRevision(Base):
+    # Past piece texts of a note, a zlib-compressed snapshot or delta from
+    # the previous revision, see app/revisions.py
+    __tablename__ = "note_revisions"
+    id = Column(Integer, primary_key=True)
+    note_id = Column(Integer, ForeignKey("notes.id"), nullable=False)
+    rev = Column(Integer, nullable=False)
+    timestamp = Column(DateTime)
+    # 0 for a snapshot, else the number of deltas since the last snapshot
+    depth = Column(Integer, nullable=False)
+    piece_count = Column(Integer)
+    # CRC-32 of the revision's texts
+    checksum = Column(BigInteger)
+    data = Column(LargeBinary)
+
+    __table_args__ = (
+        Index("ix_note_revisions_note_id_rev", "note_id", "rev", unique=True),
+    )
+
+class DBChange(Base):
+    # Change log read by GET /changes, see app/changes.py. AUTOINCREMENT keeps
+    # sequence numbers from being reused once old entries are pruned.
+    __tablename__ = "changes"
+    seq = Column(Integer, primary_key=True)
+    entity = Column(String)
+    entity_id = Column(Integer)
+    action = Column(String)
+    timestamp = Column(DateTime)
+
+    __table_args__ = {"sqlite_autoincrement": True}
+
+class DBTombstone(Base):
+    # Deleted notes, pieces and todos, so GET /sync can report them; pruned
+    # after TOMBSTONE_RETENTION_DAYS, see prune_tombstones
+    __tablename__ = "tombstones"
+    id = Column(Integer, primary_key=True)
+    entity = Column(String)
+    entity_id = Column(Integer)
+    version = Column(Integer, nullable=False, index=True)
+    timestamp = Column(DateTime, index=True)
+
+class DBSyncState(Base):
+    # A single row holding the last sync version handed out, and the version
+    # up to which tombstones have been pruned
+    __tablename__ = "sync_state"
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False)
+    pruned_version = Column(Integer, nullable=False, server_default="0")
+
+
+event.listen(DBSyncState.__table__, "after_create", DDL("INSERT INTO sync_state (id, version) VALUES (1, 0)"))
+
+# Summary tables behind GET /stats, kept up to date by every write, see app/stats.py
+class DBStatsCounter(Base):
+    # notes, pieces, todos_open and todos_completed
+    __tablename__ = "stats_counters"
+    name = Column(String, primary_key=True)
+    value = Column(Integer, nullable=False)
+
+class DBStatsNoteDay(Base):
+    # Notes by the day they were created
+    __tablename__ = "stats_note_days"
+    day = Column(Date, primary_key=True)
+    notes = Column(Integer, nullable=False)
+
+class DBStatsCompletion(Base):
+    # Completed todos by how long they took, see app.stats.COMPLETION_BUCKETS
+    __tablename__ = "stats_completion"
+    bucket = Column(Integer, primary_key=True)
+    todos = Column(Integer, nullable=False)
+    seconds = Column(Float, nullable=False)
+
+
+event.listen(DBStatsCounter.__table__, "after_create", DDL(
+    "INSERT INTO stats_counters (name, value) VALUES "
+    "('notes', 0), ('pieces', 0), ('todos_open', 0), ('todos_completed', 0)"
+))
+event.listen(DBStatsCompletion.__table__, "after_create", DDL(
+    "INSERT INTO stats_completion (bucket, todos, seconds) VALUES (0, 0, 0), (1, 0, 0), (2, 0, 0), (3, 0, 0), (4, 0, 0)"
+))
+
+# Sync versions. Every transaction that writes notes, pieces or todos takes the
+# next version from sync_state and stamps it on the rows it inserts or
+# updates, and records a tombstone for the rows it deletes. Taking the version
+# is a write, so it holds the database's write lock until commit: versions
+# become visible in increasing order, and "everything above the version a
+# client last saw" is exactly what changed since. Notes, pieces and todos use
+# AUTOINCREMENT, so the id of a tombstone never comes back as a new row.
+SYNC_ENTITIES = {DBNote: "note", DBPiece: "piece", DBTodo: "todo"}
+# Old tombstones are pruned every this many recorded ones
+TOMBSTONE_PRUNE_EVERY = 100
+_tombstones_recorded = itertools.count(1)
+
+
+def transaction_version(session: Session) -> int:
+    version = session.info.get("sync_version")
+    if version is None:
+        version = session.execute(
+            text("UPDATE sync_state SET version = version + 1 RETURNING version")
+        ).scalar_one()
+        session.info["sync_version"] = version
+    return version
+
+
+@event.listens_for(Session, "before_flush")
+def stamp_sync_versions(session, flush_context, instances):
+    changed = [
+        obj for obj in session.new if type(obj) in SYNC_ENTITIES
+    ] + [
+        obj for obj in session.dirty if type(obj) in SYNC_ENTITIES and session.is_modified(obj)
+    ]
+    deleted = [obj for obj in session.deleted if type(obj) in SYNC_ENTITIES and obj.id is not None]
+    if not changed and not deleted:
+        return
+
+    version = transaction_version(session)
+    for obj in changed:
+        obj.version = version
+    now = datetime.now()
+    prune = False
+    for obj in deleted:
+        session.add(DBTombstone(entity=SYNC_ENTITIES[type(obj)], entity_id=obj.id, version=version, timestamp=now))
+        prune |= next(_tombstones_recorded) % TOMBSTONE_PRUNE_EVERY == 0
+    if prune:
+        prune_tombstones(session, now, TOMBSTONE_RETENTION_DAYS)
+
+
+def prune_tombstones(db: Session, now: datetime, retention_days: int):
+    # Deletes the tombstones older than the retention and moves the horizon,
+    # sync_state.pruned_version, up to the newest of them: a token below it
+    # may have missed a deletion, so GET /sync answers it with a full sync
+    if not retention_days:
+        return
+    horizon = db.execute(
+        select(func.max(DBTombstone.version)).where(DBTombstone.timestamp < now - timedelta(days=retention_days))
+    ).scalar()
+    if horizon is None:
+        return
+    db.execute(delete(DBTombstone).where(DBTombstone.version <= horizon))
+    db.execute(update(DBSyncState).where(DBSyncState.pruned_version < horizon).values(pruned_version=horizon))
+
+
+@event.listens_for(Session, "after_commit")
+@event.listens_for(Session, "after_rollback")
+def forget_sync_version(session):
+    session.info.pop("sync_version", None)
+
+# Summary statistics for GET /stats (app/stats.py). Every flush adds what it
+# changes to the summary tables in the same transaction, from the notes,
+# pieces and todos it inserts, updates and deletes, so every writer going
+# through a session (the API, the write-behind queue, the import script)
+# keeps them exact. Bulk deletes skip the session and call
+# count_deleted_pieces instead.
+
+# Upper bounds of the completion time buckets, in seconds: an hour, a day, a
+# week, thirty days, and anything longer
+COMPLETION_BUCKETS = (3600, 86400, 7 * 86400, 30 * 86400)
+
+UPSERT_NOTE_DAY = text(
+    "INSERT INTO stats_note_days (day, notes) VALUES (:day, :notes) "
+    "ON CONFLICT (day) DO UPDATE SET notes = stats_note_days.notes + excluded.notes"
+).bindparams(bindparam("day", type_=Date))
+
+
+def completion_bucket(seconds: float) -> int:
+    return bisect_left(COMPLETION_BUCKETS, seconds)
+
+
+class StatsDelta:
+    def __init__(self):
+        self.counters = Counter()
+        self.note_days = Counter()
+        self.completions = Counter()
+        self.completion_seconds = Counter()
+
+    def add_note(self, creation_timestamp, sign: int):
+        self.counters["notes"] += sign
+        if creation_timestamp is not None:
+            self.note_days[creation_timestamp.date()] += sign
+
+    def add_todo(self, completed, timestamp, completion_timestamp, sign: int):
+        if not completed:
+            self.counters["todos_open"] += sign
+            return
+        self.counters["todos_completed"] += sign
+        if timestamp is not None and completion_timestamp is not None:
+            seconds = max((completion_timestamp - timestamp).total_seconds(), 0)
+            bucket = completion_bucket(seconds)
+            self.completions[bucket] += sign
+            self.completion_seconds[bucket] += sign * seconds
+
+    def apply(self, db: Session):
+        for name, value in self.counters.items():
+            if value:
+                db.execute(update(DBStatsCounter).where(DBStatsCounter.name == name).values(
+                    value=DBStatsCounter.value + value
+                ))
+        note_days = [{"day": day, "notes": notes} for day, notes in self.note_days.items() if notes]
+        if note_days:
+            db.execute(UPSERT_NOTE_DAY, note_days)
+        for bucket, todos in self.completions.items():
+            if todos or self.completion_seconds[bucket]:
+                db.execute(update(DBStatsCompletion).where(DBStatsCompletion.bucket == bucket).values(
+                    todos=DBStatsCompletion.todos + todos,
+                    seconds=DBStatsCompletion.seconds + self.completion_seconds[bucket],
+                ))
+
+
+def previous_value(obj, attribute: str):
+    # The value as of the last flush, even if it has been changed since
+    history = inspect(obj).attrs[attribute].history
+    return history.deleted[0] if history.deleted else getattr(obj, attribute)
+
+
+TODO_STATS_ATTRIBUTES = ("completed", "timestamp", "completion_timestamp")
+
+
+def previous_todo(todo: DBTodo):
+    return [previous_value(todo, attribute) for attribute in TODO_STATS_ATTRIBUTES]
+
+
+@event.listens_for(Session, "before_flush")
+def update_stats(session, flush_context, instances):
+    delta = StatsDelta()
+    for obj in session.new:
+        if isinstance(obj, DBNote):
+            delta.add_note(obj.creation_timestamp, 1)
+        elif isinstance(obj, DBPiece):
+            delta.counters["pieces"] += 1
+        elif isinstance(obj, DBTodo):
+            delta.add_todo(obj.completed, obj.timestamp, obj.completion_timestamp, 1)
+    for obj in session.deleted:
+        if isinstance(obj, DBNote):
+            delta.add_note(previous_value(obj, "creation_timestamp"), -1)
+        elif isinstance(obj, DBPiece):
+            delta.counters["pieces"] -= 1
+        elif isinstance(obj, DBTodo):
+            delta.add_todo(*previous_todo(obj), -1)
+    for obj in session.dirty:
+        if isinstance(obj, DBTodo) and any(
+            inspect(obj).attrs[attribute].history.has_changes() for attribute in TODO_STATS_ATTRIBUTES
+        ):
+            delta.add_todo(*previous_todo(obj), -1)
+            delta.add_todo(obj.completed, obj.timestamp, obj.completion_timestamp, 1)
+    delta.apply(session)
+
+
+def count_deleted_pieces(db: Session, count: int):
+    # For pieces deleted by a bulk query.delete(), which no flush sees
+    delta = StatsDelta()
+    delta.counters["pieces"] -= count
+    delta.apply(db)
+
+# Full-text search. On SQLite the index is a pair of FTS5 external-content
+# tables shadowing pieces.text and todos.text, kept in sync by triggers so
+# every writer (API, import scripts) updates the index. On PostgreSQL it is a
+# GIN index on the texts' tsvectors, which the database maintains itself;
+# app/search.py queries the one the database has.
+SEARCH_INDEX_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS piece_search USING fts5(
+        text, content='pieces', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS pieces_search_insert AFTER INSERT ON pieces BEGIN
+        INSERT INTO piece_search(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS pieces_search_delete AFTER DELETE ON pieces BEGIN
+        INSERT INTO piece_search(piece_search, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS pieces_search_update AFTER UPDATE OF text ON pieces BEGIN
+        INSERT INTO piece_search(piece_search, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO piece_search(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE VIRTUAL TABLE IF NOT EXISTS todo_search USING fts5(
+        text, content='todos', content_rowid='id', tokenize='unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS todos_search_insert AFTER INSERT ON todos BEGIN
+        INSERT INTO todo_search(rowid, text) VALUES (new.id, new.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS todos_search_delete AFTER DELETE ON todos BEGIN
+        INSERT INTO todo_search(todo_search, rowid, text) VALUES ('delete', old.id, old.text);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS todos_search_update AFTER UPDATE OF text ON todos BEGIN
+        INSERT INTO todo_search(todo_search, rowid, text) VALUES ('delete', old.id, old.text);
+        INSERT INTO todo_search(rowid, text) VALUES (new.id, new.text);
+    END""",
+]
+
+
+# 'simple' neither stems nor drops stop words, like the FTS5 tokenizer
+POSTGRES_SEARCH_INDEX_DDL = [
+    "CREATE INDEX IF NOT EXISTS ix_pieces_text_search ON pieces USING gin (to_tsvector('simple', text))",
+    "CREATE INDEX IF NOT EXISTS ix_todos_text_search ON todos USING gin (to_tsvector('simple', text))",
+]
+
+
+def rebuild_search_index(connection):
+    # Re-read every piece and todo into the full-text index
+    if connection.dialect.name == "postgresql":
+        connection.exec_driver_sql("REINDEX INDEX ix_pieces_text_search")
+        connection.exec_driver_sql("REINDEX INDEX ix_todos_text_search")
+        return
+    connection.exec_driver_sql("INSERT INTO piece_search(piece_search) VALUES ('rebuild')")
+    connection.exec_driver_sql("INSERT INTO todo_search(todo_search) VALUES ('rebuild')")
+
+
+@event.listens_for(Base.metadata, "after_create")
+def create_search_index(target, connection, **kw):
+    if connection.dialect.name == "postgresql":
+        for statement in POSTGRES_SEARCH_INDEX_DDL:
+            connection.exec_driver_sql(statement)
+        return
+    if connection.dialect.name != "sqlite":
+        return
+    existing = connection.exec_driver_sql(
+        "SELECT 1 FROM sqlite_master WHERE name = 'piece_search'"
+    ).first()
+    for statement in SEARCH_INDEX_DDL:
+        connection.exec_driver_sql(statement)
+    # Databases created before the index existed need their rows indexed once
+    if existing is None:
+        rebuild_search_index(connection)
+
+
+@event.listens_for(Base.metadata, "before_drop")
+def drop_search_index(target, connection, **kw):
+    if connection.dialect.name != "sqlite":
+        return
+    connection.exec_driver_sql("DROP TABLE IF EXISTS piece_search")
+    connection.exec_driver_sql("DROP TABLE IF EXISTS todo_search")
+
+
+def prepare_database():
+    # Create or upgrade the schema of the original database: run by the app's
+    # lifespan in every worker, and by scripts before they touch the database
+    engine = get_engine()
+    upgrade_schema(engine, Base.metadata)
+    return engine
+
+
+# Write transactions. SQLite starts transactions deferred: a handler that
+# reads before it writes only asks for the write lock at its first write, and
+# if another connection has committed since the read, SQLite fails it with
+# "database is locked" at once, whatever busy_timeout says. Write handlers
+# take the lock up front with BEGIN IMMEDIATE instead, which does wait up to
+# busy_timeout, and retry with backoff when even that is not enough. With
+# several worker processes on one database file this is what keeps writes
+# serialized without errors.
+
+
+def is_database_locked(error: Exception) -> bool:
+    return isinstance(error, OperationalError) and "database is locked" in str(error.orig)
+
+
+def write_retry_delays(retries: int = WRITE_RETRIES, backoff_ms: int = WRITE_RETRY_BACKOFF_MS):
+    # Exponential with jitter, so writers that gave up together do not retry together
+    return [backoff_ms * 2 ** attempt * random.uniform(0.5, 1.5) / 1000 for attempt in range(retries)]
+
+
+def begin_write(db: Session):
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    for delay in write_retry_delays() + [None]:
+        try:
+            db.connection().exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as error:
+            if delay is None or not is_database_locked(error):
+                raise
+            time.sleep(delay)
+
+
+def begin_snapshot(db: Session):
+    # For reads that must agree with each other (an export, a sync payload).
+    # pysqlite only opens a transaction before a write, so each SELECT would
+    # see whatever was committed in between: BEGIN pins one snapshot (with WAL,
+    # without blocking writers). PostgreSQL's READ COMMITTED takes a snapshot
+    # per statement; REPEATABLE READ keeps the first one.
+    dialect = db.get_bind().dialect.name
+    if dialect == "sqlite":
+        db.connection().exec_driver_sql("BEGIN")
+    elif dialect == "postgresql":
+        db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+
+
+# The async engine is only built when the async request path is in use,
+# so aiosqlite is not needed otherwise
+AsyncSessionLocal = None
+
+
+def get_async_sessionmaker():
+    global AsyncSessionLocal
+    if AsyncSessionLocal is None:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 
-# Create tables in the original database
-Base.metadata.create_all(bind=engine)
+        options = engine_options(ASYNC_SQLALCHEMY_DATABASE_URL)
+        # aiosqlite connections live on their own thread already
+        options.pop("connect_args", None)
+        async_engine = create_async_engine(ASYNC_SQLALCHEMY_DATABASE_URL, **options)
+        configure_engine(async_engine.sync_engine)
+        AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False)
+    return AsyncSessionLocal
 
-# Dependency for the original database
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
 
+async def dispose_engines():
+    # Close pooled connections at shutdown; the next use builds new engines
+    global _engine, _session_local, AsyncSessionLocal
+    if AsyncSessionLocal is not None:
+        await AsyncSessionLocal.kw["bind"].dispose()
+        AsyncSessionLocal = None
+    if _engine is not None:
+        _engine.dispose()
+        _engine = _session_local = None
 
 
+async def begin_async_write(db):
+    # begin_write for an AsyncSession
+    if db.get_bind().dialect.name != "sqlite":
+        return
+    for delay in write_retry_delays() + [None]:
+        try:
+            connection = await db.connection()
+            await connection.exec_driver_sql("BEGIN IMMEDIATE")
+            return
+        except OperationalError as error:
+            if delay is None or not is_database_locked(error):
+                raise
+            await asyncio.sleep(delay)
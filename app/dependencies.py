@@ -0,0 +1,34 @@
+from fastapi import Depends
+from sqlalchemy.orm import Session
+
+from .database import begin_async_write, begin_write, get_async_sessionmaker, get_sessionmaker
+
+# The sessions request handlers get. They live apart from the models so that
+# importing app.database (scripts, the schema upgrade) does not import FastAPI.
+
+
+# Dependency for the original database
+def get_db():
+    db = get_sessionmaker()()
+    try:
+        yield db
+    finally:
+        db.close()
+
+
+# Dependency for handlers that write; the transaction holds the write lock
+# until the handler commits
+def get_write_db(db: Session = Depends(get_db)):
+    begin_write(db)
+    return db
+
+
+# Dependency for the async request path
+async def get_async_db():
+    async with get_async_sessionmaker()() as db:
+        yield db
+
+
+async def get_async_write_db(db=Depends(get_async_db)):
+    await begin_async_write(db)
+    return db
@@ -0,0 +1,115 @@
+from datetime import datetime
+from typing import Literal, Optional
+
+from fastapi import APIRouter, Depends, Query
+from fastapi.responses import StreamingResponse
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import DBNote, DBPiece, DBSyncState, DBTodo, DBTombstone, begin_snapshot
+from .dependencies import get_db
+from .responses import encode_json
+
+# Streaming backup of the whole notebook, one JSON record per line.
+#
+# Rows are read with yield_per, so only one batch of them is held in memory at
+# a time however big the database is, and each batch is written to the client
+# as soon as it is encoded. The export reads through a session of its own, in
+# one read transaction (begin_snapshot), which gives it a consistent snapshot
+# even while writes go on.
+#
+# Incremental exports are keyed on sync versions (see stamp_sync_versions in
+# app/database.py), not on timestamps: a writer stamps its rows with the time
+# it started, but may commit after an export that began later, while versions
+# become visible in increasing order. The version the snapshot was read at
+# therefore covers exactly the rows the export saw. An incremental export
+# starts with a "delete" record per tombstone since the token, so a base
+# export and its incrementals, applied in order, give back the notebook as
+# it was, deletions included. Deleting a note deletes its pieces.
+
+EXPORT_FORMAT_VERSION = 2
+EXPORT_BATCH_SIZE = 1000
+
+export_router = APIRouter()
+
+
+def export_records(bind, since: Optional[int] = None, batch_size: int = EXPORT_BATCH_SIZE):
+    # The generator owns its session: the request's session is closed before
+    # the body is streamed
+    db = Session(bind)
+    try:
+        begin_snapshot(db)
+        yield from snapshot_records(db, since, batch_size)
+    finally:
+        db.close()
+
+
+def snapshot_records(db: Session, since: Optional[int], batch_size: int):
+    # The header carries the sync version the export was read at: passing its
+    # `token` back as `since` makes the next export pick up everything changed
+    # afterwards
+    token, horizon = db.query(DBSyncState.version, DBSyncState.pruned_version).first() or (0, 0)
+    # A token from the future belongs to another database, and one below the
+    # horizon may miss deletions whose tombstones are pruned: export everything
+    if since is not None and not horizon <= since <= token:
+        since = None
+    yield encode_json({
+        "type": "export",
+        "format_version": EXPORT_FORMAT_VERSION,
+        "exported_at": datetime.now(),
+        "token": token,
+        "since": since,
+    }) + b"\n"
+
+    notes = select(DBNote.id, DBNote.creation_timestamp, DBNote.last_update_timestamp).order_by(DBNote.id)
+    pieces = (
+        select(DBPiece.id, DBPiece.note_id, DBPiece.position, DBPiece.text, DBPiece.timestamp)
+        .order_by(DBPiece.note_id, DBPiece.position, DBPiece.id)
+    )
+    todos = (
+        select(DBTodo.id, DBTodo.text, DBTodo.completed, DBTodo.timestamp,
+               DBTodo.completion_timestamp, DBTodo.last_update_timestamp)
+        .order_by(DBTodo.id)
+    )
+    if since is not None:
+        notes = notes.where(DBNote.version > since)
+        # A changed note is exported with all its pieces, so restoring it
+        # replaces the whole note
+        pieces = pieces.join(DBNote, DBNote.id == DBPiece.note_id).where(DBNote.version > since)
+        todos = todos.where(DBTodo.version > since)
+
+    if since is not None:
+        # Before the rows; ids are never reused, so no row follows a delete
+        # of its own id
+        tombstones = db.execute(
+            select(DBTombstone.entity, DBTombstone.entity_id.label("id"))
+            .where(DBTombstone.version > since)
+            .order_by(DBTombstone.version, DBTombstone.id)
+            .execution_options(yield_per=batch_size)
+        )
+        for rows in tombstones.partitions():
+            yield b"".join(
+                encode_json({"type": "delete", **row._asdict()}) + b"\n" for row in rows
+            )
+
+    for record_type, query in (("note", notes), ("piece", pieces), ("todo", todos)):
+        result = db.execute(query.execution_options(yield_per=batch_size))
+        for rows in result.partitions():
+            yield b"".join(
+                encode_json({"type": record_type, **row._asdict()}) + b"\n" for row in rows
+            )
+
+
+@export_router.get('/export')
+def export(
+    format: Literal["ndjson"] = "ndjson",
+    # The token of an earlier export
+    since: Optional[int] = Query(None, ge=0),
+    db: Session = Depends(get_db)
+):
+    # Only the request session's engine is used, see export_records
+    return StreamingResponse(
+        export_records(db.get_bind(), since),
+        media_type="application/x-ndjson",
+        headers={"Content-Disposition": 'attachment; filename="notes-export.ndjson"'},
+    )
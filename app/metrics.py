@@ -0,0 +1,229 @@
+import contextvars
+import logging
+import threading
+import time
+from bisect import bisect_left
+
+from fastapi import APIRouter, Response
+from sqlalchemy import event
+
+from .config import METRICS_ENABLED, SLOW_REQUEST_MS
+
+logger = logging.getLogger(__name__)
+
+# Per-route request metrics in the Prometheus text format.
+#
+# MetricsMiddleware puts a RequestStats in a context variable for the
+# duration of each request; the engine hooks (install_metrics) and
+# encode_json add to whatever stats are current, and the middleware folds
+# them into the per-route totals once the response is sent. The threadpool
+# copies the context, so sync handlers and their queries are counted too.
+# Outside of a request the hooks do nothing but a context variable lookup.
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestStats:
+    __slots__ = ("statements", "sql_seconds", "rows", "serialization_seconds", "queries")
+
+    def __init__(self, capture_sql: bool = False):
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+        # (statement, seconds) pairs, only kept for the slow request log
+        self.queries = [] if capture_sql else None
+
+
+current_request = contextvars.ContextVar("current_request", default=None)
+
+
+class RouteMetrics:
+    __slots__ = ("bucket_counts", "count", "seconds", "statements", "sql_seconds", "rows", "serialization_seconds")
+
+    def __init__(self):
+        self.bucket_counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.seconds = 0.0
+        self.statements = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.serialization_seconds = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self._routes = {}
+        self._responses = {}
+        # encoding -> [responses, bytes in, bytes out]
+        self._compression = {}
+        self._lock = threading.Lock()
+
+    def record(self, method: str, route: str, status_code: int, seconds: float, stats: RequestStats):
+        with self._lock:
+            metrics = self._routes.get((method, route))
+            if metrics is None:
+                metrics = self._routes[(method, route)] = RouteMetrics()
+            metrics.bucket_counts[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            metrics.count += 1
+            metrics.seconds += seconds
+            metrics.statements += stats.statements
+            metrics.sql_seconds += stats.sql_seconds
+            metrics.rows += stats.rows
+            metrics.serialization_seconds += stats.serialization_seconds
+            key = (method, route, status_code)
+            self._responses[key] = self._responses.get(key, 0) + 1
+
+    def record_compression(self, encoding: str, bytes_in: int, bytes_out: int):
+        with self._lock:
+            totals = self._compression.setdefault(encoding, [0, 0, 0])
+            totals[0] += 1
+            totals[1] += bytes_in
+            totals[2] += bytes_out
+
+    def clear(self):
+        with self._lock:
+            self._routes.clear()
+            self._responses.clear()
+            self._compression.clear()
+
+    def render(self) -> str:
+        with self._lock:
+            routes = sorted(self._routes.items())
+            responses = sorted(self._responses.items())
+            compression = sorted((encoding, list(totals)) for encoding, totals in self._compression.items())
+
+        lines = [
+            "# HELP notes_http_request_duration_seconds Time to send the whole response.",
+            "# TYPE notes_http_request_duration_seconds histogram",
+        ]
+        for (method, route), metrics in routes:
+            labels = f'method="{method}",route="{route}"'
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, metrics.bucket_counts):
+                cumulative += count
+                lines.append(f'notes_http_request_duration_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f'notes_http_request_duration_seconds_bucket{{{labels},le="+Inf"}} {metrics.count}')
+            lines.append(f"notes_http_request_duration_seconds_sum{{{labels}}} {metrics.seconds}")
+            lines.append(f"notes_http_request_duration_seconds_count{{{labels}}} {metrics.count}")
+
+        lines += [
+            "# HELP notes_http_requests_total Responses sent, by status code.",
+            "# TYPE notes_http_requests_total counter",
+        ]
+        for (method, route, status_code), count in responses:
+            lines.append(f'notes_http_requests_total{{method="{method}",route="{route}",status="{status_code}"}} {count}')
+
+        for name, attribute, description in (
+            ("notes_sql_statements_total", "statements", "SQL statements executed."),
+            ("notes_sql_duration_seconds_total", "sql_seconds", "Time spent executing SQL statements."),
+            ("notes_rows_returned_total", "rows", "Records serialized into responses."),
+            ("notes_serialization_seconds_total", "serialization_seconds", "Time spent encoding JSON."),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for (method, route), metrics in routes:
+                lines.append(f'{name}{{method="{method}",route="{route}"}} {getattr(metrics, attribute)}')
+
+        for name, index, description in (
+            ("notes_compressed_responses_total", 0, "Responses sent compressed."),
+            ("notes_compression_input_bytes_total", 1, "Response bytes before compression."),
+            ("notes_compression_output_bytes_total", 2, "Response bytes after compression."),
+        ):
+            lines += [f"# HELP {name} {description}", f"# TYPE {name} counter"]
+            for encoding, totals in compression:
+                lines.append(f'{name}{{encoding="{encoding}"}} {totals[index]}')
+        lines += [
+            "# HELP notes_compression_saved_bytes_total Bytes saved by compressing responses.",
+            "# TYPE notes_compression_saved_bytes_total counter",
+        ]
+        for encoding, totals in compression:
+            lines.append(f'notes_compression_saved_bytes_total{{encoding="{encoding}"}} {totals[1] - totals[2]}')
+
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry(enabled=METRICS_ENABLED)
+
+
+class MetricsMiddleware:
+    # Plain ASGI middleware: BaseHTTPMiddleware would cost an extra task and
+    # stream wrapper per request
+    def __init__(self, app, registry: MetricsRegistry = registry, slow_request_ms: int = SLOW_REQUEST_MS):
+        self.app = app
+        self.registry = registry
+        self.slow_request_ms = slow_request_ms
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.registry.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestStats(capture_sql=self.slow_request_ms > 0)
+        token = current_request.set(stats)
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            seconds = time.perf_counter() - started
+            current_request.reset(token)
+            # The route template keeps the label set bounded; the router puts
+            # the matched route in the scope
+            route = getattr(scope.get("route"), "path", None) or "unmatched"
+            self.registry.record(scope["method"], route, status_code, seconds, stats)
+            if self.slow_request_ms and seconds * 1000 >= self.slow_request_ms:
+                log_slow_request(scope, route, seconds, stats)
+
+
+def log_slow_request(scope, route: str, seconds: float, stats: RequestStats):
+    queries = "\n".join(f"  {query_seconds * 1000:8.2f} ms  {statement}" for statement, query_seconds in stats.queries)
+    logger.warning(
+        "Slow request %s %s (%s) took %.1f ms, %d SQL statements in %.1f ms:\n%s",
+        scope["method"], scope["path"], route, seconds * 1000,
+        stats.statements, stats.sql_seconds * 1000, queries
+    )
+
+
+def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if current_request.get() is not None:
+        conn.info["metrics_query_start"] = time.perf_counter()
+
+
+def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = current_request.get()
+    started = conn.info.pop("metrics_query_start", None)
+    if stats is None or started is None:
+        return
+    seconds = time.perf_counter() - started
+    stats.statements += 1
+    stats.sql_seconds += seconds
+    if stats.queries is not None:
+        stats.queries.append((" ".join(statement.split()), seconds))
+
+
+def install_metrics(engine):
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", after_cursor_execute)
+
+
+def record_serialization(seconds: float, records: int):
+    stats = current_request.get()
+    if stats is not None:
+        stats.serialization_seconds += seconds
+        stats.rows += records
+
+
+metrics_router = APIRouter()
+
+
+@metrics_router.get('/metrics')
+def get_metrics():
+    return Response(content=registry.render(), media_type="text/plain; version=0.0.4")
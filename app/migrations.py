@@ -0,0 +1,192 @@
+import logging
+
+from datetime import datetime
+
+from sqlalchemy import bindparam, inspect, text, DateTime, MetaData
+from sqlalchemy.schema import CreateTable
+
+logger = logging.getLogger(__name__)
+
+# Schema migrations for databases created by older versions of the app.
+#
+# upgrade_schema first runs metadata.create_all, which creates any missing
+# table with its current definition (indexes included). The migrations then
+# bring tables that already existed up to date, so each of them has to be
+# safe to run against a table that create_all just made.
+
+
+def create_index(connection, name, table, columns):
+    connection.exec_driver_sql(f"CREATE INDEX IF NOT EXISTS {name} ON {table} ({columns})")
+
+
+def add_column(connection, table, name, definition):
+    # create_all may just have made the table with the column already in it
+    if name not in {column["name"] for column in inspect(connection).get_columns(table)}:
+        connection.exec_driver_sql(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+
+
+def add_query_indexes(connection):
+    create_index(connection, "ix_pieces_note_id_id", "pieces", "note_id, id")
+    create_index(connection, "ix_notes_last_update_timestamp_id", "notes", "last_update_timestamp, id")
+    create_index(connection, "ix_todos_completed_timestamp", "todos", "completed, timestamp")
+
+
+def add_piece_positions(connection):
+    add_column(connection, "pieces", "position", "INTEGER")
+    # Keep the implicit insertion order, spaced like app.pieces.POSITION_STEP
+    connection.exec_driver_sql("""
+        UPDATE pieces SET position = numbered.row_index * 1024
+        FROM (
+            SELECT id, row_number() OVER (PARTITION BY note_id ORDER BY id) - 1 AS row_index
+            FROM pieces
+        ) AS numbered
+        WHERE pieces.id = numbered.id AND pieces.position IS NULL
+    """)
+    create_index(connection, "ix_pieces_note_id_position", "pieces", "note_id, position")
+    connection.exec_driver_sql("DROP INDEX IF EXISTS ix_pieces_note_id_id")
+
+
+def add_todo_update_timestamps(connection):
+    add_column(connection, "todos", "last_update_timestamp", "DATETIME")
+    connection.exec_driver_sql(
+        "UPDATE todos SET last_update_timestamp = COALESCE(completion_timestamp, timestamp) "
+        "WHERE last_update_timestamp IS NULL"
+    )
+    create_index(connection, "ix_todos_last_update_timestamp", "todos", "last_update_timestamp")
+
+
+def add_sync_versions(connection):
+    # Existing rows stay at version 0, which only a full sync returns
+    for table in ("notes", "pieces", "todos"):
+        add_column(connection, table, "version", "INTEGER NOT NULL DEFAULT 0")
+        create_index(connection, f"ix_{table}_version", table, "version")
+
+
+def add_todo_filter_indexes(connection):
+    # GET /todos/ filters: completed_since and sorting by completion, and
+    # unfiltered lists in creation order
+    create_index(connection, "ix_todos_completed_completion_timestamp", "todos", "completed, completion_timestamp")
+    create_index(connection, "ix_todos_timestamp_id", "todos", "timestamp, id")
+
+
+def add_stats(connection):
+    # create_all has just made the summary tables, empty: count what is there
+    from .stats import rebuild_stats
+
+    rebuild_stats(connection)
+
+
+def add_tombstone_timestamps(connection):
+    # Tombstones from before retention existed count as deleted now, so they
+    # are kept for a full retention period
+    add_column(connection, "tombstones", "timestamp", "TIMESTAMP")
+    connection.execute(
+        text("UPDATE tombstones SET timestamp = :now WHERE timestamp IS NULL").bindparams(
+            bindparam("now", type_=DateTime)
+        ),
+        {"now": datetime.now()},
+    )
+    create_index(connection, "ix_tombstones_timestamp", "tombstones", "timestamp")
+    add_column(connection, "sync_state", "pruned_version", "INTEGER NOT NULL DEFAULT 0")
+
+
+def add_autoincrement(connection):
+    # Without AUTOINCREMENT SQLite hands the id of a deleted row that had the
+    # highest id to the next insert, and GET /sync and incremental exports
+    # would tell the old row's tombstone from the new row by id. PostgreSQL
+    # sequences never reuse ids.
+    if connection.dialect.name != "sqlite":
+        return
+    from .database import Base, create_search_index
+
+    for table, entity in (("notes", "note"), ("pieces", "piece"), ("todos", "todo")):
+        definition = connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)
+        ).scalar()
+        if "AUTOINCREMENT" in definition:
+            continue
+        # AUTOINCREMENT is part of the table's definition: copy the rows into
+        # the current one (the metadata also holds notes for the foreign key)
+        metadata = MetaData()
+        Base.metadata.tables["notes"].to_metadata(metadata)
+        rebuilt = Base.metadata.tables[table].to_metadata(metadata, name=f"{table}_new")
+        columns = ", ".join(column.name for column in rebuilt.columns)
+        connection.execute(CreateTable(rebuilt))
+        connection.exec_driver_sql(f"INSERT INTO {table}_new ({columns}) SELECT {columns} FROM {table}")
+        connection.exec_driver_sql(f"DROP TABLE {table}")
+        connection.exec_driver_sql(f"ALTER TABLE {table}_new RENAME TO {table}")
+        for index in Base.metadata.tables[table].indexes:
+            index.create(connection, checkfirst=True)
+        # Ids that were freed before the upgrade are not handed out either
+        connection.exec_driver_sql("DELETE FROM sqlite_sequence WHERE name = ?", (table,))
+        connection.exec_driver_sql(f"""
+            INSERT INTO sqlite_sequence (name, seq) SELECT ?, max(
+                (SELECT coalesce(max(id), 0) FROM {table}),
+                (SELECT coalesce(max(entity_id), 0) FROM tombstones WHERE entity = ?),
+                (SELECT coalesce(max(entity_id), 0) FROM changes WHERE entity = ?)
+            )
+        """, (table, entity, entity))
+    # Dropping the old tables dropped the search index triggers with them
+    create_search_index(Base.metadata, connection)
+
+
+# (version, migration) pairs, in order
+MIGRATIONS = [
+    (1, add_query_indexes),
+    (2, add_piece_positions),
+    (3, add_todo_update_timestamps),
+    (4, add_sync_versions),
+    (5, add_todo_filter_indexes),
+    (6, add_stats),
+    (7, add_tombstone_timestamps),
+    (8, add_autoincrement),
+]
+HEAD = MIGRATIONS[-1][0]
+
+
+def get_version(connection):
+    connection.exec_driver_sql("CREATE TABLE IF NOT EXISTS schema_version (version INTEGER NOT NULL)")
+    return connection.exec_driver_sql("SELECT max(version) FROM schema_version").scalar()
+
+
+def set_version(connection, version):
+    connection.exec_driver_sql("DELETE FROM schema_version")
+    connection.execute(text("INSERT INTO schema_version (version) VALUES (:version)"), {"version": version})
+
+
+# Key of the PostgreSQL advisory lock held while upgrading
+MIGRATION_LOCK_ID = 0x6E6F746573
+
+
+def upgrade_schema(engine, metadata):
+    with engine.begin() as connection:
+        # Worker processes start together: the first one here takes the
+        # lock and upgrades, the others wait and find it done
+        if connection.dialect.name == "sqlite":
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        elif connection.dialect.name == "postgresql":
+            connection.exec_driver_sql(f"SELECT pg_advisory_xact_lock({MIGRATION_LOCK_ID})")
+        version = get_version(connection)
+        fresh = version is None and not inspect(connection).has_table("notes")
+
+        metadata.create_all(connection)
+
+        if fresh:
+            # A new database already has the current schema
+            set_version(connection, HEAD)
+            return
+
+        # Databases from before migrations existed count as version 0
+        version = version or 0
+        for number, migration in MIGRATIONS:
+            if number > version:
+                logger.info("Migrating database schema to version %s (%s)", number, migration.__name__)
+                migration(connection)
+                set_version(connection, number)
+
+
+if __name__ == "__main__":
+    from .database import prepare_database
+
+    with prepare_database().connect() as connection:
+        print(f"Database schema at version {get_version(connection)} (head {HEAD})")
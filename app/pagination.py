@@ -0,0 +1,28 @@
+import base64
+from datetime import datetime
+
+# Upper bound for the `limit` query parameter of paginated listings
+MAX_PAGE_SIZE = 1000
+
+
+def encode_cursor(timestamp: datetime, row_id: int) -> str:
+    raw = f"{timestamp.isoformat()}|{row_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode()
+
+
+def decode_cursor(cursor: str):
+    # binascii.Error and UnicodeDecodeError are both ValueErrors
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    timestamp, row_id = raw.rsplit("|", 1)
+    return datetime.fromisoformat(timestamp), int(row_id)
+
+
+# Pieces of a note page on their (position, id) order instead
+def encode_position_cursor(position: int, row_id: int) -> str:
+    return base64.urlsafe_b64encode(f"{position}|{row_id}".encode()).decode()
+
+
+def decode_position_cursor(cursor: str):
+    raw = base64.urlsafe_b64decode(cursor.encode()).decode()
+    position, row_id = raw.split("|")
+    return int(position), int(row_id)
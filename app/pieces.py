@@ -0,0 +1,153 @@
+from datetime import datetime
+from difflib import SequenceMatcher
+
+from fastapi import HTTPException, status
+from sqlalchemy import tuple_
+from sqlalchemy.orm import Session
+
+from .concurrency import offload
+from .database import DBPiece
+
+# Pieces are ordered by a sparse position so that inserting or moving one only
+# writes that piece; the note is renumbered only when two neighbours run out of gap
+POSITION_STEP = 1024
+
+
+def renumber(pieces):
+    for i, piece in enumerate(pieces):
+        piece.position = i * POSITION_STEP
+
+
+def ordered_pieces(db: Session, note_id: int):
+    return db.query(DBPiece).filter(DBPiece.note_id == note_id).order_by(
+        DBPiece.position, DBPiece.id
+    ).all()
+
+
+def position_after(db: Session, note_id: int, after_id):
+    # Position for a piece placed right after `after_id`, or first when it is None.
+    # Returns None when there is no room left between the two neighbours.
+    query = db.query(DBPiece).filter(DBPiece.note_id == note_id)
+    if after_id is None:
+        previous = None
+    else:
+        previous = db.get(DBPiece, after_id)
+        if previous is None or previous.note_id != note_id:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Piece not found"
+            )
+        query = query.filter(
+            tuple_(DBPiece.position, DBPiece.id) > tuple_(previous.position, previous.id)
+        )
+    following = query.order_by(DBPiece.position, DBPiece.id).first()
+
+    if previous is None and following is None:
+        return 0
+    if previous is None:
+        return following.position - POSITION_STEP
+    if following is None:
+        return previous.position + POSITION_STEP
+    if following.position - previous.position > 1:
+        return (previous.position + following.position) // 2
+    return None
+
+
+def place_after(db: Session, note_id: int, piece: DBPiece, after_id):
+    position = position_after(db, note_id, after_id)
+    if position is None:
+        db.flush()
+        renumber(ordered_pieces(db, note_id))
+        position = position_after(db, note_id, after_id)
+    piece.position = position
+
+
+def text_opcodes(old_texts, texts):
+    return SequenceMatcher(None, old_texts, texts, autojunk=False).get_opcodes()
+
+
+def diff_update_pieces(db: Session, note_id: int, texts, now: datetime, existing=None):
+    # Rewrite the note so its pieces read `texts`, touching only the pieces that
+    # differ and stamping them with the caller's `now` (`existing`: its pieces
+    # in order, when already loaded). Returns whether anything changed.
+    if existing is None:
+        existing = ordered_pieces(db, note_id)
+    old_texts = [piece.text for piece in existing]
+
+    # Autosave edits are usually local: skip the common prefix and suffix
+    # before running the (quadratic in the worst case) sequence matcher
+    start = 0
+    while start < min(len(old_texts), len(texts)) and old_texts[start] == texts[start]:
+        start += 1
+    end_old, end_new = len(old_texts), len(texts)
+    while end_old > start and end_new > start and old_texts[end_old - 1] == texts[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+    if start == end_old and start == end_new:
+        return False
+
+    # The new order of pieces, with None for the pieces still to be inserted
+    middle = []
+    for tag, i1, i2, j1, j2 in offload(text_opcodes, old_texts[start:end_old], texts[start:end_new]):
+        old = existing[start + i1:start + i2]
+        new = texts[start + j1:start + j2]
+        if tag == "equal":
+            middle.extend(zip(old, new))
+            continue
+        # Replaced pieces are updated in place, the rest inserted or deleted
+        for piece, text in zip(old, new):
+            piece.text = text
+            piece.timestamp = now
+            middle.append((piece, text))
+        for text in new[len(old):]:
+            middle.append((None, text))
+        for piece in old[len(new):]:
+            db.delete(piece)
+
+    final = [(piece, piece.text) for piece in existing[:start]] + middle + \
+        [(piece, piece.text) for piece in existing[end_old:]]
+
+    # Give new pieces positions between their kept neighbours
+    created = []
+    for index, (piece, text) in enumerate(final):
+        if piece is None:
+            piece = DBPiece(text=text, timestamp=now, note_id=note_id)
+            db.add(piece)
+            created.append(index)
+            final[index] = (piece, text)
+    pieces = [piece for piece, _ in final]
+    if not assign_gap_positions(pieces, set(created)):
+        renumber(pieces)
+    return True
+
+
+def assign_gap_positions(pieces, new_indexes):
+    # Spread each run of new pieces evenly in the gap left by their neighbours
+    index = 0
+    while index < len(pieces):
+        if index not in new_indexes:
+            index += 1
+            continue
+        run_end = index
+        while run_end < len(pieces) and run_end in new_indexes:
+            run_end += 1
+        count = run_end - index
+        low = pieces[index - 1].position if index > 0 else None
+        high = pieces[run_end].position if run_end < len(pieces) else None
+
+        if low is None and high is None:
+            positions = [i * POSITION_STEP for i in range(count)]
+        elif low is None:
+            positions = [high - (count - i) * POSITION_STEP for i in range(count)]
+        elif high is None:
+            positions = [low + (i + 1) * POSITION_STEP for i in range(count)]
+        else:
+            gap = (high - low) // (count + 1)
+            if gap < 1:
+                return False
+            positions = [low + (i + 1) * gap for i in range(count)]
+
+        for piece, position in zip(pieces[index:run_end], positions):
+            piece.position = position
+        index = run_end
+    return True
@@ -0,0 +1,243 @@
+import json
+import zlib
+from datetime import datetime, timedelta
+from difflib import SequenceMatcher
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from .concurrency import offload
+from .config import (
+    REVISION_COMPACT_AFTER_HOURS, REVISION_COMPACT_EVERY, REVISION_KEEP, REVISION_MAX_AGE_DAYS,
+    REVISION_SNAPSHOT_EVERY, REVISIONS_ENABLED,
+)
+from .database import DBNote, DBNoteRevision
+from .dependencies import get_db
+from .pagination import MAX_PAGE_SIZE
+
+# Revision history of notes. Every write that changes a note's pieces adds a
+# revision holding its piece texts, stored as a delta from the previous one:
+# a list whose items are either [start, end], copying those texts of the
+# previous revision, or a string, a text of its own. Every
+# REVISION_SNAPSHOT_EVERY revisions (and whenever a delta would reuse
+# nothing) the full list is stored instead, so reading a revision decodes
+# one snapshot and at most that many deltas. Data is zlib-compressed JSON.
+#
+# A revision's CRC-32 tells whether the pieces a write started from are the
+# previous revision: notes written by something that records no revisions
+# (the import script, notes older than the history) start a new snapshot.
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+revisions_router = APIRouter()
+
+
+def dump_json(value) -> bytes:
+    # Both paths produce the same bytes, so checksums do not depend on
+    # whether orjson is installed
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def load_json(data: bytes):
+    return orjson.loads(data) if orjson is not None else json.loads(data)
+
+
+def texts_checksum(texts: List[str]) -> int:
+    return zlib.crc32(dump_json(texts))
+
+
+def delta_ops(old: List[str], new: List[str]):
+    # Most autosaves change a piece or two: skip the common prefix and suffix
+    # before running the sequence matcher, as diff_update_pieces does
+    start = 0
+    while start < min(len(old), len(new)) and old[start] == new[start]:
+        start += 1
+    end_old, end_new = len(old), len(new)
+    while end_old > start and end_new > start and old[end_old - 1] == new[end_new - 1]:
+        end_old -= 1
+        end_new -= 1
+
+    ops = [[0, start]] if start else []
+    matcher = SequenceMatcher(None, old[start:end_old], new[start:end_new], autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == "equal":
+            ops.append([start + i1, start + i2])
+        else:
+            ops.extend(new[start + j1:start + j2])
+    if end_old < len(old):
+        ops.append([end_old, len(old)])
+    return ops
+
+
+def apply_delta(old: List[str], ops) -> List[str]:
+    texts = []
+    for op in ops:
+        if isinstance(op, str):
+            texts.append(op)
+        else:
+            texts.extend(old[op[0]:op[1]])
+    return texts
+
+
+def encode_revision(previous: Optional[List[str]], previous_depth: int, texts: List[str]):
+    # (data, depth) of a revision following `previous`, or a snapshot
+    if previous is not None and previous_depth + 1 < REVISION_SNAPSHOT_EVERY:
+        ops = delta_ops(previous, texts)
+        if any(not isinstance(op, str) for op in ops):
+            return zlib.compress(dump_json(ops)), previous_depth + 1
+    return zlib.compress(dump_json(texts)), 0
+
+
+def decode_revision(previous: Optional[List[str]], depth: int, data: bytes) -> List[str]:
+    decoded = load_json(zlib.decompress(data))
+    return decoded if depth == 0 else apply_delta(previous, decoded)
+
+
+def record_revision(db: Session, note_id: int, old_texts: Optional[List[str]], texts: List[str], now: datetime):
+    # Adds the revision for a write that turned the note's pieces from
+    # `old_texts` (None for a new note) into `texts`
+    if not REVISIONS_ENABLED:
+        return
+    latest = db.query(DBNoteRevision.rev, DBNoteRevision.depth, DBNoteRevision.checksum).filter(
+        DBNoteRevision.note_id == note_id
+    ).order_by(DBNoteRevision.rev.desc()).first()
+
+    previous = None
+    if latest is not None and old_texts is not None and texts_checksum(old_texts) == latest.checksum:
+        previous = old_texts
+    data, depth = offload(encode_revision, previous, latest.depth if latest is not None else 0, texts)
+    rev = latest.rev + 1 if latest is not None else 1
+    db.add(DBNoteRevision(
+        note_id=note_id, rev=rev, timestamp=now, depth=depth, piece_count=len(texts),
+        checksum=texts_checksum(texts), data=data,
+    ))
+    # The next revision of the note in this transaction reads this one
+    db.flush()
+
+    if REVISION_COMPACT_EVERY and rev % REVISION_COMPACT_EVERY == 0:
+        compact_revisions(db, note_id, now)
+
+
+def delete_revisions(db: Session, note_ids: List[int]):
+    db.query(DBNoteRevision).filter(DBNoteRevision.note_id.in_(note_ids)).delete(synchronize_session=False)
+
+
+def kept_revisions(rows, now: datetime,
+                   keep: int = REVISION_KEEP,
+                   max_age: timedelta = timedelta(days=REVISION_MAX_AGE_DAYS),
+                   compact_after: timedelta = timedelta(hours=REVISION_COMPACT_AFTER_HOURS)):
+    # The revs that survive retention and compaction among `rows` (oldest
+    # first): the latest always, then newest first until `keep` are taken or
+    # they get older than `max_age`, keeping only the last one of each hour
+    # once they are older than `compact_after`
+    kept = {rows[-1].rev}
+    last_hour = None
+    for row in reversed(rows[:-1]):
+        if keep and len(kept) >= keep:
+            break
+        age = now - row.timestamp
+        if max_age and age > max_age:
+            break
+        if age > compact_after:
+            hour = row.timestamp.replace(minute=0, second=0, microsecond=0)
+            if hour == last_hour:
+                continue
+            last_hour = hour
+        kept.add(row.rev)
+    return kept
+
+
+def compact_revisions(db: Session, note_id: int, now: datetime) -> int:
+    # Drops the revisions the policy does not keep and re-encodes the ones
+    # after them against their new predecessors; returns how many were dropped
+    rows = db.query(DBNoteRevision).filter(DBNoteRevision.note_id == note_id).order_by(DBNoteRevision.rev).all()
+    if not rows:
+        return 0
+    kept = kept_revisions(rows, now)
+    if len(kept) == len(rows):
+        return 0
+
+    texts = None
+    previous, previous_depth = None, 0
+    rewriting = False
+    for row in rows:
+        texts = decode_revision(texts, row.depth, row.data)
+        if row.rev not in kept:
+            db.delete(row)
+            rewriting = True
+            continue
+        if rewriting:
+            row.data, row.depth = encode_revision(previous, previous_depth, texts)
+        previous, previous_depth = texts, row.depth
+    db.flush()
+    return len(rows) - len(kept)
+
+
+def load_revision(db: Session, note_id: int, rev: int):
+    # (row, texts) of a revision, or None; reads its snapshot and the deltas since
+    snapshot_rev = db.query(func.max(DBNoteRevision.rev)).filter(
+        DBNoteRevision.note_id == note_id, DBNoteRevision.rev <= rev, DBNoteRevision.depth == 0
+    ).scalar()
+    if snapshot_rev is None:
+        return None
+    rows = db.query(DBNoteRevision).filter(
+        DBNoteRevision.note_id == note_id, DBNoteRevision.rev.between(snapshot_rev, rev)
+    ).order_by(DBNoteRevision.rev).all()
+    if rows[-1].rev != rev:
+        return None
+
+    texts = None
+    for row in rows:
+        texts = decode_revision(texts, row.depth, row.data)
+    return rows[-1], texts
+
+
+def ensure_note(db: Session, note_id: int):
+    if not db.query(DBNote.id).filter(DBNote.id == note_id).first():
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found"
+        )
+
+
+@revisions_router.get('/notes/{note_id}/revisions')
+def list_revisions(
+    note_id: int,
+    limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE),
+    # Revisions older than this one, to page through the history
+    before: Optional[int] = None,
+    db: Session = Depends(get_db),
+):
+    ensure_note(db, note_id)
+    query = db.query(DBNoteRevision.rev, DBNoteRevision.timestamp, DBNoteRevision.piece_count).filter(
+        DBNoteRevision.note_id == note_id
+    )
+    if before is not None:
+        query = query.filter(DBNoteRevision.rev < before)
+    rows = query.order_by(DBNoteRevision.rev.desc()).limit(limit)
+    return [{"rev": rev, "timestamp": timestamp, "piece_count": piece_count} for rev, timestamp, piece_count in rows]
+
+
+@revisions_router.get('/notes/{note_id}/revisions/{rev}')
+def get_revision(note_id: int, rev: int, db: Session = Depends(get_db)):
+    ensure_note(db, note_id)
+    loaded = load_revision(db, note_id, rev)
+    if loaded is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Revision not found"
+        )
+    row, texts = loaded
+    return {
+        "note_id": note_id,
+        "rev": rev,
+        "timestamp": row.timestamp,
+        "pieces": [{"text": text} for text in texts],
+    }
@@ -1,11 +1,23 @@
 from fastapi import APIRouter
-from typing import List
+from typing import List, Literal, Optional, Union
 from pydantic import BaseModel
 from .database import DBNote, DBPiece
-from fastapi import Depends, HTTPException, status
+from fastapi import Depends, HTTPException, Query, Request, Response, status
+from sqlalchemy import DateTime, func, literal, select, true, tuple_
 from sqlalchemy.orm import Session
 from datetime import datetime
-from .database import get_db, DBTodo
+from .database import count_deleted_pieces, DBTodo
+from .dependencies import get_db, get_write_db
+from .changes import record_change
+from .cache import cached_response, invalidate_note, invalidate_todo, store_response
+from .conditional import conditional_response, make_etag
+from .pagination import (
+    MAX_PAGE_SIZE, decode_cursor, decode_position_cursor, encode_cursor, encode_position_cursor,
+)
+from .pieces import POSITION_STEP, diff_update_pieces, ordered_pieces, place_after
+from .responses import FastJSONResponse
+from .revisions import delete_revisions, record_revision
+from .write_behind import WriteBehindKind, get_write_behind_db, write_behind_queue
 
 
 notes_router = APIRouter()
@@ -23,6 +35,17 @@ class PieceUpdate(BaseModel):
 class NoteUpdate(BaseModel):
     pieces: List[PieceUpdate]
 
+class PieceOperation(BaseModel):
+    op: Literal["insert", "update", "delete", "move"]
+    # Piece to update, delete or move
+    id: Optional[int] = None
+    # Insert or move right after this piece; at the start of the note when missing
+    after: Optional[int] = None
+    text: Optional[str] = None
+
+class NotePatch(BaseModel):
+    operations: List[PieceOperation]
+
 class TodoCreate(BaseModel):
     text: str
 
@@ -30,32 +53,279 @@ class TodoUpdate(BaseModel):
     text: str
     switchCompletion: bool
 
+# Batch requests: operations are applied in order in one transaction, and each
+# gets its own result ({"index", "status", "id"} or {"index", "status", "detail"})
+
+class NoteOperation(BaseModel):
+    op: Literal["create", "update", "delete"]
+    # Note to update or delete
+    id: Optional[int] = None
+    pieces: Optional[List[PieceCreate]] = None
+
+class NoteBatch(BaseModel):
+    operations: List[NoteOperation]
+
+class TodoOperation(BaseModel):
+    op: Literal["create", "update", "toggle", "delete"]
+    # Todo to update, toggle or delete
+    id: Optional[int] = None
+    text: Optional[str] = None
+
+class TodoBatch(BaseModel):
+    operations: List[TodoOperation]
+
+class TodoFilters(BaseModel):
+    # Query parameters of GET /todos/ and /todos/count
+    completed: Optional[bool] = None
+    created_after: Optional[datetime] = None
+    created_before: Optional[datetime] = None
+    # Todos completed at or after this time (implies completed)
+    completed_since: Optional[datetime] = None
+
+# Response models. Read handlers return pre-serialized bodies (see app/cache.py),
+# so these document the payloads without costing a validation pass per request.
+
+class PieceOut(BaseModel):
+    id: int
+    text: Optional[str]
+    timestamp: Optional[datetime]
+
+class NoteOut(BaseModel):
+    id: int
+    creation_timestamp: Optional[datetime]
+    last_update_timestamp: Optional[datetime]
+    pieces: List[PieceOut]
+
+# GET /notes/{id}?include_pieces=false
+class NoteSummaryOut(BaseModel):
+    id: int
+    creation_timestamp: Optional[datetime]
+    last_update_timestamp: Optional[datetime]
+    piece_count: int
+
+class TodoOut(BaseModel):
+    id: int
+    text: Optional[str]
+    timestamp: Optional[datetime]
+    completed: Optional[bool]
+    completion_timestamp: Optional[datetime]
+
+
+# At most this many ids go into one IN query, below SQLite's bound parameter limit
+ID_BATCH_SIZE = 500
+
+
+def serialize_notes(db: Session, note_rows):
+    # Build note payloads straight from row tuples, without ORM objects;
+    # the pieces of all notes come from one batched query
+    notes = [
+        {
+            "id": note_id,
+            "creation_timestamp": creation_timestamp,
+            "last_update_timestamp": last_update_timestamp,
+            "pieces": []
+        } for note_id, creation_timestamp, last_update_timestamp in note_rows
+    ]
+    notes_by_id = {note["id"]: note for note in notes}
+    note_ids = list(notes_by_id)
+
+    for start in range(0, len(note_ids), ID_BATCH_SIZE):
+        piece_rows = db.execute(
+            select(DBPiece.note_id, DBPiece.id, DBPiece.text, DBPiece.timestamp)
+            .where(DBPiece.note_id.in_(note_ids[start:start + ID_BATCH_SIZE]))
+            .order_by(DBPiece.note_id, DBPiece.position, DBPiece.id)
+        )
+        for note_id, piece_id, text, timestamp in piece_rows:
+            notes_by_id[note_id]["pieces"].append({"id": piece_id, "text": text, "timestamp": timestamp})
+
+    return notes
+
+
+def load_by_id(db: Session, model, ids):
+    # Rows of `model` keyed by id, in one query per ID_BATCH_SIZE ids
+    ids = list(ids)
+    loaded = {}
+    for start in range(0, len(ids), ID_BATCH_SIZE):
+        for row in db.query(model).filter(model.id.in_(ids[start:start + ID_BATCH_SIZE])):
+            loaded[row.id] = row
+    return loaded
+
+
+def new_note(texts, now: datetime) -> DBNote:
+    # The pieces hang off the relationship, so the note and its pieces are
+    # inserted by the same flush
+    note = DBNote(creation_timestamp=now, last_update_timestamp=now)
+    note.pieces = [
+        DBPiece(text=text, timestamp=now, position=i * POSITION_STEP)
+        for i, text in enumerate(texts)
+    ]
+    return note
+
+
+def new_todo(text: str, now: datetime) -> DBTodo:
+    return DBTodo(
+        text=text,
+        timestamp=now,
+        completed=False,
+        completion_timestamp=None,
+        last_update_timestamp=now
+    )
+
+
+def toggle_completion(todo: DBTodo, now: datetime):
+    todo.completed = not todo.completed
+    todo.completion_timestamp = now if todo.completed else todo.completion_timestamp
+
 
+def apply_note_update(db: Session, note: DBNote, texts: List[str], now: datetime) -> bool:
+    existing = ordered_pieces(db, note.id)
+    old_texts = [piece.text for piece in existing]
+    # Only the pieces that differ from the stored ones are written
+    changed = diff_update_pieces(db, note.id, texts, now, existing)
+
+    # Update timestamps
+    if changed:
+        note.last_update_timestamp = now
+        record_change(db, "note", note.id, "update")
+        record_revision(db, note.id, old_texts, texts, now)
+    return changed
+
+
+def apply_todo_update(db: Session, todo: DBTodo, text: Optional[str], switch_completion: bool, now: datetime):
+    if text is not None:
+        todo.text = text
+
+    if switch_completion:
+        toggle_completion(todo, now)
+
+    todo.last_update_timestamp = now
+    record_change(db, "todo", todo.id, "update")
+
+
+# Queued updates (see app/write_behind.py). A note's queued texts replace the
+# previous ones; a todo keeps the latest text, and two toggles cancel out.
+def write_queued_note_update(db: Session, note_id: int, payload):
+    texts, now = payload
+    note = db.get(DBNote, note_id)
+    if note is not None:
+        apply_note_update(db, note, texts, now)
+
+
+def write_queued_todo_update(db: Session, todo_id: int, payload):
+    text, switch_completion, now = payload
+    todo = db.get(DBTodo, todo_id)
+    if todo is not None:
+        apply_todo_update(db, todo, text, switch_completion, now)
+
+
+def merge_todo_updates(older, newer):
+    return newer[0], older[1] != newer[1], newer[2]
+
+
+NOTE_UPDATES = WriteBehindKind("note", write_queued_note_update, invalidate=invalidate_note)
+TODO_UPDATES = WriteBehindKind("todo", write_queued_todo_update, merge_todo_updates, invalidate_todo)
+
+
+def item_error(index: int, status_code: int, detail: str):
+    return {"index": index, "status": status_code, "detail": detail}
 
 
 @notes_router.post('/notes', status_code=status.HTTP_201_CREATED)
-def create_note(note_data: NoteCreate, db: Session = Depends(get_db)):
+def create_note(note_data: NoteCreate, db: Session = Depends(get_write_db)):
     try:
-        # Create new note
-        db_note = DBNote(
-            creation_timestamp=datetime.now(),
-            last_update_timestamp=datetime.now()
-        )
+        now = datetime.now()
+        texts = [piece.text for piece in note_data.pieces]
+        db_note = new_note(texts, now)
         db.add(db_note)
+        db.flush()
+        note_id = db_note.id
+        record_change(db, "note", note_id, "create")
+        record_revision(db, note_id, None, texts, now)
         db.commit()
-        db.refresh(db_note)
-
-        # Add pieces
-        for piece in note_data.pieces:
-            db_piece = DBPiece(
-                text=piece.text,
-                timestamp=datetime.now(),
-                note_id=db_note.id
-            )
-            db.add(db_piece)
+        invalidate_note()
+        return {"message": "Note created successfully!", "note_id": note_id}
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error: {str(e)}"
+        )
+
+
+@notes_router.post('/notes/batch')
+def batch_notes(batch: NoteBatch, db: Session = Depends(get_write_db)):
+    try:
+        now = datetime.now()
+        notes = load_by_id(db, DBNote, {operation.id for operation in batch.operations if operation.id is not None})
+        results = []
+        created = []
+        # (note id, texts before, texts after) of the updates that changed something
+        updated = []
+        changed_ids = set()
+        deleted_ids = []
+
+        for index, operation in enumerate(batch.operations):
+            if operation.op in ("create", "update") and operation.pieces is None:
+                results.append(item_error(index, status.HTTP_400_BAD_REQUEST, f"Operation {operation.op} needs pieces"))
+                continue
+            texts = [piece.text for piece in operation.pieces or []]
+
+            if operation.op == "create":
+                db_note = new_note(texts, now)
+                db.add(db_note)
+                result = {"index": index, "status": status.HTTP_201_CREATED}
+                created.append((result, db_note, texts))
+                results.append(result)
+                continue
+
+            note = notes.get(operation.id)
+            if note is None:
+                results.append(item_error(index, status.HTTP_404_NOT_FOUND, "Note not found"))
+                continue
+
+            if operation.op == "update":
+                existing = ordered_pieces(db, note.id)
+                old_texts = [piece.text for piece in existing]
+                if diff_update_pieces(db, note.id, texts, now, existing):
+                    note.last_update_timestamp = now
+                    changed_ids.add(note.id)
+                    updated.append((note.id, old_texts, texts))
+                results.append({"index": index, "status": status.HTTP_200_OK, "id": note.id})
+            elif operation.op == "delete":
+                # Later operations on this note get a 404, as they would one request later
+                del notes[note.id]
+                deleted_ids.append(note.id)
+                changed_ids.add(note.id)
+                results.append({"index": index, "status": status.HTTP_204_NO_CONTENT, "id": note.id})
+
+        # One flush inserts every created note and then all their pieces
+        db.flush()
+        for result, db_note, texts in created:
+            result["id"] = db_note.id
+            record_change(db, "note", db_note.id, "create")
+            record_revision(db, db_note.id, None, texts, now)
+        for note_id in changed_ids:
+            record_change(db, "note", note_id, "delete" if note_id in deleted_ids else "update")
+        for note_id, old_texts, texts in updated:
+            if note_id not in deleted_ids:
+                record_revision(db, note_id, old_texts, texts, now)
+
+        for start in range(0, len(deleted_ids), ID_BATCH_SIZE):
+            count_deleted_pieces(db, db.query(DBPiece).filter(
+                DBPiece.note_id.in_(deleted_ids[start:start + ID_BATCH_SIZE])
+            ).delete())
+            delete_revisions(db, deleted_ids[start:start + ID_BATCH_SIZE])
+        # The notes themselves go through the session, which records their tombstones
+        for note_id in deleted_ids:
+            db.delete(db.get(DBNote, note_id))
 
         db.commit()
-        return {"message": "Note created successfully!", "note_id": db_note.id}
+        if created:
+            invalidate_note()
+        for note_id in changed_ids:
+            invalidate_note(note_id)
+        return {"results": results}
 
     except Exception as e:
         db.rollback()
@@ -65,49 +335,171 @@ def create_note(note_data: NoteCreate, db: Session = Depends(get_db)):
         )
 
 
-@notes_router.get('/notes')
-def get_all_notes(db: Session = Depends(get_db)):
-    notes = db.query(DBNote).all()
-    return [
-        {
-            "id": note.id,
-            "creation_timestamp": note.creation_timestamp,
-            "last_update_timestamp": note.last_update_timestamp,
-            "pieces": [
-                {
-                    "text": piece.text,
-                    "timestamp": piece.timestamp
-                } for piece in note.pieces
-            ]
-        } for note in notes
-    ]
+@notes_router.get('/notes', response_model=List[NoteOut])
+def get_all_notes(
+    request: Request,
+    response: Response,
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    # Every note write bumps last_update_timestamp and deletes change the count.
+    # Only the ETag covers both: a delete leaves the latest update where it was,
+    # so the list sends no Last-Modified and If-Modified-Since is not honored.
+    count, last_update = db.query(func.count(DBNote.id), func.max(DBNote.last_update_timestamp)).one()
+    etag = make_etag("notes", count, last_update, request.url.query)
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    cache_key = ("notes", limit, after)
+    cached = cached_response(cache_key, etag)
+    if cached:
+        return cached
+
+    # Pages come most recently updated first, while the full list keeps its
+    # original order by id for existing clients; pieces are fetched in one
+    # batched query per page
+    query = db.query(DBNote.id, DBNote.creation_timestamp, DBNote.last_update_timestamp)
+    if limit is None and after is None:
+        query = query.order_by(DBNote.id)
+    else:
+        query = query.order_by(DBNote.last_update_timestamp.desc(), DBNote.id.desc())
+
+    if after is not None:
+        try:
+            cursor_timestamp, cursor_id = decode_cursor(after)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.filter(
+            tuple_(DBNote.last_update_timestamp, DBNote.id) < tuple_(cursor_timestamp, cursor_id)
+        )
 
+    if limit is None:
+        notes = query.all()
+    else:
+        # Fetch one extra row to know whether there is a next page
+        notes = query.limit(limit + 1).all()
+        if len(notes) > limit:
+            notes = notes[:limit]
+            response.headers["X-Next-Cursor"] = encode_cursor(
+                notes[-1].last_update_timestamp, notes[-1].id
+            )
 
-@notes_router.get('/notes/{note_id}')
-def get_single_note(note_id: int, db: Session = Depends(get_db)):
-    note = db.query(DBNote).filter(DBNote.id == note_id).first()
+    return store_response(cache_key, etag, serialize_notes(db, notes), response)
 
-    if not note:
+
+@notes_router.get('/notes/{note_id}', response_model=Union[NoteOut, NoteSummaryOut])
+def get_single_note(
+    note_id: int,
+    request: Request,
+    response: Response,
+    # false: the note's metadata and piece count, without the pieces
+    include_pieces: bool = True,
+    db: Session = Depends(get_db)
+):
+    last_update = db.query(DBNote.last_update_timestamp).filter(DBNote.id == note_id).first()
+
+    if not last_update:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail="Note not found"
+        )
+
+    etag = make_etag("note" if include_pieces else "note-summary", note_id, last_update[0])
+    not_modified = conditional_response(request, response, etag, last_update[0])
+    if not_modified:
+        return not_modified
+
+    if not include_pieces:
+        # Counted on the (note_id, position) index, without reading a piece
+        note_row = db.query(DBNote.id, DBNote.creation_timestamp, DBNote.last_update_timestamp).filter(
+            DBNote.id == note_id
+        ).one()
+        return {
+            "id": note_row.id,
+            "creation_timestamp": note_row.creation_timestamp,
+            "last_update_timestamp": note_row.last_update_timestamp,
+            "piece_count": db.query(func.count(DBPiece.id)).filter(DBPiece.note_id == note_id).scalar(),
+        }
+
+    cache_key = ("note", note_id)
+    cached = cached_response(cache_key, etag)
+    if cached:
+        return cached
+
+    note_row = db.query(DBNote.id, DBNote.creation_timestamp, DBNote.last_update_timestamp).filter(
+        DBNote.id == note_id
+    ).one()
+
+    return store_response(cache_key, etag, serialize_notes(db, [note_row])[0], response)
+
+
+@notes_router.get('/notes/{note_id}/pieces', response_model=List[PieceOut])
+def get_note_pieces(
+    note_id: int,
+    request: Request,
+    response: Response,
+    limit: int = Query(100, ge=1, le=MAX_PAGE_SIZE),
+    offset: int = Query(0, ge=0),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    # A page of a note's pieces in order. The X-Next-Cursor header, passed
+    # back as `after`, seeks straight to the next page on the
+    # (note_id, position) index; `offset` skips that many pieces first.
+    last_update = db.query(DBNote.last_update_timestamp).filter(DBNote.id == note_id).first()
+
+    if not last_update:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Note not found"
         )
 
-    return {
-        "id": note.id,
-        "creation_timestamp": note.creation_timestamp,
-        "last_update_timestamp": note.last_update_timestamp,
-        "pieces": [
-            {
-                "text": piece.text,
-                "timestamp": piece.timestamp
-            } for piece in note.pieces
-        ]
-    }
+    etag = make_etag("note-pieces", note_id, last_update[0], request.url.query)
+    not_modified = conditional_response(request, response, etag, last_update[0])
+    if not_modified:
+        return not_modified
+
+    query = select(DBPiece.id, DBPiece.text, DBPiece.timestamp, DBPiece.position).where(
+        DBPiece.note_id == note_id
+    ).order_by(DBPiece.position, DBPiece.id)
+
+    if after is not None:
+        try:
+            cursor_position, cursor_id = decode_position_cursor(after)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        query = query.where(tuple_(DBPiece.position, DBPiece.id) > tuple_(cursor_position, cursor_id))
+
+    # Fetch one extra row to know whether there is a next page
+    pieces = db.execute(query.offset(offset).limit(limit + 1)).all()
+    if len(pieces) > limit:
+        pieces = pieces[:limit]
+        response.headers["X-Next-Cursor"] = encode_position_cursor(pieces[-1].position, pieces[-1].id)
+
+    return [{"id": piece.id, "text": piece.text, "timestamp": piece.timestamp} for piece in pieces]
+
 
 @notes_router.put('/notes/{note_id}')
-def update_note(note_id: int, note_data: NoteUpdate, db: Session = Depends(get_db)):
+def update_note(note_id: int, note_data: NoteUpdate, db: Session = Depends(get_write_behind_db)):
+    texts = [piece.text for piece in note_data.pieces]
     try:
+        if write_behind_queue.enabled:
+            if not db.query(DBNote.id).filter(DBNote.id == note_id).first():
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Note not found"
+                )
+            write_behind_queue.submit(db.get_bind(), NOTE_UPDATES, note_id, (texts, datetime.now()))
+            return FastJSONResponse({"message": "Note update queued"}, status_code=status.HTTP_202_ACCEPTED)
+
         # Get existing note
         note = db.query(DBNote).filter(DBNote.id == note_id).first()
 
@@ -117,33 +509,10 @@ def update_note(note_id: int, note_data: NoteUpdate, db: Session = Depends(get_d
                 detail="Note not found"
             )
 
-        # Get existing pieces
-        existing_pieces = db.query(DBPiece).filter(DBPiece.note_id == note_id).all()
-
-        # Update existing pieces
-        for i, piece in enumerate(note_data.pieces):
-            if i < len(existing_pieces):
-                # Update existing piece if text has changed
-                if piece.text != existing_pieces[i].text:
-                    existing_pieces[i].text = piece.text
-                    existing_pieces[i].timestamp = datetime.now()
-            else:
-                # Add new piece
-                db_piece = DBPiece(
-                    text=piece.text,
-                    timestamp=datetime.now(),
-                    note_id=note_id
-                )
-                db.add(db_piece)
-
-        # Delete extra existing pieces
-        for i in range(len(note_data.pieces), len(existing_pieces)):
-            db.delete(existing_pieces[i])
-
-        # Update timestamps
-        note.last_update_timestamp = datetime.now()
-
+        changed = apply_note_update(db, note, texts, datetime.now())
         db.commit()
+        if changed:
+            invalidate_note(note_id)
         return {"message": "Note updated successfully!"}
 
     except HTTPException as e:
@@ -158,8 +527,81 @@ def update_note(note_id: int, note_data: NoteUpdate, db: Session = Depends(get_d
         )
 
 
+@notes_router.patch('/notes/{note_id}/pieces')
+def patch_note_pieces(note_id: int, patch: NotePatch, db: Session = Depends(get_write_db)):
+    try:
+        note = db.query(DBNote).filter(DBNote.id == note_id).first()
+
+        if not note:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail="Note not found"
+            )
+
+        now = datetime.now()
+        old_texts = [piece.text for piece in ordered_pieces(db, note_id)]
+        inserted_ids = []
+        for operation in patch.operations:
+            if operation.op in ("insert", "update") and operation.text is None:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"Operation {operation.op} needs a text"
+                )
+
+            if operation.op == "insert":
+                db_piece = DBPiece(text=operation.text, timestamp=now, note_id=note_id)
+                place_after(db, note_id, db_piece, operation.after)
+                db.add(db_piece)
+                db.flush()
+                inserted_ids.append(db_piece.id)
+                continue
+
+            piece = db.get(DBPiece, operation.id) if operation.id is not None else None
+            if piece is None or piece.note_id != note_id:
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Piece not found"
+                )
+
+            if operation.op == "update":
+                if piece.text != operation.text:
+                    piece.text = operation.text
+                    piece.timestamp = now
+            elif operation.op == "delete":
+                db.delete(piece)
+            elif operation.op == "move":
+                if operation.after == piece.id:
+                    raise HTTPException(
+                        status_code=status.HTTP_400_BAD_REQUEST,
+                        detail="Cannot move a piece after itself"
+                    )
+                place_after(db, note_id, piece, operation.after)
+            # Later operations may refer to the positions written here
+            db.flush()
+
+        note.last_update_timestamp = now
+        record_change(db, "note", note_id, "update")
+        texts = [piece.text for piece in ordered_pieces(db, note_id)]
+        if texts != old_texts:
+            record_revision(db, note_id, old_texts, texts, now)
+        db.commit()
+        invalidate_note(note_id)
+        return {"message": "Note updated successfully!", "inserted_ids": inserted_ids}
+
+    except HTTPException:
+        db.rollback()
+        raise
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error: {str(e)}"
+        )
+
+
 @notes_router.delete('/notes/{note_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_note(note_id: int, db: Session = Depends(get_db)):
+def delete_note(note_id: int, db: Session = Depends(get_write_db)):
     note = db.query(DBNote).filter(DBNote.id == note_id).first()
 
     if not note:
@@ -169,11 +611,14 @@ def delete_note(note_id: int, db: Session = Depends(get_db)):
         )
 
     try:
-        # Delete associated pieces first
-        db.query(DBPiece).filter(DBPiece.note_id == note_id).delete()
+        # Delete associated pieces and history first
+        count_deleted_pieces(db, db.query(DBPiece).filter(DBPiece.note_id == note_id).delete())
+        delete_revisions(db, [note_id])
         # Delete the note
         db.delete(note)
+        record_change(db, "note", note_id, "delete")
         db.commit()
+        invalidate_note(note_id)
 
     except Exception as e:
         db.rollback()
@@ -183,18 +628,82 @@ def delete_note(note_id: int, db: Session = Depends(get_db)):
         )
 
 @todos_router.post('/todos/', status_code=status.HTTP_201_CREATED)
-def create_todo(todo_data: TodoCreate, db: Session = Depends(get_db)):
+def create_todo(todo_data: TodoCreate, db: Session = Depends(get_write_db)):
     try:
-        db_todo = DBTodo(
-            text=todo_data.text,
-            timestamp=datetime.now(),
-            completed=False,
-            completion_timestamp=None
-        )
+        db_todo = new_todo(todo_data.text, datetime.now())
         db.add(db_todo)
+        db.flush()
+        todo_id = db_todo.id
+        record_change(db, "todo", todo_id, "create")
+        db.commit()
+        invalidate_todo()
+        return {"message": "Todo created successfully!", "todo_id": todo_id}
+
+    except Exception as e:
+        db.rollback()
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Database error: {str(e)}"
+        )
+
+
+@todos_router.post('/todos/batch')
+def batch_todos(batch: TodoBatch, db: Session = Depends(get_write_db)):
+    try:
+        now = datetime.now()
+        todos = load_by_id(db, DBTodo, {operation.id for operation in batch.operations if operation.id is not None})
+        results = []
+        created = []
+        changed_ids = set()
+        deleted_ids = set()
+
+        for index, operation in enumerate(batch.operations):
+            if operation.op in ("create", "update") and operation.text is None:
+                results.append(item_error(index, status.HTTP_400_BAD_REQUEST, f"Operation {operation.op} needs a text"))
+                continue
+
+            if operation.op == "create":
+                db_todo = new_todo(operation.text, now)
+                db.add(db_todo)
+                result = {"index": index, "status": status.HTTP_201_CREATED}
+                created.append((result, db_todo))
+                results.append(result)
+                continue
+
+            todo = todos.get(operation.id)
+            if todo is None:
+                results.append(item_error(index, status.HTTP_404_NOT_FOUND, "Todo not found"))
+                continue
+
+            changed_ids.add(todo.id)
+            if operation.op == "delete":
+                del todos[todo.id]
+                deleted_ids.add(todo.id)
+                db.delete(todo)
+                results.append({"index": index, "status": status.HTTP_204_NO_CONTENT, "id": todo.id})
+                continue
+
+            if operation.op == "update":
+                todo.text = operation.text
+            elif operation.op == "toggle":
+                toggle_completion(todo, now)
+            todo.last_update_timestamp = now
+            results.append({"index": index, "status": status.HTTP_200_OK, "id": todo.id})
+
+        # All inserts, updates and deletes go out in one flush and one commit
+        db.flush()
+        for result, db_todo in created:
+            result["id"] = db_todo.id
+            record_change(db, "todo", db_todo.id, "create")
+        for todo_id in changed_ids:
+            record_change(db, "todo", todo_id, "delete" if todo_id in deleted_ids else "update")
         db.commit()
-        db.refresh(db_todo)
-        return {"message": "Todo created successfully!", "todo_id": db_todo.id}
+
+        if created:
+            invalidate_todo()
+        for todo_id in changed_ids:
+            invalidate_todo(todo_id)
+        return {"results": results}
 
     except Exception as e:
         db.rollback()
@@ -204,10 +713,108 @@ def create_todo(todo_data: TodoCreate, db: Session = Depends(get_db)):
         )
 
 
-@todos_router.get('/todos/')
-def get_all_todos(db: Session = Depends(get_db)):
-    todos = db.query(DBTodo).all()
-    return [
+def todo_conditions(filters: TodoFilters):
+    conditions = []
+    if filters.completed is not None:
+        conditions.append(DBTodo.completed == filters.completed)
+    if filters.created_after is not None:
+        conditions.append(DBTodo.timestamp > filters.created_after)
+    if filters.created_before is not None:
+        conditions.append(DBTodo.timestamp < filters.created_before)
+    if filters.completed_since is not None:
+        conditions.append(DBTodo.completed == true())
+        conditions.append(DBTodo.completion_timestamp >= filters.completed_since)
+    return conditions
+
+
+# Completed todos from before completion times were recorded have none: they
+# sort (and page) as if completed at the earliest time there is
+COMPLETION_KEY = func.coalesce(DBTodo.completion_timestamp, literal(datetime.min, DateTime))
+
+# sort parameter -> (key, descending)
+TODO_SORTS = {
+    "created": (DBTodo.timestamp, False),
+    "-created": (DBTodo.timestamp, True),
+    "completed": (COMPLETION_KEY, False),
+    "-completed": (COMPLETION_KEY, True),
+}
+
+
+@todos_router.get('/todos/count')
+def count_todos(filters: TodoFilters = Depends(), db: Session = Depends(get_db)):
+    # For badges: the (completed, timestamp) index answers the open todos count
+    # without reading the table
+    return {"count": db.query(func.count(DBTodo.id)).filter(*todo_conditions(filters)).scalar()}
+
+
+@todos_router.get('/todos/', response_model=List[TodoOut])
+def get_all_todos(
+    request: Request,
+    response: Response,
+    filters: TodoFilters = Depends(),
+    sort: Literal["created", "-created", "completed", "-completed"] = "created",
+    limit: Optional[int] = Query(None, ge=1, le=MAX_PAGE_SIZE),
+    after: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    conditions = todo_conditions(filters)
+    sort_column, descending = TODO_SORTS[sort]
+    if sort_column is COMPLETION_KEY:
+        if filters.completed is False:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Sorting by completion needs completed todos"
+            )
+        conditions.append(DBTodo.completed == true())
+
+    # The validator only covers the selected todos: any change to one of them
+    # moves the latest update, and one entering or leaving the set moves the
+    # count or the latest update. A todo leaving the set can leave the latest
+    # update as it was, so as for notes the ETag is the only validator.
+    count, last_update = db.query(
+        func.count(DBTodo.id), func.max(DBTodo.last_update_timestamp)
+    ).filter(*conditions).one()
+    etag = make_etag("todos", count, last_update, request.url.query)
+    not_modified = conditional_response(request, response, etag)
+    if not_modified:
+        return not_modified
+
+    cache_key = ("todos", request.url.query)
+    cached = cached_response(cache_key, etag)
+    if cached:
+        return cached
+
+    query = select(
+        DBTodo.id, DBTodo.text, DBTodo.timestamp, DBTodo.completed, DBTodo.completion_timestamp,
+        sort_column.label("sort_key")
+    ).where(*conditions)
+    if descending:
+        query = query.order_by(sort_column.desc(), DBTodo.id.desc())
+    else:
+        query = query.order_by(sort_column, DBTodo.id)
+
+    if after is not None:
+        try:
+            cursor_timestamp, cursor_id = decode_cursor(after)
+        except ValueError:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Invalid cursor"
+            )
+        key, cursor = tuple_(sort_column, DBTodo.id), tuple_(cursor_timestamp, cursor_id)
+        query = query.where(key < cursor if descending else key > cursor)
+
+    if limit is None:
+        todos = db.execute(query).all()
+    else:
+        # Fetch one extra row to know whether there is a next page
+        todos = db.execute(query.limit(limit + 1)).all()
+        if len(todos) > limit:
+            todos = todos[:limit]
+            last = todos[-1]
+            response.headers["X-Next-Cursor"] = encode_cursor(last.sort_key, last.id)
+
+    return store_response(cache_key, etag, [
         {
             "id": todo.id,
             "text": todo.text,
@@ -215,31 +822,53 @@ def get_all_todos(db: Session = Depends(get_db)):
             "completed": todo.completed,
             "completion_timestamp": todo.completion_timestamp
         } for todo in todos
-    ]
+    ], response)
 
 
-@todos_router.get('/todos/{todo_id}')
-def get_single_todo(todo_id: int, db: Session = Depends(get_db)):
-    todo = db.query(DBTodo).filter(DBTodo.id == todo_id).first()
+@todos_router.get('/todos/{todo_id}', response_model=TodoOut)
+def get_single_todo(todo_id: int, request: Request, response: Response, db: Session = Depends(get_db)):
+    last_update = db.query(DBTodo.last_update_timestamp).filter(DBTodo.id == todo_id).first()
 
-    if not todo:
+    if not last_update:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Todo not found"
         )
 
-    return {
+    etag = make_etag("todo", todo_id, last_update[0])
+    not_modified = conditional_response(request, response, etag, last_update[0])
+    if not_modified:
+        return not_modified
+
+    cache_key = ("todo", todo_id)
+    cached = cached_response(cache_key, etag)
+    if cached:
+        return cached
+
+    todo = db.query(DBTodo).filter(DBTodo.id == todo_id).first()
+
+    return store_response(cache_key, etag, {
         "id": todo.id,
         "text": todo.text,
         "timestamp": todo.timestamp,
         "completed": todo.completed,
         "completion_timestamp": todo.completion_timestamp
-    }
+    }, response)
 
 
 @todos_router.put('/todos/{todo_id}')
-def update_todo(todo_id: int, todo_data: TodoUpdate, db: Session = Depends(get_db)):
+def update_todo(todo_id: int, todo_data: TodoUpdate, db: Session = Depends(get_write_behind_db)):
     try:
+        if write_behind_queue.enabled:
+            if not db.query(DBTodo.id).filter(DBTodo.id == todo_id).first():
+                raise HTTPException(
+                    status_code=status.HTTP_404_NOT_FOUND,
+                    detail="Todo not found"
+                )
+            payload = (todo_data.text, todo_data.switchCompletion, datetime.now())
+            write_behind_queue.submit(db.get_bind(), TODO_UPDATES, todo_id, payload)
+            return FastJSONResponse({"message": "Todo update queued"}, status_code=status.HTTP_202_ACCEPTED)
+
         todo = db.query(DBTodo).filter(DBTodo.id == todo_id).first()
 
         if not todo:
@@ -248,14 +877,9 @@ def update_todo(todo_id: int, todo_data: TodoUpdate, db: Session = Depends(get_d
                 detail="Todo not found"
             )
 
-        if todo_data.text is not None:
-            todo.text = todo_data.text
-
-        if todo_data.switchCompletion:
-            todo.completed = not todo.completed
-            todo.completion_timestamp = datetime.now() if todo.completed else todo.completion_timestamp
-
+        apply_todo_update(db, todo, todo_data.text, todo_data.switchCompletion, datetime.now())
         db.commit()
+        invalidate_todo(todo_id)
         return {"message": "Todo updated successfully!"}
 
     except HTTPException:
@@ -272,7 +896,7 @@ def update_todo(todo_id: int, todo_data: TodoUpdate, db: Session = Depends(get_d
 
 
 @todos_router.delete('/todos/{todo_id}', status_code=status.HTTP_204_NO_CONTENT)
-def delete_todo(todo_id: int, db: Session = Depends(get_db)):
+def delete_todo(todo_id: int, db: Session = Depends(get_write_db)):
     todo = db.query(DBTodo).filter(DBTodo.id == todo_id).first()
 
     if not todo:
@@ -283,7 +907,9 @@ def delete_todo(todo_id: int, db: Session = Depends(get_db)):
 
     try:
         db.delete(todo)
+        record_change(db, "todo", todo_id, "delete")
         db.commit()
+        invalidate_todo(todo_id)
 
     except Exception as e:
         db.rollback()
@@ -0,0 +1,121 @@
+import re
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from .dependencies import get_db
+
+
+search_router = APIRouter()
+
+# Each side of the UNION is limited first so FTS5 can stop early on common terms
+SQLITE_SEARCH_QUERY = text("""
+    SELECT * FROM (
+        SELECT 'piece' AS kind,
+               pieces.note_id AS note_id,
+               pieces.id AS piece_id,
+               (SELECT count(*) FROM pieces AS earlier
+                WHERE earlier.note_id = pieces.note_id
+                  AND (earlier.position, earlier.id) < (pieces.position, pieces.id)) AS piece_index,
+               NULL AS todo_id,
+               snippet(piece_search, 0, '<mark>', '</mark>', '…', 12) AS snippet,
+               piece_search.rank AS rank
+        FROM piece_search JOIN pieces ON pieces.id = piece_search.rowid
+        WHERE piece_search MATCH :query
+        ORDER BY piece_search.rank
+        LIMIT :limit
+    )
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'todo' AS kind,
+               NULL AS note_id,
+               NULL AS piece_id,
+               NULL AS piece_index,
+               todo_search.rowid AS todo_id,
+               snippet(todo_search, 0, '<mark>', '</mark>', '…', 12) AS snippet,
+               todo_search.rank AS rank
+        FROM todo_search
+        WHERE todo_search MATCH :query
+        ORDER BY todo_search.rank
+        LIMIT :limit
+    )
+    ORDER BY rank
+    LIMIT :limit
+""")
+
+# The same on PostgreSQL's text search, with the GIN expression indexes from
+# app/database.py. ts_rank grows with relevance where FTS5's rank shrinks, so
+# it is negated to keep "lower is better" for clients.
+POSTGRES_SEARCH_QUERY = text("""
+    SELECT * FROM (
+        SELECT 'piece' AS kind,
+               pieces.note_id AS note_id,
+               pieces.id AS piece_id,
+               (SELECT count(*) FROM pieces AS earlier
+                WHERE earlier.note_id = pieces.note_id
+                  AND (earlier.position, earlier.id) < (pieces.position, pieces.id)) AS piece_index,
+               NULL::integer AS todo_id,
+               ts_headline('simple', pieces.text, query, :headline_options) AS snippet,
+               -ts_rank(to_tsvector('simple', pieces.text), query) AS rank
+        FROM pieces, to_tsquery('simple', :query) AS query
+        WHERE to_tsvector('simple', pieces.text) @@ query
+        ORDER BY rank
+        LIMIT :limit
+    ) AS piece_hits
+    UNION ALL
+    SELECT * FROM (
+        SELECT 'todo' AS kind,
+               NULL::integer AS note_id,
+               NULL::integer AS piece_id,
+               NULL::bigint AS piece_index,
+               todos.id AS todo_id,
+               ts_headline('simple', todos.text, query, :headline_options) AS snippet,
+               -ts_rank(to_tsvector('simple', todos.text), query) AS rank
+        FROM todos, to_tsquery('simple', :query) AS query
+        WHERE to_tsvector('simple', todos.text) @@ query
+        ORDER BY rank
+        LIMIT :limit
+    ) AS todo_hits
+    ORDER BY rank
+    LIMIT :limit
+""")
+HEADLINE_OPTIONS = "StartSel=<mark>, StopSel=</mark>, MaxWords=12, MinWords=4, MaxFragments=1, FragmentDelimiter=…"
+
+
+def build_match_query(q: str) -> str:
+    # Quote every word so user input can never be parsed as FTS5 syntax,
+    # and prefix-match them so partially typed words already find results
+    return " ".join(f'"{word}"*' for word in re.findall(r"\w+", q))
+
+
+def build_tsquery(q: str) -> str:
+    # The same for to_tsquery: \w+ leaves out all of its operators
+    return " & ".join(f"{word}:*" for word in re.findall(r"\w+", q))
+
+
+@search_router.get('/search')
+def search(
+    q: str,
+    limit: int = Query(20, ge=1, le=100),
+    db: Session = Depends(get_db)
+):
+    if db.get_bind().dialect.name == "postgresql":
+        query, parameters = POSTGRES_SEARCH_QUERY, {"query": build_tsquery(q), "headline_options": HEADLINE_OPTIONS}
+    else:
+        query, parameters = SQLITE_SEARCH_QUERY, {"query": build_match_query(q)}
+    if not parameters["query"]:
+        return []
+
+    rows = db.execute(query, {**parameters, "limit": limit})
+    return [
+        {
+            "kind": row.kind,
+            "note_id": row.note_id,
+            "piece_id": row.piece_id,
+            "piece_index": row.piece_index,
+            "todo_id": row.todo_id,
+            "snippet": row.snippet,
+            "rank": row.rank
+        } for row in rows
+    ]
@@ -0,0 +1,72 @@
+import logging
+import os
+import re
+
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Pragmas that can be tuned, in the order they are applied
+PRAGMA_NAMES = ["journal_mode", "synchronous", "mmap_size", "cache_size", "temp_store", "busy_timeout"]
+
+PROFILES = {
+    # SQLite's own defaults: rollback journal, full fsync on every commit
+    "default": {},
+    # Readers no longer block behind writers, commits only fsync at checkpoints
+    "production": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "mmap_size": 268435456,  # 256 MiB
+        "cache_size": -65536,  # 64 MiB (negative values are KiB)
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,  # ms
+    },
+    # WAL concurrency but an fsync on every commit
+    "durable": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "temp_store": "MEMORY",
+        "busy_timeout": 5000,
+    },
+}
+
+_VALUE_PATTERN = re.compile(r"^-?\w+$")
+
+
+def resolve_pragmas(profile: str, environ=os.environ) -> dict:
+    # Start from the named profile and apply NOTES_SQLITE_<PRAGMA> overrides
+    if profile not in PROFILES:
+        raise ValueError(f"Unknown SQLite profile {profile!r}, expected one of {sorted(PROFILES)}")
+    pragmas = dict(PROFILES[profile])
+    for name in PRAGMA_NAMES:
+        value = environ.get(f"NOTES_SQLITE_{name.upper()}")
+        if value is not None:
+            pragmas[name] = value
+    for name, value in pragmas.items():
+        # Values end up in PRAGMA statements, which cannot take bound parameters
+        if not _VALUE_PATTERN.match(str(value)):
+            raise ValueError(f"Invalid value {value!r} for SQLite pragma {name}")
+    return {name: pragmas[name] for name in PRAGMA_NAMES if name in pragmas}
+
+
+def install_pragmas(engine, pragmas: dict):
+    # Apply the pragmas on every new DBAPI connection of the engine
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
+
+
+def effective_pragmas(connection) -> dict:
+    # Values as reported by SQLite, e.g. journal_mode is "memory" for :memory:
+    return {
+        name: connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+        for name in PRAGMA_NAMES
+    }
+
+
+def log_effective_pragmas(engine, profile: str):
+    with engine.connect() as connection:
+        logger.info("SQLite %s profile, effective pragmas: %s", profile, effective_pragmas(connection))
@@ -0,0 +1,122 @@
+from datetime import date, timedelta
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from .database import (
+    COMPLETION_BUCKETS, DBNote, DBPiece, DBStatsCompletion, DBStatsCounter, DBStatsNoteDay, DBTodo, StatsDelta,
+)
+from .dependencies import get_db
+
+# Aggregate statistics. GET /stats reads a handful of summary rows instead of
+# scanning notes and todos: counters, notes created per day, and completed
+# todos bucketed by how long they took. app/database.py keeps them up to date
+# on every flush; rebuild_stats recomputes them from the tables, and
+# scripts/check_stats.py compares the two.
+
+stats_router = APIRouter()
+
+
+def compute_stats(connection):
+    # The summary rows as they should be, from a full pass over the tables
+    delta = StatsDelta()
+    for (creation_timestamp,) in connection.execute(select(DBNote.creation_timestamp)):
+        delta.add_note(creation_timestamp, 1)
+    delta.counters["pieces"] = connection.scalar(select(func.count(DBPiece.id)))
+    for row in connection.execute(select(DBTodo.completed, DBTodo.timestamp, DBTodo.completion_timestamp)):
+        delta.add_todo(*row, 1)
+    return {
+        "counters": {name: delta.counters[name] for name in ("notes", "pieces", "todos_open", "todos_completed")},
+        "note_days": {day: notes for day, notes in delta.note_days.items() if notes},
+        "completion": {
+            bucket: (delta.completions[bucket], delta.completion_seconds[bucket])
+            for bucket in range(len(COMPLETION_BUCKETS) + 1)
+        },
+    }
+
+
+def stored_stats(connection):
+    return {
+        "counters": dict(connection.execute(select(DBStatsCounter.name, DBStatsCounter.value)).all()),
+        "note_days": dict(connection.execute(
+            select(DBStatsNoteDay.day, DBStatsNoteDay.notes).where(DBStatsNoteDay.notes != 0)
+        ).all()),
+        "completion": {
+            bucket: (todos, seconds) for bucket, todos, seconds in connection.execute(
+                select(DBStatsCompletion.bucket, DBStatsCompletion.todos, DBStatsCompletion.seconds)
+            )
+        },
+    }
+
+
+def stats_differences(expected, stored):
+    # (table, key, expected, stored) for every summary value that is off
+    differences = []
+    for table in ("counters", "note_days", "completion"):
+        for key in sorted(expected[table].keys() | stored[table].keys()):
+            want, have = expected[table].get(key), stored[table].get(key)
+            if table == "completion" and want is not None and have is not None:
+                # Sums of float seconds may differ in their last digits
+                same = want[0] == have[0] and abs(want[1] - have[1]) < 1e-3 * max(1.0, abs(want[1]))
+            else:
+                same = want == have
+            if not same:
+                differences.append((table, key, want, have))
+    return differences
+
+
+def rebuild_stats(connection):
+    expected = compute_stats(connection)
+    connection.execute(DBStatsCounter.__table__.delete())
+    connection.execute(DBStatsCounter.__table__.insert(), [
+        {"name": name, "value": value} for name, value in expected["counters"].items()
+    ])
+    connection.execute(DBStatsNoteDay.__table__.delete())
+    if expected["note_days"]:
+        connection.execute(DBStatsNoteDay.__table__.insert(), [
+            {"day": day, "notes": notes} for day, notes in expected["note_days"].items()
+        ])
+    connection.execute(DBStatsCompletion.__table__.delete())
+    connection.execute(DBStatsCompletion.__table__.insert(), [
+        {"bucket": bucket, "todos": todos, "seconds": seconds}
+        for bucket, (todos, seconds) in expected["completion"].items()
+    ])
+
+
+@stats_router.get('/stats')
+def get_stats(
+    # Days of notes_per_day, ending today
+    days: int = Query(30, ge=1, le=3660),
+    db: Session = Depends(get_db)
+):
+    counters = dict(db.query(DBStatsCounter.name, DBStatsCounter.value).all())
+    since = date.today() - timedelta(days=days - 1)
+    note_days = db.query(DBStatsNoteDay.day, DBStatsNoteDay.notes).filter(
+        DBStatsNoteDay.day >= since, DBStatsNoteDay.notes != 0
+    ).order_by(DBStatsNoteDay.day).all()
+    buckets = db.query(DBStatsCompletion.bucket, DBStatsCompletion.todos, DBStatsCompletion.seconds).order_by(
+        DBStatsCompletion.bucket
+    ).all()
+
+    notes = counters.get("notes", 0)
+    timed = sum(todos for _, todos, _ in buckets)
+    return {
+        "notes": notes,
+        "pieces": counters.get("pieces", 0),
+        "pieces_per_note": counters.get("pieces", 0) / notes if notes else None,
+        "notes_per_day": [{"day": day, "notes": count} for day, count in note_days],
+        "todos": {"open": counters.get("todos_open", 0), "completed": counters.get("todos_completed", 0)},
+        "completion_time": {
+            # Completed todos with both timestamps
+            "todos": timed,
+            "mean_seconds": sum(seconds for _, _, seconds in buckets) / timed if timed else None,
+            "buckets": [
+                {
+                    "max_seconds": COMPLETION_BUCKETS[bucket] if bucket < len(COMPLETION_BUCKETS) else None,
+                    "todos": todos,
+                }
+                for bucket, todos, _ in buckets
+            ],
+        },
+    }
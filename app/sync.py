@@ -0,0 +1,72 @@
+from typing import Optional
+
+from fastapi import APIRouter, Depends, Query
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from .database import DBNote, DBPiece, DBSyncState, DBTodo, DBTombstone, begin_snapshot
+from .dependencies import get_db
+
+# Delta sync for offline clients. The token is the sync version the response
+# was read at (see stamp_sync_versions in app/database.py): every row and
+# tombstone above the client's token is exactly what it has not seen yet, so
+# the payload grows with the amount of change and not with the corpus.
+# Tombstones are only kept for NOTES_TOMBSTONE_RETENTION_DAYS: a token older
+# than the pruned ones gets a full sync.
+
+sync_router = APIRouter()
+
+
+@sync_router.get('/sync')
+def sync(since: Optional[int] = Query(None, ge=0), db: Session = Depends(get_db)):
+    # All reads share one snapshot, so the token and the rows agree
+    begin_snapshot(db)
+    token, horizon = db.query(DBSyncState.version, DBSyncState.pruned_version).first() or (0, 0)
+    # A token from the future belongs to another database, and one below the
+    # horizon may have missed deletions whose tombstones are gone: start over
+    if since is not None and not horizon <= since <= token:
+        since = None
+    full = since is None
+    since = since or 0
+
+    notes = db.execute(
+        select(DBNote.id, DBNote.creation_timestamp, DBNote.last_update_timestamp, DBNote.version)
+        .where(DBNote.version > since)
+        .order_by(DBNote.id)
+    )
+    pieces = db.execute(
+        select(DBPiece.id, DBPiece.note_id, DBPiece.position, DBPiece.text, DBPiece.timestamp, DBPiece.version)
+        .where(DBPiece.version > since)
+        .order_by(DBPiece.note_id, DBPiece.position, DBPiece.id)
+    )
+    todos = db.execute(
+        select(DBTodo.id, DBTodo.text, DBTodo.timestamp, DBTodo.completed, DBTodo.completion_timestamp,
+               DBTodo.last_update_timestamp, DBTodo.version)
+        .where(DBTodo.version > since)
+        .order_by(DBTodo.id)
+    )
+    payload = {
+        "token": token,
+        # A full sync replaces everything the client has
+        "full": full,
+        "notes": [row._asdict() for row in notes],
+        "pieces": [row._asdict() for row in pieces],
+        "todos": [row._asdict() for row in todos],
+        "deleted": {"notes": [], "pieces": [], "todos": []},
+    }
+
+    if not full:
+        # Ids are never reused (see the models), so a tombstone never names a
+        # row that exists again. Pieces of a deleted note are not listed: the
+        # note's tombstone covers them.
+        tombstones = db.execute(
+            select(DBTombstone.entity, DBTombstone.entity_id)
+            .where(DBTombstone.version > since)
+            .order_by(DBTombstone.version)
+        )
+        deleted = {entity: set() for entity in ("note", "piece", "todo")}
+        for entity, entity_id in tombstones:
+            deleted[entity].add(entity_id)
+        payload["deleted"] = {f"{entity}s": sorted(ids) for entity, ids in deleted.items()}
+
+    return payload
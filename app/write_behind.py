@@ -0,0 +1,176 @@
+import logging
+import threading
+import time
+from typing import Callable, Optional
+
+from fastapi import Depends
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from .config import ASYNC_DATABASE, WRITE_BEHIND, WRITE_BEHIND_INTERVAL_MS, WRITE_BEHIND_MAX_PENDING
+from .database import begin_write
+from .dependencies import get_db
+
+logger = logging.getLogger(__name__)
+
+# Write-behind for the high-frequency updates (note autosaves, todo toggles).
+#
+# With NOTES_WRITE_BEHIND on, those handlers validate the request, queue the
+# update and answer 202 without waiting for a commit. Queued updates to the
+# same note or todo are coalesced, and a background thread writes them all in
+# one transaction every NOTES_WRITE_BEHIND_INTERVAL_MS, or as soon as
+# NOTES_WRITE_BEHIND_MAX_PENDING of them are waiting.
+#
+# Any other session settles the queue when it begins: whatever is pending is
+# written first, so reads (from this client or any other) see every
+# acknowledged update, and a delete can never be overtaken by an update
+# queued before it. Shutdown drains the queue. Queued updates only live in
+# the worker's memory: with several workers a read served by another one sees
+# them after the next flush, and a crash loses what was not flushed yet.
+
+
+class WriteBehindKind:
+    # How to write and coalesce the queued updates of one kind of entity.
+    # apply(db, entity_id, payload) writes one update in the flush transaction,
+    # merge(older, newer) folds two queued payloads into one (the newer one
+    # replaces the older without it), invalidate(entity_id) runs after commit.
+    def __init__(self, name: str, apply: Callable, merge: Optional[Callable] = None,
+                 invalidate: Optional[Callable] = None):
+        self.name = name
+        self.apply = apply
+        self.merge = merge
+        self.invalidate = invalidate
+
+    def combine(self, older, newer):
+        return self.merge(older, newer) if self.merge is not None else newer
+
+
+class WriteBehindQueue:
+    def __init__(self, enabled: bool = False, interval_ms: int = WRITE_BEHIND_INTERVAL_MS,
+                 max_pending: int = WRITE_BEHIND_MAX_PENDING):
+        self.enabled = enabled
+        self.interval = interval_ms / 1000
+        self.max_pending = max_pending
+        # (kind, entity id) -> payload, in submission order
+        self.pending = {}
+        self.bind = None
+        self.submitted = 0
+        self.coalesced = 0
+        self.flushes = 0
+        # Set while a taken batch is not written yet
+        self.flushing = False
+        self._lock = threading.Lock()
+        # Held for the whole of a flush, so settling waits for one in progress
+        self._flush_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopping = False
+        self._thread = None
+
+    def submit(self, bind, kind: WriteBehindKind, entity_id: int, payload):
+        with self._lock:
+            # Flushes use the engine the requests use
+            self.bind = bind
+            key = (kind, entity_id)
+            previous = self.pending.pop(key, None)
+            if previous is not None:
+                payload = kind.combine(previous, payload)
+                self.coalesced += 1
+            self.pending[key] = payload
+            self.submitted += 1
+            full = len(self.pending) >= self.max_pending
+        if full:
+            self._wakeup.set()
+
+    def flush(self) -> int:
+        # Writes everything queued so far in one transaction; returns how many
+        # updates were written. On failure they go back in the queue.
+        with self._flush_lock:
+            with self._lock:
+                batch, self.pending = self.pending, {}
+                bind = self.bind
+                self.flushing = bool(batch)
+            if not batch:
+                return 0
+            try:
+                with Session(bind=bind, info={"write_behind": True}) as db:
+                    begin_write(db)
+                    for (kind, entity_id), payload in batch.items():
+                        kind.apply(db, entity_id, payload)
+                    db.commit()
+            except Exception:
+                self._requeue(batch)
+                self.flushing = False
+                raise
+            self.flushes += 1
+            for kind, entity_id in batch:
+                if kind.invalidate is not None:
+                    kind.invalidate(entity_id)
+            self.flushing = False
+        return len(batch)
+
+    def _requeue(self, batch):
+        with self._lock:
+            newer, self.pending = self.pending, dict(batch)
+            for key, payload in newer.items():
+                if key in self.pending:
+                    payload = key[0].combine(self.pending.pop(key), payload)
+                self.pending[key] = payload
+
+    def settle(self):
+        # Also waits for a flush in progress: its updates were acknowledged too
+        if self.pending or self.flushing:
+            self.flush()
+
+    def start(self):
+        if self.enabled and self._thread is None:
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stopping:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+            try:
+                self.flush()
+            except Exception:
+                logger.exception("Write-behind flush failed, %d updates kept for the next one", len(self.pending))
+
+    def stop(self, attempts: int = 10):
+        # Drains the queue: the thread finishes its flush, then whatever is
+        # left is written here, retrying while the database is busy
+        if self._thread is not None:
+            self._stopping = True
+            self._wakeup.set()
+            self._thread.join()
+            self._thread = None
+        for attempt in range(attempts):
+            try:
+                self.flush()
+                return
+            except Exception:
+                logger.exception("Write-behind drain failed (attempt %d of %d)", attempt + 1, attempts)
+                time.sleep(self.interval)
+        if self.pending:
+            logger.error("Write-behind queue not drained, %d updates lost", len(self.pending))
+
+
+# The async request path keeps writing synchronously
+write_behind_queue = WriteBehindQueue(enabled=WRITE_BEHIND and not ASYNC_DATABASE)
+
+
+@event.listens_for(Session, "after_begin")
+def settle_before_other_sessions(session, transaction, connection):
+    if (write_behind_queue.pending or write_behind_queue.flushing) and not session.info.get("write_behind"):
+        write_behind_queue.settle()
+
+
+# Dependency for the handlers that can queue their update: with write-behind
+# off it is get_write_db, with it on the session only validates the request,
+# and must not settle the queue it is about to add to
+def get_write_behind_db(db: Session = Depends(get_db)):
+    if write_behind_queue.enabled:
+        db.info["write_behind"] = True
+    else:
+        begin_write(db)
+    return db
@@ -0,0 +1,143 @@
+"""Requests per second of the sync and async request paths under concurrent load.
+
+Each mode is served by a separate uvicorn process on a scratch database file,
+then hammered by concurrent httpx clients issuing a mix of single-note reads,
+paginated list reads and note updates.
+
+    python -m benchmarks.bench_async --concurrency 64 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PORT = 5099
+
+
+def build_app():
+    # uvicorn factory: the notes/todos routers selected by BENCH_MODE, bound to BENCH_DB
+    from fastapi import FastAPI
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.database import Base
+    from app.dependencies import get_async_db, get_db
+
+    database_path = os.environ["BENCH_DB"]
+    engine = create_engine(
+        f"sqlite:///{database_path}", connect_args={"check_same_thread": False}
+    )
+    Base.metadata.create_all(bind=engine)
+    app = FastAPI()
+
+    if os.environ["BENCH_MODE"] == "async":
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+        from app.async_routes import notes_router, todos_router
+
+        async_engine = create_async_engine(f"sqlite+aiosqlite:///{database_path}")
+        AsyncBenchSession = async_sessionmaker(async_engine, autoflush=False)
+
+        async def bench_get_async_db():
+            async with AsyncBenchSession() as db:
+                yield db
+
+        app.dependency_overrides[get_async_db] = bench_get_async_db
+    else:
+        from app.routes import notes_router, todos_router
+
+        BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        def bench_get_db():
+            db = BenchSession()
+            try:
+                yield db
+            finally:
+                db.close()
+
+        app.dependency_overrides[get_db] = bench_get_db
+
+    app.include_router(notes_router)
+    app.include_router(todos_router)
+    return app
+
+
+def start_server(mode: str, database_path: str):
+    env = dict(os.environ, BENCH_MODE=mode, BENCH_DB=database_path)
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.bench_async:build_app", "--factory",
+         "--port", str(PORT), "--log-level", "warning"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/notes", params={"limit": 1})
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+async def client_loop(client, note_ids, deadline, write_ratio, counts):
+    while time.perf_counter() < deadline:
+        roll = random.random()
+        if roll < write_ratio:
+            note_id = random.choice(note_ids)
+            await client.put(f"/notes/{note_id}", json={"pieces": [{"text": f"edit {roll}"}]})
+        elif roll < 0.5:
+            await client.get("/notes", params={"limit": 20})
+        else:
+            await client.get(f"/notes/{random.choice(note_ids)}")
+        counts[0] += 1
+
+
+async def run_load(note_ids, concurrency, duration, write_ratio):
+    counts = [0]
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits) as client:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(*(
+            client_loop(client, note_ids, deadline, write_ratio, counts)
+            for _ in range(concurrency)
+        ))
+    return counts[0] / duration
+
+
+def run_mode(mode, args):
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, "bench.db")
+        server = start_server(mode, database_path)
+        try:
+            note_ids = []
+            with httpx.Client(base_url=f"http://127.0.0.1:{PORT}") as client:
+                for i in range(args.notes):
+                    pieces = [{"text": f"note {i} piece {j}"} for j in range(args.pieces)]
+                    note_ids.append(client.post("/notes", json={"pieces": pieces}).json()["note_id"])
+            return asyncio.run(run_load(note_ids, args.concurrency, args.duration, args.write_ratio))
+        finally:
+            server.terminate()
+            server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--pieces", type=int, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--write-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    for mode in ("sync", "async"):
+        rps = run_mode(mode, args)
+        print(f"{mode:>5}: {rps:8.1f} requests/s")
+
+
+if __name__ == "__main__":
+    main()
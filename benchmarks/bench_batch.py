@@ -0,0 +1,68 @@
+"""Creating todos one request at a time versus through POST /todos/batch.
+
+Every single-todo request is its own transaction, so on a file database each
+one pays for a commit; the batch endpoint applies all of them in one.
+
+    python -m benchmarks.bench_batch --todos 1000 --profile production
+"""
+import argparse
+import os
+import tempfile
+import time
+
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base
+from app.dependencies import get_db
+from app.sqlite_pragmas import PROFILES, install_pragmas, resolve_pragmas
+from main import app
+
+
+def timed(function):
+    started = time.perf_counter()
+    function()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--todos", type=int, default=1000)
+    parser.add_argument("--profile", choices=sorted(PROFILES), default="production")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            connect_args={"check_same_thread": False},
+        )
+        install_pragmas(engine, resolve_pragmas(args.profile, environ={}))
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        def override_get_db():
+            with Session() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = override_get_db
+        client = TestClient(app)
+
+        def individual():
+            for i in range(args.todos):
+                client.post("/todos/", json={"text": f"todo {i}"})
+
+        def batch():
+            client.post("/todos/batch", json={"operations": [
+                {"op": "create", "text": f"todo {i}"} for i in range(args.todos)
+            ]})
+
+        print(f"== {args.todos} todos, profile {args.profile}")
+        for name, function in (("individual requests", individual), ("one batch request", batch)):
+            elapsed = timed(function)
+            print(f"{name:>20}: {elapsed * 1000:9.1f} ms  ({elapsed / args.todos * 1e6:7.1f} us per todo)")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
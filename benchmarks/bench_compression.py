@@ -0,0 +1,108 @@
+"""End-to-end latency and CPU cost of response compression by payload size.
+
+Payloads are /notes-style JSON built from the corpus vocabulary. Each one is
+served by a minimal ASGI app behind CompressionMiddleware and fetched in
+process through httpx, which decodes the body like a real client would, so
+the timings cover compressing on the server and decompressing on the client.
+Against those, the time the bytes would spend on the wire is estimated at
+--bandwidth Mbit/s: compression pays off wherever the transfer time it saves
+is larger than the CPU time it adds.
+
+    python -m benchmarks.bench_compression --sizes 1000,100000,4000000 --bandwidth 20
+"""
+import argparse
+import asyncio
+import random
+import time
+
+import httpx
+
+from app.compression import CompressionMiddleware, brotli
+from app.metrics import MetricsRegistry
+from app.responses import encode_json
+from benchmarks.corpus import sentence
+
+DEFAULT_SIZES = "1000,10000,100000,1000000,4000000"
+
+
+def make_payload(size, seed=0):
+    # Notes with pieces, as /notes returns them, grown to about `size` bytes
+    rng = random.Random(seed)
+    notes = []
+    total = 2
+    while total < size:
+        note = {
+            "id": len(notes) + 1,
+            "creation_timestamp": "2024-01-01T10:00:00",
+            "last_update_timestamp": "2024-01-02T10:00:00",
+            "pieces": [{"id": i, "text": sentence(rng), "timestamp": "2024-01-01T10:00:00"} for i in range(20)],
+        }
+        notes.append(note)
+        total += len(encode_json(note)) + 1
+    return encode_json(notes)
+
+
+def payload_app(payload):
+    async def app(scope, receive, send):
+        await send({
+            "type": "http.response.start", "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(payload)).encode())],
+        })
+        await send({"type": "http.response.body", "body": payload})
+
+    return app
+
+
+def configurations():
+    yield "identity", None, {}
+    for level in (1, 6, 9):
+        yield f"gzip-{level}", "gzip", {"gzip_level": level}
+    if brotli is not None:
+        for quality in (1, 4, 11):
+            yield f"br-{quality}", "br", {"brotli_quality": quality}
+
+
+async def measure(payload, encoding, options, requests):
+    app = CompressionMiddleware(payload_app(payload), minimum_size=0, registry=MetricsRegistry(), **options)
+    headers = {"Accept-Encoding": encoding or "identity"}
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        response = await client.get("/", headers=headers)
+        assert response.content == payload
+        wire_size = len(response.content) if encoding is None else int(response.headers["content-length"])
+
+        wall_started = time.perf_counter()
+        cpu_started = time.process_time()
+        for _ in range(requests):
+            await client.get("/", headers=headers)
+        wall = (time.perf_counter() - wall_started) / requests
+        cpu = (time.process_time() - cpu_started) / requests
+    return wire_size, wall, cpu
+
+
+async def run(args):
+    bytes_per_second = args.bandwidth * 1_000_000 / 8
+    if brotli is None:
+        print("brotli is not installed: gzip only")
+    print(f"{'payload':>10} {'encoding':>9} {'wire':>10} {'ratio':>6} {'latency ms':>11} {'cpu ms':>8} "
+          f"{'transfer ms':>12} {'total ms':>9}")
+    for size in (int(size) for size in args.sizes.split(",")):
+        payload = make_payload(size)
+        # Fewer requests for the big payloads keeps each row to a few seconds
+        requests = max(3, min(args.requests, args.requests * 100000 // len(payload)))
+        for name, encoding, options in configurations():
+            wire_size, wall, cpu = await measure(payload, encoding, options, requests)
+            transfer = wire_size / bytes_per_second
+            print(f"{len(payload):>10} {name:>9} {wire_size:>10} {len(payload) / wire_size:>6.1f} "
+                  f"{wall * 1000:>11.2f} {cpu * 1000:>8.2f} {transfer * 1000:>12.2f} {(wall + transfer) * 1000:>9.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="comma-separated payload sizes in bytes")
+    parser.add_argument("--requests", type=int, default=200, help="requests per measurement for small payloads")
+    parser.add_argument("--bandwidth", type=float, default=20, help="link speed for the transfer estimate, Mbit/s")
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
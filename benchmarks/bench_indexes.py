@@ -0,0 +1,96 @@
+"""Query plans and latency of the hot queries before and after the index migrations.
+
+A scratch database is filled, the indexes added by the migrations are dropped
+to get the pre-migration schema, and every query is explained and timed; then
+the schema is upgraded and the same queries are run again.
+
+    python -m benchmarks.bench_indexes --notes 20000 --pieces 20
+"""
+import argparse
+import os
+import random
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert, text
+
+from app.database import Base, DBNote, DBPiece, DBTodo
+from app.migrations import set_version, upgrade_schema
+
+QUERIES = {
+    # get_single_note / update_note / delete_note
+    "pieces of a note": (
+        "SELECT id, text, timestamp FROM pieces WHERE note_id = :note_id ORDER BY position, id",
+        lambda args: {"note_id": random.randint(1, args.notes)},
+    ),
+    # first page of GET /notes
+    "latest notes page": (
+        "SELECT id FROM notes ORDER BY last_update_timestamp DESC, id DESC LIMIT 20",
+        lambda args: {},
+    ),
+    # open todos, oldest first
+    "open todos": (
+        "SELECT id FROM todos WHERE completed = 0 ORDER BY timestamp LIMIT 50",
+        lambda args: {},
+    ),
+}
+
+
+def fill(engine, args):
+    start = datetime(2020, 1, 1)
+    with engine.begin() as connection:
+        connection.execute(insert(DBNote), [
+            {"id": i, "creation_timestamp": start + timedelta(hours=i),
+             "last_update_timestamp": start + timedelta(hours=i, minutes=random.randint(0, 10000))}
+            for i in range(1, args.notes + 1)
+        ])
+        connection.execute(insert(DBPiece), [
+            {"text": f"piece {j}", "timestamp": start, "note_id": random.randint(1, args.notes)}
+            for j in range(args.notes * args.pieces)
+        ])
+        connection.execute(insert(DBTodo), [
+            {"text": f"todo {j}", "timestamp": start + timedelta(hours=j),
+             "completed": random.random() < 0.95, "completion_timestamp": None}
+            for j in range(args.todos)
+        ])
+
+
+def report(engine, args, label):
+    print(f"== {label}")
+    with engine.connect() as connection:
+        for name, (query, make_params) in QUERIES.items():
+            plan = connection.execute(text(f"EXPLAIN QUERY PLAN {query}"), make_params(args)).all()
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                connection.execute(text(query), make_params(args)).all()
+            elapsed = (time.perf_counter() - started) / args.repeat
+            print(f"{name:>20}: {elapsed * 1000:8.3f} ms  | " + "; ".join(row[-1] for row in plan))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=20000)
+    parser.add_argument("--pieces", type=int, default=20)
+    parser.add_argument("--todos", type=int, default=50000)
+    parser.add_argument("--repeat", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+        upgrade_schema(engine, Base.metadata)
+        with engine.begin() as connection:
+            for index in ("ix_pieces_note_id_position", "ix_notes_last_update_timestamp_id",
+                          "ix_todos_completed_timestamp"):
+                connection.exec_driver_sql(f"DROP INDEX {index}")
+            set_version(connection, 0)
+        fill(engine, args)
+
+        report(engine, args, "before migration")
+        upgrade_schema(engine, Base.metadata)
+        report(engine, args, "after migration")
+        engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+"""Per-request overhead of the metrics middleware and SQL hooks.
+
+Requests go straight into the ASGI app (no sockets) against a scratch SQLite
+database, alternating rounds with metrics on and off; the difference between
+the two is what leaving metrics on in production costs. As that difference
+is small next to the run-to-run noise of whole requests, the middleware
+around an empty ASGI app and the per-statement hooks are also timed alone.
+
+    python -m benchmarks.bench_metrics --requests 2000 --rounds 5
+"""
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+import httpx
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from app.cache import response_cache
+from app.database import Base
+from app.dependencies import get_db
+from app.metrics import (
+    MetricsMiddleware, RequestStats, after_cursor_execute, before_cursor_execute, current_request,
+    install_metrics, record_serialization, registry,
+)
+from main import app
+
+ENDPOINTS = ("/notes/1", "/notes?limit=20", "/todos/")
+
+
+async def run_round(client, path, requests):
+    started = time.perf_counter()
+    for _ in range(requests):
+        await client.get(path)
+    return (time.perf_counter() - started) / requests
+
+
+async def run(args):
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for i in range(50):
+            await client.post("/notes", json={"pieces": [{"text": f"note {i} piece {j}"} for j in range(10)]})
+            await client.post("/todos/", json={"text": f"todo {i}"})
+
+        print(f"== us per request, best of {args.rounds} rounds of {args.requests}")
+        for path in ENDPOINTS:
+            timings = {True: [], False: []}
+            for _ in range(args.rounds):
+                for enabled in (True, False):
+                    registry.enabled = enabled
+                    timings[enabled].append(await run_round(client, path, args.requests))
+            on, off = min(timings[True]), min(timings[False])
+            print(f"{path:>18}: off {off * 1e6:8.1f}  on {on * 1e6:8.1f}  overhead {(on - off) * 1e6:6.1f} "
+                  f"({(on - off) / off * 100:+.1f}%)")
+
+
+async def empty_app(scope, receive, send):
+    await send({"type": "http.response.start", "status": 200, "headers": []})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def time_middleware(iterations):
+    scope = {"type": "http", "method": "GET", "path": "/bench"}
+
+    async def receive():
+        return {"type": "http.request"}
+
+    async def send(message):
+        pass
+
+    timings = {}
+    for name, asgi_app in (("bare", empty_app), ("with middleware", MetricsMiddleware(empty_app))):
+        started = time.perf_counter()
+        for _ in range(iterations):
+            await asgi_app(scope, receive, send)
+        timings[name] = (time.perf_counter() - started) / iterations
+    return timings["with middleware"] - timings["bare"]
+
+
+def time_hooks(iterations):
+    class Connection:
+        info = {}
+
+    connection = Connection()
+    token = current_request.set(RequestStats())
+    try:
+        started = time.perf_counter()
+        for _ in range(iterations):
+            before_cursor_execute(connection, None, "SELECT 1", (), None, False)
+            after_cursor_execute(connection, None, "SELECT 1", (), None, False)
+            record_serialization(0.0, 1)
+        return (time.perf_counter() - started) / iterations
+    finally:
+        current_request.reset(token)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--no-cache", action="store_true", help="disable the response cache")
+    args = parser.parse_args()
+
+    response_cache.enabled = not args.no_cache
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            connect_args={"check_same_thread": False},
+        )
+        install_metrics(engine)
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+        def override_get_db():
+            with Session() as db:
+                yield db
+
+        app.dependency_overrides[get_db] = override_get_db
+        asyncio.run(run(args))
+        engine.dispose()
+
+    registry.enabled = True
+    print("== in isolation")
+    print(f"middleware per request: {asyncio.run(time_middleware(100000)) * 1e6:6.2f} us")
+    print(f"hooks per SQL statement: {time_hooks(100000) * 1e6:6.2f} us")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""Storage growth and read latency of note revision history.
+
+A note of --pieces corpus sentences is autosaved --revisions times through
+the update path (apply_note_update), each save rewriting one piece, with the
+odd piece inserted or deleted, on a fresh SQLite file per snapshot interval
+(--snapshot-every, plus "off": no history, the baseline write cost).
+Compaction stays off so every revision is kept. For each interval the run
+reports:
+
+- bytes stored in note_revisions as the history grows, against full copies
+  of every revision, raw and zlib-compressed;
+- the write latency of a save;
+- the latency of reading random revisions back (load_revision: one snapshot
+  plus the deltas since).
+
+    python -m benchmarks.bench_revisions --pieces 200 --revisions 5000 --snapshot-every 10,50,200
+"""
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+import zlib
+from datetime import datetime
+
+from sqlalchemy.orm import Session
+
+from app import revisions
+from app.database import Base, DBNote, DBNoteRevision
+from app.routes import apply_note_update, new_note
+from benchmarks.corpus import sentence
+from benchmarks.suite import bench_engine
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))] * 1000
+
+
+def run(database_path, args, snapshot_every):
+    revisions.REVISIONS_ENABLED = snapshot_every is not None
+    revisions.REVISION_SNAPSHOT_EVERY = snapshot_every or 1
+    revisions.REVISION_COMPACT_EVERY = 0
+
+    rng = random.Random(0)
+    engine = bench_engine(database_path)
+    Base.metadata.create_all(engine)
+    texts = [sentence(rng) for _ in range(args.pieces)]
+    with Session(engine) as db:
+        note = new_note(texts, datetime.now())
+        db.add(note)
+        db.commit()
+        note_id = note.id
+
+    write_latencies = []
+    full_raw = full_compressed = 0
+    growth = []
+    for save in range(1, args.revisions + 1):
+        roll = rng.random()
+        index = rng.randrange(len(texts))
+        if roll < 0.05:
+            texts.insert(index, sentence(rng))
+        elif roll < 0.08 and len(texts) > 1:
+            del texts[index]
+        else:
+            texts[index] = sentence(rng)
+
+        started = time.perf_counter()
+        with Session(engine) as db:
+            apply_note_update(db, db.get(DBNote, note_id), texts, datetime.now())
+            db.commit()
+        write_latencies.append(time.perf_counter() - started)
+
+        encoded = revisions.dump_json(texts)
+        full_raw += len(encoded)
+        full_compressed += len(zlib.compress(encoded))
+        if save % max(1, args.revisions // 5) == 0:
+            growth.append((save, stored_bytes(engine), full_raw, full_compressed))
+
+    read_latencies = []
+    if snapshot_every is not None:
+        with Session(engine) as db:
+            for rev in (rng.randint(1, args.revisions) for _ in range(args.reads)):
+                started = time.perf_counter()
+                revisions.load_revision(db, note_id, rev)
+                read_latencies.append(time.perf_counter() - started)
+    engine.dispose()
+    return write_latencies, read_latencies, growth
+
+
+def stored_bytes(engine):
+    from sqlalchemy import func, select
+
+    with engine.connect() as connection:
+        return connection.scalar(select(func.coalesce(func.sum(func.length(DBNoteRevision.data)), 0)))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pieces", type=int, default=200)
+    parser.add_argument("--revisions", type=int, default=5000)
+    parser.add_argument("--snapshot-every", default="10,50,200", help="comma-separated snapshot intervals")
+    parser.add_argument("--reads", type=int, default=500, help="random revisions read back")
+    args = parser.parse_args()
+
+    intervals = [None] + [int(every) for every in args.snapshot_every.split(",")]
+    with tempfile.TemporaryDirectory() as directory:
+        for snapshot_every in intervals:
+            label = "off" if snapshot_every is None else f"every {snapshot_every}"
+            database_path = os.path.join(directory, f"revisions-{snapshot_every}.db")
+            write_latencies, read_latencies, growth = run(database_path, args, snapshot_every)
+
+            print(f"snapshots {label}: save p50 {percentile(write_latencies, 0.5):.2f} ms, "
+                  f"p99 {percentile(write_latencies, 0.99):.2f} ms")
+            if read_latencies:
+                print(f"  read revision p50 {percentile(read_latencies, 0.5):.2f} ms, "
+                      f"p99 {percentile(read_latencies, 0.99):.2f} ms, "
+                      f"mean {statistics.fmean(read_latencies) * 1000:.2f} ms")
+                for saves, stored, full_raw, full_compressed in growth:
+                    print(f"  {saves:>7} revisions: {stored / 1024:>9.1f} KiB stored, "
+                          f"{stored / saves:>7.0f} B/revision; full copies {full_raw / 1024:>10.1f} KiB raw, "
+                          f"{full_compressed / 1024:>9.1f} KiB zlib")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""Serialization cost of note payloads, reported per 10k pieces.
+
+Compares the ways a /notes response can be produced:
+- FastAPI's default for a returned dict (jsonable_encoder + json.dumps),
+- validating against the NoteOut response model and dumping with pydantic,
+- orjson straight from the dicts (app.responses.encode_json),
+and the two ways of loading the rows: ORM objects with their pieces
+relationship versus plain row tuples (app.routes.serialize_notes).
+
+    python -m benchmarks.bench_serialization --notes 200 --pieces 50
+"""
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine
+from sqlalchemy.orm import selectinload, sessionmaker
+
+from app.database import Base, DBNote, DBPiece
+from app.pieces import POSITION_STEP
+from app.responses import encode_json
+from app.routes import NoteOut, serialize_notes
+
+
+def fastapi_default(payload):
+    return json.dumps(
+        jsonable_encoder(payload), ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+NOTE_LIST = TypeAdapter(List[NoteOut])
+
+
+def response_model(payload):
+    return NOTE_LIST.dump_json(NOTE_LIST.validate_python(payload))
+
+
+def orm_payload(db):
+    notes = db.query(DBNote).options(selectinload(DBNote.pieces)).all()
+    return [
+        {
+            "id": note.id,
+            "creation_timestamp": note.creation_timestamp,
+            "last_update_timestamp": note.last_update_timestamp,
+            "pieces": [
+                {"id": piece.id, "text": piece.text, "timestamp": piece.timestamp}
+                for piece in note.pieces
+            ]
+        } for note in notes
+    ]
+
+
+def tuple_payload(db):
+    rows = db.query(DBNote.id, DBNote.creation_timestamp, DBNote.last_update_timestamp).all()
+    return serialize_notes(db, rows)
+
+
+def timed(function, argument, repeat):
+    started = time.perf_counter()
+    for _ in range(repeat):
+        result = function(argument)
+    return (time.perf_counter() - started) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=200)
+    parser.add_argument("--pieces", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    engine = create_engine("sqlite://")
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine)
+    with Session() as db:
+        for i in range(args.notes):
+            note = DBNote(creation_timestamp=datetime.now(), last_update_timestamp=datetime.now())
+            note.pieces = [
+                DBPiece(text=f"note {i}, piece {j}: " + "lorem ipsum dolor sit amet " * 4,
+                        timestamp=datetime.now(), position=j * POSITION_STEP)
+                for j in range(args.pieces)
+            ]
+            db.add(note)
+        db.commit()
+
+    scale = 10000 / (args.notes * args.pieces)
+
+    print("== loading rows (ms per 10k pieces)")
+    for name, loader in (("ORM objects", orm_payload), ("row tuples", tuple_payload)):
+        with Session() as db:
+            elapsed, payload = timed(loader, db, args.repeat)
+        print(f"{name:>22}: {elapsed * scale * 1000:8.2f}")
+
+    print("== serializing (ms per 10k pieces)")
+    for name, serializer in (
+        ("jsonable_encoder+json", fastapi_default),
+        ("response model", response_model),
+        ("orjson", encode_json),
+    ):
+        elapsed, body = timed(serializer, payload, args.repeat)
+        print(f"{name:>22}: {elapsed * scale * 1000:8.2f}  ({len(body)} bytes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Concurrent read and write throughput of the SQLite pragma profiles.
+
+For every profile in app/sqlite_pragmas.py a scratch database is filled with
+notes, then reader threads load random notes with their pieces while writer
+threads edit pieces and commit, as update_note does.
+
+    python -m benchmarks.bench_sqlite_profiles --readers 8 --writers 2 --duration 5
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from sqlalchemy import create_engine
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import sessionmaker, selectinload
+
+from app.database import Base, DBNote, DBPiece
+from app.pieces import POSITION_STEP
+from app.sqlite_pragmas import PROFILES, install_pragmas, resolve_pragmas
+
+
+def fill(Session, notes, pieces):
+    with Session() as db:
+        for i in range(notes):
+            note = DBNote(creation_timestamp=datetime.now(), last_update_timestamp=datetime.now())
+            note.pieces = [
+                DBPiece(text=f"note {i} piece {j} " * 8, timestamp=datetime.now(), position=j * POSITION_STEP)
+                for j in range(pieces)
+            ]
+            db.add(note)
+        db.commit()
+
+
+def reader(Session, notes, deadline, counts):
+    while time.perf_counter() < deadline:
+        with Session() as db:
+            note = db.query(DBNote).options(selectinload(DBNote.pieces)).filter(
+                DBNote.id == random.randint(1, notes)
+            ).first()
+            [piece.text for piece in note.pieces]
+        counts["reads"] += 1
+
+
+def writer(Session, notes, deadline, counts):
+    while time.perf_counter() < deadline:
+        with Session() as db:
+            try:
+                note_id = random.randint(1, notes)
+                piece = db.query(DBPiece).filter(DBPiece.note_id == note_id).first()
+                piece.text = f"edited {random.random()}"
+                piece.timestamp = datetime.now()
+                db.query(DBNote).filter(DBNote.id == note_id).update(
+                    {DBNote.last_update_timestamp: datetime.now()}
+                )
+                db.commit()
+                counts["writes"] += 1
+            except OperationalError:
+                db.rollback()
+                counts["errors"] += 1
+
+
+def run_profile(profile, args):
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_engine(
+            f"sqlite:///{os.path.join(directory, 'bench.db')}",
+            connect_args={"check_same_thread": False},
+            pool_size=args.readers + args.writers,
+        )
+        install_pragmas(engine, resolve_pragmas(profile, environ={}))
+        Base.metadata.create_all(bind=engine)
+        Session = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+        fill(Session, args.notes, args.pieces)
+
+        counts = {"reads": 0, "writes": 0, "errors": 0}
+        deadline = time.perf_counter() + args.duration
+        threads = [
+            threading.Thread(target=reader, args=(Session, args.notes, deadline, counts))
+            for _ in range(args.readers)
+        ] + [
+            threading.Thread(target=writer, args=(Session, args.notes, deadline, counts))
+            for _ in range(args.writers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        engine.dispose()
+
+    return {name: value / args.duration for name, value in counts.items()}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--pieces", type=int, default=20)
+    parser.add_argument("--readers", type=int, default=8)
+    parser.add_argument("--writers", type=int, default=2)
+    parser.add_argument("--duration", type=float, default=5.0)
+    args = parser.parse_args()
+
+    print(f"{'profile':>10} {'reads/s':>10} {'writes/s':>10} {'errors/s':>10}")
+    for profile in PROFILES:
+        result = run_profile(profile, args)
+        print(f"{profile:>10} {result['reads']:10.1f} {result['writes']:10.1f} {result['errors']:10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,86 @@
+"""Cold import time and time to first request.
+
+Every measurement runs in a fresh interpreter against a scratch database
+given as NOTES_DATABASE_URL:
+
+- importing app.database (the models, what scripts need), and main (the
+  whole app), net of the interpreter's own start-up, and whether the import
+  touched the database file;
+- starting uvicorn on main:create_app and polling until GET /todos/ answers,
+  on a new database (schema created by the lifespan) and on an existing one
+  (schema checked only).
+
+    python -m benchmarks.bench_startup --runs 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+PORT = 5099
+
+
+def run_python(code, env):
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", code], env=env, check=True)
+    return time.perf_counter() - started
+
+
+def import_time(module, env, runs):
+    baseline = statistics.median(run_python("pass", env) for _ in range(runs))
+    return statistics.median(run_python(f"import {module}", env) for _ in range(runs)) - baseline
+
+
+def time_to_first_request(env):
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:create_app", "--factory", "--port", str(PORT), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        while True:
+            try:
+                if httpx.get(f"http://127.0.0.1:{PORT}/todos/").status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            if server.poll() is not None:
+                raise RuntimeError("server exited")
+            time.sleep(0.005)
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, "startup.db")
+        env = dict(os.environ, NOTES_DATABASE_URL=f"sqlite:///{database_path}")
+
+        for module in ("app.database", "main"):
+            seconds = import_time(module, env, args.runs)
+            touched = os.path.exists(database_path)
+            print(f"import {module:<13} {seconds * 1000:8.1f} ms   database touched: {'yes' if touched else 'no'}")
+
+        fresh = []
+        for _ in range(args.runs):
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(database_path + suffix):
+                    os.remove(database_path + suffix)
+            fresh.append(time_to_first_request(env))
+        existing = [time_to_first_request(env) for _ in range(args.runs)]
+        print(f"first request, new database      {statistics.median(fresh) * 1000:8.1f} ms")
+        print(f"first request, existing database {statistics.median(existing) * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+"""Throughput of a mixed read/write workload by uvicorn worker count.
+
+Each worker count gets a fresh copy of a generated corpus and a uvicorn
+server with that many workers, all sharing the one SQLite file. Concurrent
+clients then run for --duration seconds, each request drawn at random from
+the mix below (--write-ratio of them writes). Besides latency and throughput
+the run counts 503s (the write lock stayed busy through every retry) and
+other errors, which should both stay at zero.
+
+    python -m benchmarks.bench_workers --workers 1,2,4 --concurrency 32 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.suite import PORT, Context, bench_engine, get_note, list_notes, start_server, summarize, toggle_todo
+
+READS = (get_note, get_note, list_notes)
+
+
+async def create_note(client, context):
+    return await client.post("/notes", json={"pieces": [{"text": "load test"}, {"text": "another piece"}]})
+
+
+WRITES = (toggle_todo, toggle_todo, create_note)
+
+
+async def run_load(context, args):
+    latencies = []
+    statuses = {}
+    deadline = time.perf_counter() + args.duration
+
+    async def client_loop(client):
+        while time.perf_counter() < deadline:
+            scenario = context.rng.choice(WRITES if context.rng.random() < args.write_ratio else READS)
+            started = time.perf_counter()
+            try:
+                status_code = (await scenario(client, context)).status_code
+            except httpx.TransportError:
+                status_code = "transport error"
+            latencies.append(time.perf_counter() - started)
+            statuses[status_code] = statuses.get(status_code, 0) + 1
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(client_loop(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+
+    errors = sum(count for status_code, count in statuses.items() if status_code == "transport error" or status_code >= 400)
+    result = summarize(latencies, errors, elapsed)
+    result["busy_503"] = statuses.get(503, 0)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", default="1,2,4", help="comma-separated worker counts")
+    parser.add_argument("--pieces", type=int, default=20000)
+    parser.add_argument("--todos", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per worker count")
+    parser.add_argument("--write-ratio", type=float, default=0.2)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, "corpus.db")
+        print(f"Generating a corpus of {args.pieces} pieces and {args.todos} todos", file=sys.stderr)
+        engine = bench_engine(corpus_path)
+        generate_corpus(engine, args.pieces, args.todos)
+        engine.dispose()
+
+        print(f"{'workers':>7} {'requests':>9} {'req/s':>8} {'p50 ms':>8} {'p99 ms':>8} {'503s':>5} {'errors':>6}")
+        for workers in (int(count) for count in args.workers.split(",")):
+            database_path = os.path.join(directory, f"workers-{workers}.db")
+            shutil.copy(corpus_path, database_path)
+            context = Context(database_path)
+            server = start_server(database_path, cache=True, workers=workers)
+            try:
+                result = asyncio.run(run_load(context, args))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{workers:>7} {result['requests']:>9} {result['throughput_rps']:>8.1f} {result['p50_ms']:>8.2f} "
+                  f"{result['p99_ms']:>8.2f} {result['busy_503']:>5} {result['errors']:>6}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,117 @@
+"""Write latency under autosave load, with and without write-behind.
+
+Each of --editors clients keeps one note of the corpus open and autosaves it
+every --autosave-ms (one piece changed each time), and toggles one of its
+todos in between. Both modes run on a fresh copy of the corpus for --duration
+seconds, and report the latency of the writes, the reads issued alongside
+them (--readers clients on GET /notes/{id}), and whether every note ended up
+with the text of its last autosave.
+
+    python -m benchmarks.bench_write_behind --editors 50 --autosave-ms 200 --duration 10
+"""
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import httpx
+
+from benchmarks.corpus import generate_corpus
+from benchmarks.suite import PORT, Context, bench_engine, get_note, start_server, summarize
+
+MODES = {
+    "synchronous": {"NOTES_WRITE_BEHIND": "0"},
+    "write-behind": {"NOTES_WRITE_BEHIND": "1"},
+}
+
+
+async def run_load(context, args):
+    writes, reads = [], []
+    errors = 0
+    last_texts = {}
+    deadline = time.perf_counter() + args.duration
+
+    async def timed(latencies, request):
+        nonlocal errors
+        started = time.perf_counter()
+        try:
+            if (await request).status_code >= 400:
+                errors += 1
+        except httpx.TransportError:
+            errors += 1
+        latencies.append(time.perf_counter() - started)
+
+    async def editor(client, index):
+        note_id = context.note_ids[index % len(context.note_ids)]
+        todo_id, todo_text = context.todos[index % len(context.todos)]
+        texts = [piece["text"] for piece in (await client.get(f"/notes/{note_id}")).json()["pieces"]]
+        saves = 0
+        while time.perf_counter() < deadline:
+            saves += 1
+            texts[saves % len(texts)] = f"editor {index} save {saves}"
+            last_texts[note_id] = list(texts)
+            await timed(writes, client.put(f"/notes/{note_id}", json={"pieces": [{"text": text} for text in texts]}))
+            await timed(writes, client.put(f"/todos/{todo_id}", json={"text": todo_text, "switchCompletion": True}))
+            await asyncio.sleep(args.autosave_ms / 1000)
+
+    async def reader(client):
+        while time.perf_counter() < deadline:
+            await timed(reads, get_note(client, context))
+
+    limits = httpx.Limits(max_connections=args.editors + args.readers)
+    async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{PORT}", limits=limits, timeout=30) as client:
+        started = time.perf_counter()
+        await asyncio.gather(
+            *(editor(client, index) for index in range(args.editors)),
+            *(reader(client) for _ in range(args.readers)),
+        )
+        elapsed = time.perf_counter() - started
+
+        # Read-your-writes: every note reads back as last saved
+        lost = 0
+        for note_id, texts in last_texts.items():
+            stored = [piece["text"] for piece in (await client.get(f"/notes/{note_id}")).json()["pieces"]]
+            lost += stored != texts
+
+    return summarize(writes, errors, elapsed), summarize(reads or [0], 0, elapsed), lost
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pieces", type=int, default=20000)
+    parser.add_argument("--todos", type=int, default=2000)
+    parser.add_argument("--editors", type=int, default=50)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--autosave-ms", type=float, default=200)
+    parser.add_argument("--duration", type=float, default=10, help="seconds per mode")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        corpus_path = os.path.join(directory, "corpus.db")
+        print(f"Generating a corpus of {args.pieces} pieces and {args.todos} todos", file=sys.stderr)
+        engine = bench_engine(corpus_path)
+        generate_corpus(engine, args.pieces, args.todos)
+        engine.dispose()
+
+        print(f"{'mode':>12} {'writes':>7} {'write p50':>10} {'write p99':>10} {'read p50':>9} {'read p99':>9} "
+              f"{'errors':>6} {'stale':>5}")
+        for mode, settings in MODES.items():
+            database_path = os.path.join(directory, f"{mode}.db")
+            shutil.copy(corpus_path, database_path)
+            context = Context(database_path)
+            server = start_server(database_path, cache=True, settings=settings)
+            try:
+                write_result, read_result, lost = asyncio.run(run_load(context, args))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{mode:>12} {write_result['requests']:>7} {write_result['p50_ms']:>10.2f} "
+                  f"{write_result['p99_ms']:>10.2f} {read_result['p50_ms']:>9.2f} {read_result['p99_ms']:>9.2f} "
+                  f"{write_result['errors']:>6} {lost:>5}")
+
+
+if __name__ == "__main__":
+    main()
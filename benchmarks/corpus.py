@@ -0,0 +1,170 @@
+"""Generate a realistic notes database for benchmarking.
+
+Pieces are short sentences drawn from a Zipf-weighted vocabulary, so search
+terms have realistic frequencies; the number of pieces per note follows a
+configurable distribution (a lognormal one by default: most notes are short,
+a few are very long). Rows go in with executemany inserts in a single
+transaction; a million pieces, full-text indexing included, take a minute or two.
+
+    python -m benchmarks.corpus --pieces 1000000 --todos 100000 --output corpus.db
+"""
+import argparse
+import math
+import random
+import zipfile
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, insert
+
+from app.database import Base, DBNote, DBPiece, DBTodo
+from app.migrations import upgrade_schema
+from app.pieces import POSITION_STEP
+
+VOCABULARY = (
+    "the of and to in is it that for on was with as be at this have from or by not but what all "
+    "were when we there can an your which their said if do will each about how up out them then "
+    "she many some so these would other into has more her two like him see time could no make "
+    "than first been its who now people my made over did down only way find use may water long "
+    "little very after words called just where most know get through back much before go good new "
+    "write our used me man too any day same right look think also around another came come work "
+    "three word must because does part even place well such here take why things help put years "
+    "different away again off went old number great tell men say small every found still between "
+    "name should home big give air line set own under read last never us left end along while "
+    "might next sound below saw something thought both few those always looked show large often "
+    "together asked house world going want school important until form food keep children feet "
+    "land side without boy once animals life enough took sometimes four head above kind began "
+    "almost live page got earth need far hand high year mother light parts country father let "
+    "night following picture being study second eyes soon times story boys since white days ever "
+    "paper hard near sentence better best across during today others however sure means knew "
+    "groceries meeting plumber invoice garden birthday dentist train budget recipe holiday"
+).split()
+# Zipf weights: the n-th word is 1/n as frequent as the first
+WEIGHTS = [1 / rank for rank in range(1, len(VOCABULARY) + 1)]
+
+DISTRIBUTIONS = ("lognormal", "uniform", "fixed")
+CHUNK_SIZE = 10000
+
+
+def sentence(rng, words=None):
+    return " ".join(rng.choices(VOCABULARY, WEIGHTS, k=words or rng.randint(4, 24))).capitalize()
+
+
+def pieces_per_note(rng, distribution, mean):
+    if distribution == "fixed":
+        return mean
+    if distribution == "uniform":
+        return rng.randint(1, 2 * mean - 1)
+    # lognormal with the requested mean and a long tail
+    sigma = 1.0
+    return max(1, round(rng.lognormvariate(math.log(mean) - sigma ** 2 / 2, sigma)))
+
+
+def generate_corpus(engine, pieces, todos, distribution="lognormal", mean_pieces=20, seed=0):
+    # Fills an empty database (schema created and stamped at head); returns a summary
+    upgrade_schema(engine, Base.metadata)
+    rng = random.Random(seed)
+    start = datetime(2022, 1, 1)
+    span = 2 * 365 * 24 * 3600
+
+    note_sizes = []
+    total = 0
+    while total < pieces:
+        note_sizes.append(pieces_per_note(rng, distribution, mean_pieces))
+        total += note_sizes[-1]
+    if note_sizes:
+        note_sizes[-1] -= total - pieces
+
+    with engine.begin() as connection:
+        notes = []
+        for note_id in range(1, len(note_sizes) + 1):
+            created = start + timedelta(seconds=rng.randint(0, span))
+            updated = created + timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+            notes.append({"id": note_id, "creation_timestamp": created, "last_update_timestamp": updated})
+        if notes:
+            connection.execute(insert(DBNote), notes)
+
+        piece_rows = []
+        for note, size in zip(notes, note_sizes):
+            piece_rows.extend(
+                {"text": sentence(rng), "timestamp": note["creation_timestamp"], "note_id": note["id"],
+                 "position": i * POSITION_STEP}
+                for i in range(size)
+            )
+            if len(piece_rows) >= CHUNK_SIZE:
+                connection.execute(insert(DBPiece), piece_rows)
+                piece_rows = []
+        if piece_rows:
+            connection.execute(insert(DBPiece), piece_rows)
+
+        for chunk_start in range(0, todos, CHUNK_SIZE):
+            todo_rows = []
+            for _ in range(chunk_start, min(todos, chunk_start + CHUNK_SIZE)):
+                created = start + timedelta(seconds=rng.randint(0, span))
+                completed = rng.random() < 0.7
+                completion = created + timedelta(hours=rng.randint(1, 24 * 14)) if completed else None
+                todo_rows.append({
+                    "text": sentence(rng, rng.randint(2, 8)), "timestamp": created, "completed": completed,
+                    "completion_timestamp": completion, "last_update_timestamp": completion or created,
+                })
+            connection.execute(insert(DBTodo), todo_rows)
+
+    largest = max(range(len(note_sizes)), key=note_sizes.__getitem__, default=-1)
+    return {
+        "notes": len(note_sizes),
+        "pieces": pieces,
+        "todos": todos,
+        "distribution": distribution,
+        "mean_pieces": mean_pieces,
+        "largest_note": {"id": largest + 1, "pieces": note_sizes[largest] if note_sizes else 0},
+        "seed": seed,
+    }
+
+
+ODT_CONTENT = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content
+    xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+    xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">
+<office:body><office:text>
+{paragraphs}
+</office:text></office:body></office:document-content>
+"""
+
+
+def write_odt(path, notes, mean_pieces=20, distribution="lognormal", start=datetime(2024, 1, 1), seed=0):
+    # An export in the format scripts/include_from_odt.py reads: a '#<n> <date>'
+    # header per note, then its pieces and TODO:/DONE: lines
+    rng = random.Random(seed)
+    paragraphs = []
+    for i in range(notes):
+        timestamp = start + timedelta(minutes=i)
+        paragraphs.append(f"#{i + 1} {timestamp.strftime('%A, %d %B %Y %H:%M:%S')}")
+        for _ in range(pieces_per_note(rng, distribution, mean_pieces)):
+            paragraphs.append(sentence(rng))
+        if rng.random() < 0.3:
+            paragraphs.append(("DONE:" if rng.random() < 0.5 else "TODO:") + sentence(rng, 3))
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/vnd.oasis.opendocument.text")
+        archive.writestr("content.xml", ODT_CONTENT.format(
+            paragraphs="\n".join(f"<text:p>{paragraph}</text:p>" for paragraph in paragraphs)
+        ))
+    return str(path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--pieces", type=int, default=100000)
+    parser.add_argument("--todos", type=int, default=10000)
+    parser.add_argument("--distribution", choices=DISTRIBUTIONS, default="lognormal")
+    parser.add_argument("--mean-pieces", type=int, default=20, help="mean pieces per note")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", required=True, help="database file to create")
+    args = parser.parse_args()
+
+    engine = create_engine(f"sqlite:///{args.output}")
+    summary = generate_corpus(engine, args.pieces, args.todos, args.distribution, args.mean_pieces, args.seed)
+    engine.dispose()
+    print(summary)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,355 @@
+"""Standard benchmark scenarios on a generated corpus, with JSON results.
+
+Scenarios: list_notes, get_note, update_large_note, toggle_todo, search and
+import. They run against a file-backed copy of a corpus from
+benchmarks/corpus.py, either in-process (requests go straight into the ASGI
+app) or against a uvicorn server, with --concurrency clients in both cases.
+Results are written as JSON, tagged with the git commit, and --compare
+reports (and fails on) regressions against an earlier results file.
+
+    python -m benchmarks.suite --pieces 100000 --todos 10000 --output results.json
+    python -m benchmarks.suite --corpus corpus.db --mode uvicorn --concurrency 16 --compare results.json
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import httpx
+
+from benchmarks.corpus import VOCABULARY, generate_corpus, write_odt
+
+PORT = 5098
+SCENARIOS = ("list_notes", "get_note", "update_large_note", "toggle_todo", "search", "import")
+
+
+def bench_engine(database_path):
+    from sqlalchemy import create_engine
+
+    from app.database import SQLITE_PRAGMAS
+    from app.sqlite_pragmas import install_pragmas
+
+    engine = create_engine(f"sqlite:///{database_path}", connect_args={"check_same_thread": False})
+    install_pragmas(engine, SQLITE_PRAGMAS)
+    return engine
+
+
+def build_app(database_path=None):
+    # The full application with its sessions bound to the corpus; also the
+    # uvicorn factory, reading the database path from BENCH_DB
+    from sqlalchemy.orm import sessionmaker
+
+    from app.dependencies import get_db
+    from main import app
+
+    BenchSession = sessionmaker(autocommit=False, autoflush=False, bind=bench_engine(
+        database_path or os.environ["BENCH_DB"]
+    ))
+
+    def bench_get_db():
+        db = BenchSession()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = bench_get_db
+    return app
+
+
+class Context:
+    # What the scenarios pick their targets from, read once from the corpus
+    def __init__(self, database_path, seed=0):
+        self.rng = random.Random(seed)
+        with sqlite3.connect(database_path) as connection:
+            self.note_ids = [row[0] for row in connection.execute("SELECT id FROM notes")]
+            self.todos = connection.execute(
+                "SELECT id, text FROM todos ORDER BY random() LIMIT 1000"
+            ).fetchall()
+            self.large_note_id, = connection.execute(
+                "SELECT note_id FROM pieces GROUP BY note_id ORDER BY count(*) DESC LIMIT 1"
+            ).fetchone()
+            self.large_note_texts = [row[0] for row in connection.execute(
+                "SELECT text FROM pieces WHERE note_id = ? ORDER BY position, id", (self.large_note_id,)
+            )]
+        self.search_words = VOCABULARY[:100]
+        self.edits = 0
+
+
+async def list_notes(client, context):
+    return await client.get("/notes", params={"limit": 50})
+
+
+async def get_note(client, context):
+    return await client.get(f"/notes/{context.rng.choice(context.note_ids)}")
+
+
+async def update_large_note(client, context):
+    # One piece in the middle of the largest note changes each time
+    context.edits += 1
+    texts = list(context.large_note_texts)
+    texts[len(texts) // 2] = f"edited {context.edits}"
+    return await client.put(
+        f"/notes/{context.large_note_id}", json={"pieces": [{"text": text} for text in texts]}
+    )
+
+
+async def toggle_todo(client, context):
+    todo_id, text = context.rng.choice(context.todos)
+    return await client.put(f"/todos/{todo_id}", json={"text": text, "switchCompletion": True})
+
+
+async def search(client, context):
+    return await client.get("/search", params={"q": context.rng.choice(context.search_words)})
+
+
+REQUEST_SCENARIOS = {
+    "list_notes": list_notes,
+    "get_note": get_note,
+    "update_large_note": update_large_note,
+    "toggle_todo": toggle_todo,
+    "search": search,
+}
+
+
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(fraction):
+        return latencies[min(len(latencies) - 1, int(fraction * len(latencies)))] * 1000
+
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "p50_ms": percentile(0.50),
+        "p95_ms": percentile(0.95),
+        "p99_ms": percentile(0.99),
+        "throughput_rps": len(latencies) / elapsed,
+    }
+
+
+async def run_requests(client, scenario, context, requests, concurrency, warmup=10):
+    for _ in range(warmup):
+        await scenario(client, context)
+
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            response = await scenario(client, context)
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+
+def run_import(database_path, directory, imports, notes):
+    # scripts/include_from_odt.py on fresh exports; not an HTTP path, so it
+    # runs in this process whatever the mode
+    from sqlalchemy.orm import Session
+
+    from scripts.include_from_odt import process_odt
+
+    paths = [
+        write_odt(os.path.join(directory, f"import-{i}.odt"), notes, start=datetime(2030, 1, 1) + timedelta(days=i), seed=i)
+        for i in range(imports)
+    ]
+    engine = bench_engine(database_path)
+    latencies = []
+    errors = 0
+    started = time.perf_counter()
+    for path in paths:
+        import_started = time.perf_counter()
+        with Session(bind=engine) as db:
+            counts = process_odt(path, db)
+        latencies.append(time.perf_counter() - import_started)
+        errors += counts["imported"] != notes
+    result = summarize(latencies, errors, time.perf_counter() - started)
+    engine.dispose()
+    result["notes_per_import"] = notes
+    return result
+
+
+def start_server(database_path, cache, workers=1, settings=None):
+    # settings: extra NOTES_* environment variables for the server
+    env = dict(
+        os.environ, BENCH_DB=database_path, NOTES_DATABASE_URL=f"sqlite:///{database_path}",
+        NOTES_CACHE_ENABLED="1" if cache else "0", **(settings or {}),
+    )
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.suite:build_app", "--factory",
+         "--port", str(PORT), "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    for _ in range(100):
+        try:
+            httpx.get(f"http://127.0.0.1:{PORT}/notes", params={"limit": 1})
+            return server
+        except httpx.TransportError:
+            time.sleep(0.1)
+    server.kill()
+    raise RuntimeError("server did not start")
+
+
+async def run_scenarios(client, names, context, args):
+    results = {}
+    for name in names:
+        if name in REQUEST_SCENARIOS:
+            results[name] = await run_requests(client, REQUEST_SCENARIOS[name], context, args.requests, args.concurrency)
+            print(f"{name:>18}: " + format_result(results[name]), file=sys.stderr)
+    return results
+
+
+def format_result(result):
+    return (f"p50 {result['p50_ms']:8.2f} ms  p95 {result['p95_ms']:8.2f} ms  "
+            f"p99 {result['p99_ms']:8.2f} ms  {result['throughput_rps']:8.1f}/s  errors {result['errors']}")
+
+
+def corpus_summary(database_path):
+    with sqlite3.connect(database_path) as connection:
+        return {
+            table: connection.execute(f"SELECT count(*) FROM {table}").fetchone()[0]
+            for table in ("notes", "pieces", "todos")
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, results, threshold):
+    # p50 latency against the baseline; returns the scenarios that got slower
+    # by more than `threshold` (a fraction)
+    for key in ("mode", "concurrency", "cache", "corpus"):
+        if baseline.get(key) != results[key]:
+            print(f"warning: {key} differs from the baseline ({baseline.get(key)} vs {results[key]})", file=sys.stderr)
+
+    regressions = []
+    for name, result in results["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if before is None:
+            continue
+        change = result["p50_ms"] / before["p50_ms"] - 1
+        flag = "REGRESSION" if change > threshold else ""
+        print(f"{name:>18}: p50 {before['p50_ms']:8.2f} -> {result['p50_ms']:8.2f} ms ({change:+.1%}) {flag}",
+              file=sys.stderr)
+        if change > threshold:
+            regressions.append(name)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--corpus", help="database from benchmarks.corpus (copied, never modified)")
+    parser.add_argument("--pieces", type=int, default=10000, help="corpus size when --corpus is not given")
+    parser.add_argument("--todos", type=int, default=1000)
+    parser.add_argument("--distribution", default="lognormal")
+    parser.add_argument("--mode", choices=("inprocess", "uvicorn"), default="inprocess")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=200, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--imports", type=int, default=5, help="import runs")
+    parser.add_argument("--import-notes", type=int, default=100, help="notes per imported file")
+    parser.add_argument("--cache", action="store_true", help="keep the response cache on")
+    parser.add_argument("--output", help="write the results here as JSON (default: stdout)")
+    parser.add_argument("--compare", help="earlier results to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2, help="p50 slowdown counted as a regression")
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(",")]
+    unknown = set(names) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        database_path = os.path.join(directory, "bench.db")
+        if args.corpus:
+            shutil.copy(args.corpus, database_path)
+        else:
+            print(f"Generating a corpus of {args.pieces} pieces and {args.todos} todos", file=sys.stderr)
+            engine = bench_engine(database_path)
+            generate_corpus(engine, args.pieces, args.todos, args.distribution)
+            engine.dispose()
+
+        corpus = dict(corpus_summary(database_path), distribution=None if args.corpus else args.distribution)
+        context = Context(database_path)
+        if args.mode == "inprocess":
+            from app.cache import response_cache
+
+            response_cache.enabled = args.cache
+            transport = httpx.ASGITransport(app=build_app(database_path))
+            client = httpx.AsyncClient(transport=transport, base_url="http://bench")
+            server = None
+        else:
+            server = start_server(database_path, args.cache)
+            client = httpx.AsyncClient(
+                base_url=f"http://127.0.0.1:{PORT}", limits=httpx.Limits(max_connections=args.concurrency)
+            )
+
+        async def run():
+            async with client:
+                return await run_scenarios(client, names, context, args)
+
+        try:
+            scenarios = asyncio.run(run())
+        finally:
+            if server is not None:
+                server.terminate()
+                server.wait()
+
+        if "import" in names:
+            scenarios["import"] = run_import(database_path, directory, args.imports, args.import_notes)
+            print(f"{'import':>18}: " + format_result(scenarios["import"]), file=sys.stderr)
+
+        results = {
+            "commit": git_commit(),
+            "created": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "mode": args.mode,
+            "concurrency": args.concurrency,
+            "cache": args.cache,
+            "corpus": corpus,
+            "scenarios": scenarios,
+        }
+
+    if args.output:
+        with open(args.output, "w") as output:
+            json.dump(results, output, indent=2)
+    else:
+        json.dump(results, sys.stdout, indent=2)
+        print()
+
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            regressions = compare(json.load(baseline_file), results, args.threshold)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
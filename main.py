@@ -1,25 +1,108 @@
-import uvicorn
-from fastapi import FastAPI
+import logging
+from contextlib import asynccontextmanager
+
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
+from starlette.concurrency import run_in_threadpool
+from sqlalchemy.exc import OperationalError
+
+from app.cache import cache_router
+from app.changes import changes_router
+from app.compression import CompressionMiddleware
+from app.config import ASYNC_DATABASE, SQLITE_PROFILE, WORKERS
+from app.database import dispose_engines, is_database_locked, prepare_database
+from app.export import export_router
+from app.metrics import MetricsMiddleware, metrics_router
+from app.responses import FastJSONResponse
+from app.revisions import revisions_router
+from app.search import search_router
+from app.sqlite_pragmas import log_effective_pragmas
+from app.stats import stats_router
+from app.sync import sync_router
+from app.write_behind import write_behind_queue
+
+if ASYNC_DATABASE:
+    from app.async_routes import notes_router, todos_router
+else:
+    from app.routes import notes_router, todos_router
+
+
+def configure_logging():
+    # `python main.py` configures logging in its own process only: under
+    # `uvicorn main:create_app --factory` and in worker processes nothing
+    # handles the app's INFO records (migrations, effective pragmas)
+    app_logger = logging.getLogger("app")
+    if logging.getLogger().handlers or app_logger.handlers:
+        return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(levelname)s:%(name)s:%(message)s"))
+    app_logger.addHandler(handler)
+    app_logger.setLevel(logging.INFO)
+
 
-from app.routes import notes_router, todos_router
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    configure_logging()
+    # The database is first opened here, once per worker, not on import
+    engine = prepare_database()
+    if engine.dialect.name == "sqlite":
+        log_effective_pragmas(engine, SQLITE_PROFILE)
+    write_behind_queue.start()
+    yield
+    # Queued updates are written before the engines go away
+    await run_in_threadpool(write_behind_queue.stop)
+    await dispose_engines()
 
-app = FastAPI()
-app.include_router(notes_router)
-app.include_router(todos_router)
+
+async def database_locked_handler(request: Request, exc: OperationalError):
+    # Another writer held SQLite's lock through every retry: the client can
+    # try again, unlike with a 500
+    if not is_database_locked(exc):
+        raise exc
+    return JSONResponse({"detail": "Database is busy"}, status_code=503, headers={"Retry-After": "1"})
 
 
 origins = ["http://localhost:9001"]
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
+
+def create_app() -> FastAPI:
+    # Building the app touches no database; also usable as
+    # `uvicorn main:create_app --factory`
+    app = FastAPI(lifespan=lifespan, default_response_class=FastJSONResponse)
+    app.include_router(notes_router)
+    app.include_router(todos_router)
+    app.include_router(revisions_router)
+    app.include_router(search_router)
+    app.include_router(stats_router)
+    app.include_router(cache_router)
+    app.include_router(export_router)
+    app.include_router(changes_router)
+    app.include_router(sync_router)
+    app.include_router(metrics_router)
+    app.add_exception_handler(OperationalError, database_locked_handler)
+
+    app.add_middleware(
+        CORSMiddleware,
+        allow_origins=origins,
+        allow_credentials=True,
+        allow_methods=["*"],
+        allow_headers=["*"],
+        expose_headers=["X-Next-Cursor", "ETag", "Last-Modified"],
+    )
+    app.add_middleware(CompressionMiddleware)
+    # Added last so it wraps everything else, CORS and compression included
+    app.add_middleware(MetricsMiddleware)
+    return app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=5000)
+    # Only needed here: workers import main under a running uvicorn already
+    import uvicorn
+
+    logging.basicConfig(level=logging.INFO)
+    uvicorn.run("main:app", host="0.0.0.0", port=5000, workers=WORKERS)
 
@@ -0,0 +1,28 @@
+# Recompute the statistics behind GET /stats from the notes, pieces and todos
+# tables and compare them with the stored summary rows. Exits with status 1
+# when they differ; --fix replaces the stored rows with the recomputed ones.
+import argparse
+import sys
+
+if __name__ == "__main__":
+    from app.database import prepare_database
+    from app.stats import compute_stats, rebuild_stats, stats_differences, stored_stats
+
+    parser = argparse.ArgumentParser(description="Check the summary tables behind GET /stats")
+    parser.add_argument("--fix", action="store_true", help="rebuild the summary tables when they are off")
+    args = parser.parse_args()
+
+    with prepare_database().begin() as connection:
+        if args.fix and connection.dialect.name == "sqlite":
+            # No write may land between recomputing and rebuilding
+            connection.exec_driver_sql("BEGIN IMMEDIATE")
+        differences = stats_differences(compute_stats(connection), stored_stats(connection))
+        for table, key, expected, stored in differences:
+            print(f"{table} {key}: expected {expected}, stored {stored}", file=sys.stderr)
+        if differences and args.fix:
+            rebuild_stats(connection)
+            print(f"Rebuilt the summary tables ({len(differences)} values were off)", file=sys.stderr)
+        elif not differences:
+            print("Summary tables are consistent", file=sys.stderr)
+
+    sys.exit(1 if differences and not args.fix else 0)
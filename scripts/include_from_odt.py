@@ -1,70 +1,143 @@
+import argparse
 import re
+import sys
+import zipfile
 from datetime import datetime
 
-import odf.text
-import odf.opendocument
-from odf.text import P
+from lxml import etree
 from sqlalchemy.orm import Session
 
+from app.database import DBNote, DBPiece, DBTodo
+from app.pieces import POSITION_STEP
+
+TEXT_PARAGRAPH = "{urn:oasis:names:tc:opendocument:xmlns:text:1.0}p"
+# Inside the import's transaction, new rows are flushed and dropped from the
+# session every this many notes, so memory stays flat however long the document
+FLUSH_EVERY = 500
+
+
 def parse_timestamp(para):
     # Remove the '#<integer> ' prefix
     line = re.sub(r'^#\d+ ', '', para)
     # Parse the timestamp
+    timestamp = None
     try:
         timestamp = datetime.strptime(line, '%A, %d %B %Y %H:%M:%S')
-    except:
+    except ValueError:
         pass
     return timestamp
 
-def process_odt(file_path: str, db: Session):
-    # Open the .odt file
-    textdoc = odf.opendocument.load(file_path)
 
-    # Extract text content
-    paragraphs = []
-    for element in textdoc.getElementsByType(P):
-        paragraph = str(element)
-        if paragraph != '' and paragraph is not None:
-            paragraphs.append(paragraph)
+def iter_paragraphs(file_path: str):
+    # Stream the paragraphs out of content.xml without building the document tree
+    with zipfile.ZipFile(file_path) as archive, archive.open("content.xml") as content:
+        for _, element in etree.iterparse(content, events=("end",), tag=TEXT_PARAGRAPH):
+            paragraph = "".join(element.itertext())
+            # Drop what has been read so memory stays flat on large documents,
+            # unless the paragraph is nested in one that is still being read
+            if next(element.iterancestors(TEXT_PARAGRAPH), None) is None:
+                element.clear(keep_tail=True)
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+            if paragraph:
+                yield paragraph
 
-    first=True
+
+def iter_notes(paragraphs):
+    # Group paragraphs into (timestamp, pieces, todos), one per '#' header
+    note = None
     for para in paragraphs:
         if para[0] == "#":
-            current_timestamp = parse_timestamp(para)
-            if not first:
-                db.commit()
-            if first:
-                first = False
-            new_note = DBNote(
-                creation_timestamp=current_timestamp,
-                last_update_timestamp=current_timestamp,
-            )
-            db.add(new_note)
+            if note is not None:
+                yield note
+            note = (parse_timestamp(para), [], [])
+        elif note is None:
+            # Text before the first header belongs to no note
             continue
         elif para[:5] == "TODO:" or para[:5] == "DONE:":
-            new_todo = DBTodo(
-                text=para[5:],
-                timestamp=current_timestamp,
-                completed = para[:5] == "DONE:"
-            )
-            if para[:5] == "DONE:":
-                new_todo.completion_timestamp=current_timestamp
-            db.add(new_todo)
-            db.commit()
+            note[2].append((para[5:], para[:5] == "DONE:"))
+        else:
+            note[1].append(para)
+    if note is not None:
+        yield note
+
+
+def process_odt(file_path: str, db: Session, chunk_size: int = None, progress=None):
+    # Notes are identified by their header timestamp, so re-running the import
+    # only adds the notes that are not in the database yet
+    existing = {timestamp for (timestamp,) in db.query(DBNote.creation_timestamp)}
+    counts = {"imported": 0, "skipped": 0, "unparseable": 0}
+    pending = 0
+    unflushed = 0
+
+    for timestamp, pieces, todos in iter_notes(iter_paragraphs(file_path)):
+        if timestamp is None:
+            counts["unparseable"] += 1
+            continue
+        if timestamp in existing:
+            counts["skipped"] += 1
             continue
-        db.commit()
-        new_piece = DBPiece(
-            text=para,
-            timestamp=current_timestamp,
-            note_id=new_note.id,
-        )
-        db.add(new_piece)
+        existing.add(timestamp)
+
+        # Notes, pieces and todos are flushed together as multi-row inserts
+        db.add(DBNote(
+            creation_timestamp=timestamp,
+            last_update_timestamp=timestamp,
+            pieces=[
+                DBPiece(text=text, timestamp=timestamp, position=i * POSITION_STEP)
+                for i, text in enumerate(pieces)
+            ]
+        ))
+        for text, done in todos:
+            db.add(DBTodo(
+                text=text,
+                timestamp=timestamp,
+                completed=done,
+                completion_timestamp=timestamp if done else None,
+                last_update_timestamp=timestamp
+            ))
+        counts["imported"] += 1
+        pending += 1
+        unflushed += 1
+
+        if chunk_size and pending >= chunk_size:
+            db.commit()
+            db.expunge_all()
+            pending = unflushed = 0
+            if progress:
+                progress(counts)
+        elif unflushed >= FLUSH_EVERY:
+            db.flush()
+            db.expunge_all()
+            unflushed = 0
+
     db.commit()
+    if progress:
+        progress(counts)
+    return counts
+
+
+def print_progress(counts):
+    print(
+        f"{counts['imported']} notes imported, {counts['skipped']} already present, "
+        f"{counts['unparseable']} with unparseable headers",
+        file=sys.stderr
+    )
+
 
 # Usage example:
 if __name__ == "__main__":
-    from app.database import SessionLocal, Base, DBPiece, DBNote, DBTodo
+    from app.database import get_sessionmaker, prepare_database
+
+    parser = argparse.ArgumentParser(description="Import notes and todos from an ODT file")
+    parser.add_argument("file_path", nargs="?", default="/home/fabio/Documents/notes/Notes.odt")
+    parser.add_argument(
+        "--chunk-size", type=int, default=None,
+        help="commit every N notes instead of once at the end"
+    )
+    args = parser.parse_args()
 
-    db = SessionLocal()
-    process_odt("/home/fabio/Documents/notes/Notes.odt", db)
+    prepare_database()
+    db = get_sessionmaker()()
+    process_odt(args.file_path, db, chunk_size=args.chunk_size, progress=print_progress)
     db.close()
@@ -0,0 +1,7 @@
+# Rebuild the full-text search index from the pieces and todos tables.
+# Needed for databases populated while the index triggers were missing.
+if __name__ == "__main__":
+    from app.database import prepare_database, rebuild_search_index
+
+    with prepare_database().begin() as connection:
+        rebuild_search_index(connection)
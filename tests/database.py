@@ -0,0 +1,36 @@
+import os
+
+import pytest
+from sqlalchemy import create_engine, make_url
+from sqlalchemy.pool import StaticPool
+
+from app.database import async_database_url, database_url
+
+# The API tests run on an in-memory SQLite database, or on the database at
+# NOTES_TEST_DATABASE_URL (e.g. postgresql://localhost/notes_test).
+# They create and drop all the tables there, so it must be a scratch database.
+TEST_DATABASE_URL = database_url(os.environ.get("NOTES_TEST_DATABASE_URL", "sqlite:///:memory:"))
+TESTING_SQLITE = make_url(TEST_DATABASE_URL).get_backend_name() == "sqlite"
+
+# For tests of what only SQLite does (pragmas, BEGIN IMMEDIATE, reused ids):
+# a run against another database skips them
+sqlite_only = pytest.mark.skipif(not TESTING_SQLITE, reason="tests SQLite behaviour")
+
+
+def create_test_engine():
+    if TESTING_SQLITE:
+        return create_engine(
+            TEST_DATABASE_URL,
+            connect_args={"check_same_thread": False},
+            poolclass=StaticPool,  # Ensures same connection is used
+        )
+    return create_engine(TEST_DATABASE_URL)
+
+
+def create_async_test_engine():
+    from sqlalchemy.ext.asyncio import create_async_engine
+
+    url = async_database_url(TEST_DATABASE_URL)
+    if TESTING_SQLITE:
+        return create_async_engine(url, poolclass=StaticPool)
+    return create_async_engine(url)
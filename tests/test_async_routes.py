@@ -0,0 +1,145 @@
+import threading
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+from app import pieces, routes
+from app.async_routes import notes_router, todos_router
+from app.database import Base
+from app.dependencies import get_async_db
+from tests.database import create_async_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_async_test_engine()
+TestingSessionLocal = async_sessionmaker(engine, autoflush=False)
+
+app = FastAPI()
+app.include_router(notes_router)
+app.include_router(todos_router)
+
+
+# Override the dependency
+async def override_get_async_db():
+    async with TestingSessionLocal() as db:
+        yield db
+
+
+app.dependency_overrides[get_async_db] = override_get_async_db
+
+
+async def reset_database():
+    async with engine.begin() as connection:
+        await connection.run_sync(Base.metadata.drop_all)
+        await connection.run_sync(Base.metadata.create_all)
+
+
+@pytest.fixture(scope="module")
+def client():
+    # One client for the module keeps every request on the same event loop
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+@pytest.fixture(autouse=True)
+def setup_database(client):
+    client.portal.call(reset_database)
+    yield
+
+
+def test_note_lifecycle(client):
+    create_response = client.post(
+        "/notes",
+        json={"pieces": [{"text": "Piece 1"}, {"text": "Piece 2"}]}
+    )
+    assert create_response.status_code == 201
+    note_id = create_response.json()["note_id"]
+
+    note = client.get(f"/notes/{note_id}").json()
+    assert [piece["text"] for piece in note["pieces"]] == ["Piece 1", "Piece 2"]
+
+    update_response = client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Piece 1"}]})
+    assert update_response.status_code == 200
+
+    notes = client.get("/notes").json()
+    assert len(notes) == 1
+    assert [piece["text"] for piece in notes[0]["pieces"]] == ["Piece 1"]
+
+    assert client.delete(f"/notes/{note_id}").status_code == 204
+    assert client.get(f"/notes/{note_id}").status_code == 404
+
+
+def test_get_all_notes_paginated(client):
+    for i in range(3):
+        client.post("/notes", json={"pieces": [{"text": f"Note {i}"}]})
+
+    response = client.get("/notes", params={"limit": 2})
+    assert len(response.json()) == 2
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = client.get("/notes", params={"limit": 2, "after": cursor})
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_note_not_found(client):
+    response = client.put("/notes/999", json={"pieces": [{"text": "Updated text"}]})
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Note not found"
+
+
+def test_todo_lifecycle(client):
+    create_response = client.post("/todos/", json={"text": "Todo item"})
+    assert create_response.status_code == 201
+    todo_id = create_response.json()["todo_id"]
+
+    update_response = client.put(
+        f"/todos/{todo_id}",
+        json={"text": "Todo item", "switchCompletion": True}
+    )
+    assert update_response.status_code == 200
+
+    todo = client.get(f"/todos/{todo_id}").json()
+    assert todo["completed"] == True
+    assert todo["completion_timestamp"] is not None
+    assert len(client.get("/todos/").json()) == 1
+    assert client.get("/todos/", params={"completed": False}).json() == []
+    assert client.get("/todos/count", params={"completed": True}).json() == {"count": 1}
+
+    assert client.delete(f"/todos/{todo_id}").status_code == 204
+    assert client.get(f"/todos/{todo_id}").status_code == 404
+
+
+def test_get_note_pieces(client):
+    note_id = client.post("/notes", json={"pieces": [{"text": f"Piece {i}"} for i in range(3)]}).json()["note_id"]
+
+    response = client.get(f"/notes/{note_id}/pieces", params={"limit": 2})
+    assert [piece["text"] for piece in response.json()] == ["Piece 0", "Piece 1"]
+    response = client.get(f"/notes/{note_id}/pieces", params={"after": response.headers["X-Next-Cursor"]})
+    assert [piece["text"] for piece in response.json()] == ["Piece 2"]
+    assert client.get(f"/notes/{note_id}", params={"include_pieces": "false"}).json()["piece_count"] == 3
+
+
+def test_openapi_matches_sync_routes():
+    sync_app = FastAPI()
+    sync_app.include_router(routes.notes_router)
+    sync_app.include_router(routes.todos_router)
+
+    assert app.openapi() == sync_app.openapi()
+
+
+def test_note_diff_runs_off_the_event_loop(client, monkeypatch):
+    threads = []
+    text_opcodes = pieces.text_opcodes
+
+    def recording_opcodes(old_texts, texts):
+        threads.append(threading.get_ident())
+        return text_opcodes(old_texts, texts)
+
+    note_id = client.post("/notes", json={"pieces": [{"text": "a"}, {"text": "b"}]}).json()["note_id"]
+    monkeypatch.setattr(pieces, "text_opcodes", recording_opcodes)
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "a"}, {"text": "c"}]})
+
+    assert len(threads) == 1
+    assert threads[0] != client.portal.call(threading.get_ident)
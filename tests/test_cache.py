@@ -0,0 +1,158 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.cache import LRUCache, response_cache
+from app.database import Base
+from app.dependencies import get_db
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    response_cache.clear()
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(max_bytes=10)
+    cache.set(("todo", 1), "etag", "a", 4)
+    cache.set(("todo", 2), "etag", "b", 4)
+    assert cache.get(("todo", 1), "etag") == "a"
+
+    cache.set(("todo", 3), "etag", "c", 4)
+    assert ("todo", 2) not in cache
+    assert ("todo", 1) in cache
+    assert cache.size == 8
+    assert cache.stats()["evictions"] == 1
+
+
+def test_lru_cache_rejects_oversized_entries():
+    cache = LRUCache(max_bytes=10)
+    cache.set(("note", 1), "etag", "large", 11)
+    assert len(cache) == 0
+
+
+def test_lru_cache_counts_hits_and_misses():
+    cache = LRUCache(max_bytes=100)
+    cache.set(("note", 1), "etag-1", "a", 1)
+
+    assert cache.get(("note", 1), "etag-1") == "a"
+    # An entry built under another ETag is stale
+    assert cache.get(("note", 1), "etag-2") is None
+    assert cache.get(("note", 2), "etag-1") is None
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_lru_cache_invalidate_namespace():
+    cache = LRUCache(max_bytes=100)
+    cache.set(("notes", None, None), "etag", "page", 1)
+    cache.set(("notes", 10, None), "etag", "page", 1)
+    cache.set(("note", 1), "etag", "note", 1)
+
+    cache.invalidate_namespace("notes")
+    assert len(cache) == 1
+    assert cache.size == 1
+
+
+def test_lru_cache_disabled():
+    cache = LRUCache(max_bytes=100, enabled=False)
+    cache.set(("note", 1), "etag", "a", 1)
+    assert cache.get(("note", 1), "etag") is None
+    assert cache.stats()["misses"] == 0
+
+
+def test_repeated_reads_hit_the_cache():
+    note_id = client.post("/notes", json={"pieces": [{"text": "Cached"}]}).json()["note_id"]
+
+    hits = response_cache.hits
+    first = client.get(f"/notes/{note_id}")
+    second = client.get(f"/notes/{note_id}")
+    assert second.json() == first.json()
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert response_cache.hits == hits + 1
+
+    stats = client.get("/cache/stats").json()
+    assert stats["hits"] == hits + 1
+    assert stats["entries"] == 1
+
+
+def test_cached_page_keeps_cursor_header():
+    for i in range(3):
+        client.post("/notes", json={"pieces": [{"text": f"Note {i}"}]})
+
+    hits = response_cache.hits
+    first = client.get("/notes", params={"limit": 2})
+    second = client.get("/notes", params={"limit": 2})
+    assert response_cache.hits == hits + 1
+    assert second.headers["X-Next-Cursor"] == first.headers["X-Next-Cursor"]
+
+
+def test_no_stale_note_reads_after_mutations():
+    note_id = client.post("/notes", json={"pieces": [{"text": "v1"}]}).json()["note_id"]
+
+    def read_all():
+        return client.get("/notes").json(), client.get(f"/notes/{note_id}").json()
+
+    read_all()
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "v2"}]})
+    assert ("note", note_id) not in response_cache
+    notes, note = read_all()
+    assert notes[0]["pieces"][0]["text"] == note["pieces"][0]["text"] == "v2"
+
+    client.patch(f"/notes/{note_id}/pieces", json={"operations": [{"op": "insert", "text": "v0"}]})
+    assert ("note", note_id) not in response_cache
+    notes, note = read_all()
+    assert [piece["text"] for piece in note["pieces"]] == ["v0", "v2"]
+    assert notes[0]["pieces"] == note["pieces"]
+
+    client.post("/notes", json={"pieces": [{"text": "other"}]})
+    assert len(client.get("/notes").json()) == 2
+
+    client.delete(f"/notes/{note_id}")
+    assert ("note", note_id) not in response_cache
+    assert client.get(f"/notes/{note_id}").status_code == 404
+    assert [note["pieces"][0]["text"] for note in client.get("/notes").json()] == ["other"]
+
+
+def test_no_stale_todo_reads_after_mutations():
+    todo_id = client.post("/todos/", json={"text": "v1"}).json()["todo_id"]
+
+    def read_all():
+        return client.get("/todos/").json(), client.get(f"/todos/{todo_id}").json()
+
+    read_all()
+    client.put(f"/todos/{todo_id}", json={"text": "v2", "switchCompletion": True})
+    assert ("todo", todo_id) not in response_cache
+    todos, todo = read_all()
+    assert todos[0] == todo
+    assert todo["text"] == "v2"
+    assert todo["completed"] == True
+
+    client.post("/todos/", json={"text": "other"})
+    assert len(client.get("/todos/").json()) == 2
+
+    client.delete(f"/todos/{todo_id}")
+    assert ("todo", todo_id) not in response_cache
+    assert client.get(f"/todos/{todo_id}").status_code == 404
+    assert [todo["text"] for todo in client.get("/todos/").json()] == ["other"]
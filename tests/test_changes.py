@@ -0,0 +1,123 @@
+import asyncio
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.changes import format_event, iter_changes, prune_changes
+from app.database import Base
+from app.dependencies import get_db
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def collect(after, count, heartbeat=5):
+    # The first `count` events of a stream starting after `after`
+    async def run():
+        events = []
+        changes = iter_changes(engine, after, heartbeat=heartbeat)
+        async for event in changes:
+            events.append(event)
+            if len(events) == count:
+                break
+        await changes.aclose()
+        return events
+    return asyncio.run(asyncio.wait_for(run(), 10))
+
+
+def test_changes_are_logged_in_order():
+    note_id = client.post("/notes", json={"pieces": [{"text": "Note"}]}).json()["note_id"]
+    todo_id = client.post("/todos/", json={"text": "Todo"}).json()["todo_id"]
+    client.put(f"/todos/{todo_id}", json={"text": "Todo", "switchCompletion": True})
+    client.delete(f"/notes/{note_id}")
+
+    events = collect(0, 4)
+    assert [kind for kind, _ in events] == ["change"] * 4
+    changes = [(payload["entity"], payload["id"], payload["action"]) for _, payload in events]
+    assert changes == [
+        ("note", note_id, "create"),
+        ("todo", todo_id, "create"),
+        ("todo", todo_id, "update"),
+        ("note", note_id, "delete"),
+    ]
+    assert [payload["seq"] for _, payload in events] == [1, 2, 3, 4]
+
+
+def test_changes_resume_after_sequence():
+    for i in range(3):
+        client.post("/todos/", json={"text": f"Todo {i}"})
+
+    events = collect(2, 1)
+    assert events[0][1]["seq"] == 3
+
+
+def test_changes_reset_when_log_was_pruned():
+    for i in range(5):
+        client.post("/todos/", json={"text": f"Todo {i}"})
+    with TestingSessionLocal() as db:
+        prune_changes(db, keep=2)
+        db.commit()
+
+    kind, payload = collect(1, 1)[0]
+    assert kind == "reset"
+    assert payload == {"seq": 5}
+
+
+def test_changes_heartbeat_when_idle():
+    assert collect(None, 1, heartbeat=0.01) == [("heartbeat", None)]
+
+
+def test_changes_commit_wakes_stream():
+    client.post("/todos/", json={"text": "Before"})
+    # Write once the stream is waiting; the heartbeat is far longer than the test
+    timer = threading.Timer(0.2, lambda: client.post("/todos/", json={"text": "After"}))
+    timer.start()
+    try:
+        kind, payload = collect(None, 1, heartbeat=60)[0]
+    finally:
+        timer.join()
+    assert kind == "change"
+    assert payload["seq"] == 2
+
+
+def test_format_event():
+    assert format_event("heartbeat", None) == b": heartbeat\n\n"
+    assert format_event("reset", {"seq": 7}) == b'id: 7\nevent: reset\ndata: {"seq":7}\n\n'
+
+
+def test_changes_websocket():
+    client.post("/todos/", json={"text": "Before"})
+    with client.websocket_connect("/changes/ws?after=0") as websocket:
+        message = websocket.receive_json()
+        assert message["type"] == "change"
+        assert message["entity"] == "todo"
+        assert message["seq"] == 1
+
+        todo_id = client.post("/todos/", json={"text": "After"}).json()["todo_id"]
+        message = websocket.receive_json()
+        assert (message["seq"], message["id"], message["action"]) == (2, todo_id, "create")
@@ -0,0 +1,181 @@
+import asyncio
+import gzip
+import re
+import zlib
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.compression import CompressionMiddleware, negotiate
+from app.database import Base
+from app.dependencies import get_db
+from app.metrics import MetricsRegistry
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def create_large_note(pieces=200):
+    return client.post("/notes", json={
+        "pieces": [{"text": f"Piece {i} of a long note about the garden and the groceries"} for i in range(pieces)]
+    }).json()["note_id"]
+
+
+def test_negotiate():
+    assert negotiate("gzip, deflate", brotli_available=False) == "gzip"
+    assert negotiate("gzip, deflate, br", brotli_available=True) == "br"
+    assert negotiate("gzip, deflate, br", brotli_available=False) == "gzip"
+    assert negotiate("br;q=0.5, gzip", brotli_available=True) == "gzip"
+    assert negotiate("gzip;q=0", brotli_available=False) is None
+    assert negotiate("*", brotli_available=False) == "gzip"
+    assert negotiate("identity", brotli_available=True) is None
+    assert negotiate("", brotli_available=True) is None
+
+
+def test_large_response_gzipped():
+    note_id = create_large_note()
+    response = client.get(f"/notes/{note_id}", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert "Accept-Encoding" in response.headers["vary"]
+    assert len(response.json()["pieces"]) == 200
+
+    raw = client.get(f"/notes/{note_id}", headers={"Accept-Encoding": "identity"})
+    assert "content-encoding" not in raw.headers
+    assert raw.json() == response.json()
+
+
+def test_compressed_content_length():
+    note_id = create_large_note()
+    with client.stream("GET", f"/notes/{note_id}", headers={"Accept-Encoding": "gzip"}) as response:
+        compressed = b"".join(response.iter_raw())
+    assert int(response.headers["content-length"]) == len(compressed)
+    assert gzip.decompress(compressed).startswith(b"{")
+
+
+def test_small_response_not_compressed():
+    client.post("/todos/", json={"text": "short"})
+    response = client.get("/todos/", headers={"Accept-Encoding": "gzip"})
+    assert "content-encoding" not in response.headers
+    assert "Accept-Encoding" in response.headers["vary"]
+
+
+def test_export_streamed_compressed():
+    create_large_note()
+    with client.stream("GET", "/export", headers={"Accept-Encoding": "gzip"}) as response:
+        compressed = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == "gzip"
+    assert "content-length" not in response.headers
+    lines = gzip.decompress(compressed).splitlines()
+    assert len(lines) == 1 + 1 + 200
+
+
+def test_not_modified_not_compressed():
+    note_id = create_large_note()
+    etag = client.get(f"/notes/{note_id}").headers["etag"]
+    response = client.get(f"/notes/{note_id}", headers={"Accept-Encoding": "gzip", "If-None-Match": etag})
+    assert response.status_code == 304
+    assert "content-encoding" not in response.headers
+
+
+def test_compression_metrics():
+    note_id = create_large_note()
+    client.get(f"/notes/{note_id}", headers={"Accept-Encoding": "gzip"})
+    body = client.get("/metrics", headers={"Accept-Encoding": "identity"}).text
+    saved = re.search(r'^notes_compression_saved_bytes_total\{encoding="gzip"\} (\d+)$', body, re.MULTILINE)
+    assert saved is not None and int(saved.group(1)) > 0
+
+
+def run_middleware(middleware_app, headers):
+    messages = []
+
+    async def receive():
+        return {"type": "http.request", "body": b""}
+
+    async def send(message):
+        messages.append(message)
+
+    scope = {"type": "http", "method": "GET", "path": "/", "headers": headers}
+    asyncio.run(middleware_app(scope, receive, send))
+    return messages
+
+
+async def streaming_app(scope, receive, send):
+    await send({
+        "type": "http.response.start", "status": 200,
+        "headers": [(b"content-type", b"text/event-stream")],
+    })
+    for i in range(3):
+        await send({"type": "http.response.body", "body": b"data: event %d\n\n" % i, "more_body": True})
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+def test_stream_flushed_per_chunk():
+    metrics = MetricsRegistry()
+    middleware = CompressionMiddleware(streaming_app, minimum_size=1024, registry=metrics)
+    messages = run_middleware(middleware, [(b"accept-encoding", b"gzip")])
+
+    start, *bodies = messages
+    assert (b"content-encoding", b"gzip") in start["headers"]
+    decompressor = zlib.decompressobj(31)
+    # Every event can be decoded as soon as its chunk arrives
+    for i, message in enumerate(bodies[:3]):
+        assert message["more_body"]
+        assert decompressor.decompress(message["body"]) == b"data: event %d\n\n" % i
+    assert not bodies[-1]["more_body"]
+    decompressor.decompress(bodies[-1]["body"])
+    assert decompressor.eof
+    assert 'notes_compressed_responses_total{encoding="gzip"} 1' in metrics.render()
+
+
+def test_encoded_response_passed_through():
+    async def encoded_app(scope, receive, send):
+        await send({
+            "type": "http.response.start", "status": 200,
+            "headers": [(b"content-type", b"application/json"), (b"content-encoding", b"gzip")],
+        })
+        await send({"type": "http.response.body", "body": gzip.compress(b"{}" * 1000)})
+
+    middleware = CompressionMiddleware(encoded_app, minimum_size=10, registry=MetricsRegistry())
+    start, body = run_middleware(middleware, [(b"accept-encoding", b"gzip")])
+    assert gzip.decompress(body["body"]) == b"{}" * 1000
+
+
+def test_disabled():
+    middleware = CompressionMiddleware(streaming_app, enabled=False, registry=MetricsRegistry())
+    start, *bodies = run_middleware(middleware, [(b"accept-encoding", b"gzip")])
+    assert b"".join(message["body"] for message in bodies).count(b"data:") == 3
+    assert all(name != b"content-encoding" for name, _ in start["headers"])
+
+
+def test_brotli():
+    brotli = pytest.importorskip("brotli")
+    note_id = create_large_note()
+    with client.stream("GET", f"/notes/{note_id}", headers={"Accept-Encoding": "br, gzip"}) as response:
+        compressed = b"".join(response.iter_raw())
+    assert response.headers["content-encoding"] == "br"
+    assert brotli.decompress(compressed).startswith(b"{")
@@ -0,0 +1,68 @@
+import os
+import sqlite3
+import subprocess
+import sys
+
+from fastapi.testclient import TestClient
+
+from app.config import DATABASE_POOL_SIZE
+from app.database import async_database_url, database_url, engine_options
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_database_url():
+    assert database_url("postgresql://user:secret@db/notes") == "postgresql+psycopg2://user:secret@db/notes"
+    assert database_url("postgresql+psycopg://db/notes") == "postgresql+psycopg://db/notes"
+    assert database_url("sqlite:////tmp/notes.db") == "sqlite:////tmp/notes.db"
+
+
+def test_async_database_url():
+    assert async_database_url("sqlite:////tmp/notes.db") == "sqlite+aiosqlite:////tmp/notes.db"
+    assert async_database_url("postgresql+psycopg2://user:secret@db/notes") == "postgresql+asyncpg://user:secret@db/notes"
+    # psycopg 3 has an async mode of its own
+    assert async_database_url("postgresql+psycopg://db/notes") == "postgresql+psycopg://db/notes"
+
+
+def test_engine_options():
+    assert engine_options("sqlite:////tmp/notes.db") == {"connect_args": {"check_same_thread": False}}
+    options = engine_options("postgresql+psycopg://db/notes")
+    assert options["pool_size"] == DATABASE_POOL_SIZE
+    assert set(options) == {"pool_size", "max_overflow", "pool_pre_ping", "pool_recycle"}
+
+
+def test_import_opens_no_database(tmp_path):
+    path = tmp_path / "notes.db"
+    env = dict(os.environ, NOTES_DATABASE_URL=f"sqlite:///{path}")
+    subprocess.run(
+        [sys.executable, "-c", "import main, scripts.include_from_odt, scripts.rebuild_search_index"],
+        cwd=ROOT, env=env, check=True
+    )
+    assert not path.exists()
+
+
+def test_lifespan_logs_without_logging_configured(tmp_path):
+    # As under `uvicorn main:create_app --factory`, where the root logger has no handler
+    env = dict(os.environ, NOTES_DATABASE_URL=f"sqlite:///{tmp_path / 'notes.db'}", NOTES_SQLITE_PROFILE="production")
+    script = "from fastapi.testclient import TestClient\nimport main\nwith TestClient(main.create_app()):\n    pass"
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=ROOT, env=env, check=True, capture_output=True, text=True
+    )
+    assert "INFO:app.sqlite_pragmas:SQLite production profile, effective pragmas" in result.stderr
+
+
+def test_lifespan_prepares_database(tmp_path, monkeypatch):
+    from main import create_app
+
+    path = tmp_path / "notes.db"
+    monkeypatch.setattr("app.database.SQLALCHEMY_DATABASE_URL", f"sqlite:///{path}")
+    monkeypatch.setattr("app.database._engine", None)
+    monkeypatch.setattr("app.database._session_local", None)
+
+    app = create_app()
+    assert not path.exists()
+    with TestClient(app) as client:
+        assert client.post("/todos/", json={"text": "first"}).status_code == 201
+    with sqlite3.connect(path) as connection:
+        assert connection.execute("SELECT text FROM todos").fetchall() == [("first",)]
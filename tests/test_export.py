@@ -0,0 +1,190 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session, sessionmaker
+
+from main import app
+from app.database import Base, DBTodo, prune_tombstones
+from app.dependencies import get_db
+from app.export import export_records
+from app.routes import new_note
+from app.sqlite_pragmas import install_pragmas
+from tests.database import TESTING_SQLITE, create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def export_lines(**params):
+    response = client.get("/export", params=params)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    return [json.loads(line) for line in response.text.splitlines()]
+
+
+def test_export_empty_database():
+    records = export_lines()
+    assert len(records) == 1
+    assert records[0]["type"] == "export"
+    assert records[0]["since"] is None
+
+
+def test_export_all_records():
+    client.post("/notes", json={"pieces": [{"text": "First"}, {"text": "Second"}]})
+    client.post("/todos/", json={"text": "Water the plants"})
+
+    records = export_lines(format="ndjson")
+    assert [record["type"] for record in records] == ["export", "note", "piece", "piece", "todo"]
+
+    note, first, second, todo = records[1:]
+    assert first["note_id"] == second["note_id"] == note["id"]
+    assert [first["text"], second["text"]] == ["First", "Second"]
+    assert todo["text"] == "Water the plants"
+    assert todo["completed"] is False
+
+
+def test_export_since_only_includes_updated_rows():
+    client.post("/notes", json={"pieces": [{"text": "Old"}]})
+    token = export_lines()[0]["token"]
+    new_note = client.post("/notes", json={"pieces": [{"text": "New"}]}).json()["note_id"]
+    client.post("/todos/", json={"text": "Recent todo"})
+
+    records = export_lines(since=token)
+    assert records[0]["since"] == token
+    assert records[0]["token"] > token
+    notes = [record["id"] for record in records if record["type"] == "note"]
+    pieces = [record["text"] for record in records if record["type"] == "piece"]
+    todos = [record["text"] for record in records if record["type"] == "todo"]
+    assert notes == [new_note]
+    assert pieces == ["New"]
+    assert todos == ["Recent todo"]
+
+
+def test_export_since_includes_rows_stamped_before_the_export():
+    token = export_lines()[0]["token"]
+    # A writer that took its timestamp before the export but committed after it
+    with TestingSessionLocal() as db:
+        db.add(new_note(["Slow writer"], datetime.now() - timedelta(minutes=1)))
+        db.commit()
+
+    records = export_lines(since=token)
+    assert [record["text"] for record in records if record["type"] == "piece"] == ["Slow writer"]
+
+
+def test_export_since_includes_deletions():
+    note_id = client.post("/notes", json={"pieces": [{"text": "Kept"}, {"text": "Dropped"}]}).json()["note_id"]
+    gone_note = client.post("/notes", json={"pieces": [{"text": "Gone"}]}).json()["note_id"]
+    todo_id = client.post("/todos/", json={"text": "Gone too"}).json()["todo_id"]
+    dropped = client.get(f"/notes/{note_id}").json()["pieces"][1]["id"]
+    base = export_lines()
+    assert not [record for record in base if record["type"] == "delete"]
+
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Kept"}]})
+    client.delete(f"/notes/{gone_note}")
+    client.delete(f"/todos/{todo_id}")
+
+    records = export_lines(since=base[0]["token"])
+    deletes = [(record["entity"], record["id"]) for record in records if record["type"] == "delete"]
+    assert sorted(deletes) == [("note", gone_note), ("piece", dropped), ("todo", todo_id)]
+    # Deletions come first, then the rows as they are now
+    assert [record["type"] for record in records] == ["export", "delete", "delete", "delete", "note", "piece"]
+
+
+def test_export_since_deleted_highest_id_is_not_reused():
+    old_note = client.post("/notes", json={"pieces": [{"text": "Old"}]}).json()["note_id"]
+    token = export_lines()[0]["token"]
+
+    client.delete(f"/notes/{old_note}")
+    new_note = client.post("/notes", json={"pieces": [{"text": "New"}]}).json()["note_id"]
+    assert new_note != old_note
+
+    # Replaying the export drops the old note and its pieces, then adds the new one
+    records = export_lines(since=token)
+    assert [(record["type"], record.get("entity"), record["id"]) for record in records[1:3]] == [
+        ("delete", "note", old_note), ("note", None, new_note)
+    ]
+    assert [record["text"] for record in records if record["type"] == "piece"] == ["New"]
+
+
+def test_export_since_before_pruned_tombstones_exports_everything():
+    todo_id = client.post("/todos/", json={"text": "Gone"}).json()["todo_id"]
+    token = export_lines()[0]["token"]
+    client.delete(f"/todos/{todo_id}")
+    with TestingSessionLocal() as db:
+        prune_tombstones(db, datetime.now() + timedelta(days=60), retention_days=30)
+        db.commit()
+
+    # The deletion can no longer be listed: start over from a full export
+    records = export_lines(since=token)
+    assert records[0]["since"] is None
+    assert [record["type"] for record in records] == ["export"]
+
+
+def test_export_since_unknown_token_exports_everything():
+    client.post("/todos/", json={"text": "Todo"})
+    records = export_lines(since=1000)
+    assert records[0]["since"] is None
+    assert [record["type"] for record in records] == ["export", "todo"]
+
+
+def test_export_streams_in_batches():
+    client.post("/notes", json={"pieces": [{"text": f"Piece {i}"} for i in range(5)]})
+
+    chunks = list(export_records(engine, batch_size=2))
+    # Header, one note batch and the pieces split into batches of two
+    assert len(chunks) == 1 + 1 + 3
+    assert sum(chunk.count(b"\n") for chunk in chunks) == 1 + 1 + 5
+
+
+def test_export_reads_one_snapshot(tmp_path):
+    bind = engine
+    if TESTING_SQLITE:
+        # Writes need a connection of their own, which the shared in-memory
+        # one cannot give; WAL lets them commit while the export reads
+        bind = create_engine(f"sqlite:///{tmp_path / 'notes.db'}")
+        install_pragmas(bind, {"journal_mode": "WAL"})
+        Base.metadata.create_all(bind=bind)
+    with Session(bind) as db:
+        db.add_all([new_note(["First"], datetime.now()), new_note(["Second"], datetime.now())])
+        db.commit()
+
+    records = export_records(bind, batch_size=1)
+    head = [next(records), next(records)]
+    # Committed while the export is between two batches of notes
+    with Session(bind) as db:
+        db.add(DBTodo(text="Too late", completed=False, timestamp=datetime.now()))
+        db.commit()
+    lines = [json.loads(line) for chunk in head + list(records) for line in chunk.splitlines()]
+    if bind is not engine:
+        bind.dispose()
+
+    assert [record["type"] for record in lines] == ["export", "note", "note", "piece", "piece"]
+
+
+def test_export_rejects_unknown_format():
+    response = client.get("/export", params={"format": "csv"})
+    assert response.status_code == 422
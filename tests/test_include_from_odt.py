@@ -0,0 +1,122 @@
+import zipfile
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from app.database import Base, DBNote, DBPiece, DBTodo
+from scripts import include_from_odt
+from scripts.include_from_odt import iter_paragraphs, process_odt
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+CONTENT_XML = """<?xml version="1.0" encoding="UTF-8"?>
+<office:document-content
+    xmlns:office="urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+    xmlns:text="urn:oasis:names:tc:opendocument:xmlns:text:1.0">
+<office:body><office:text>
+{paragraphs}
+</office:text></office:body></office:document-content>
+"""
+
+
+def write_odt(path, paragraphs):
+    with zipfile.ZipFile(path, "w") as archive:
+        archive.writestr("mimetype", "application/vnd.oasis.opendocument.text")
+        archive.writestr("content.xml", CONTENT_XML.format(
+            paragraphs="\n".join(f"<text:p>{paragraph}</text:p>" for paragraph in paragraphs)
+        ))
+    return str(path)
+
+
+NOTES = [
+    "#1 Monday, 02 January 2023 09:30:00",
+    "First piece with <text:span>styled</text:span> text",
+    "",
+    "TODO:Buy milk",
+    "Second piece",
+    "#2 Tuesday, 03 January 2023 18:00:00",
+    "DONE:Pay rent",
+    "Evening piece",
+]
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_iter_paragraphs(tmp_path):
+    path = write_odt(tmp_path / "notes.odt", NOTES)
+    paragraphs = list(iter_paragraphs(path))
+    assert paragraphs[1] == "First piece with styled text"
+    # Empty paragraphs are dropped
+    assert len(paragraphs) == len(NOTES) - 1
+
+
+def test_process_odt(tmp_path):
+    path = write_odt(tmp_path / "notes.odt", NOTES)
+    db = TestingSessionLocal()
+
+    counts = process_odt(path, db)
+    assert counts == {"imported": 2, "skipped": 0, "unparseable": 0}
+
+    notes = db.query(DBNote).order_by(DBNote.id).all()
+    assert [[piece.text for piece in note.pieces] for note in notes] == [
+        ["First piece with styled text", "Second piece"],
+        ["Evening piece"],
+    ]
+    todos = db.query(DBTodo).order_by(DBTodo.id).all()
+    assert [(todo.text, todo.completed) for todo in todos] == [("Buy milk", False), ("Pay rent", True)]
+    assert todos[1].completion_timestamp == notes[1].creation_timestamp
+    db.close()
+
+
+def test_process_odt_is_idempotent(tmp_path):
+    path = write_odt(tmp_path / "notes.odt", NOTES[:5])
+    db = TestingSessionLocal()
+    process_odt(path, db)
+
+    # The document grew by one note since the last import
+    path = write_odt(tmp_path / "notes.odt", NOTES)
+    progress = []
+    counts = process_odt(path, db, chunk_size=1, progress=lambda counts: progress.append(dict(counts)))
+
+    assert counts == {"imported": 1, "skipped": 1, "unparseable": 0}
+    assert progress[-1] == counts
+    assert db.query(DBNote).count() == 2
+    assert db.query(DBPiece).count() == 3
+    assert db.query(DBTodo).count() == 2
+    db.close()
+
+
+def test_process_odt_flushes_as_it_goes(tmp_path, monkeypatch):
+    monkeypatch.setattr(include_from_odt, "FLUSH_EVERY", 1)
+    path = write_odt(tmp_path / "notes.odt", NOTES)
+    db = TestingSessionLocal()
+    flushed = []
+    event.listen(db, "before_flush", lambda session, context, instances: flushed.append(len(session.new)))
+
+    counts = process_odt(path, db)
+
+    # One note with its pieces and todos at a time, all in one transaction
+    assert counts["imported"] == 2
+    assert flushed == [4, 3]
+    assert len(db.identity_map) == 0
+    assert db.query(DBNote).count() == 2
+    db.close()
+
+
+def test_process_odt_unparseable_header(tmp_path):
+    path = write_odt(tmp_path / "notes.odt", ["#3 not a date", "Orphan piece"])
+    db = TestingSessionLocal()
+
+    counts = process_odt(path, db)
+    assert counts == {"imported": 0, "skipped": 0, "unparseable": 1}
+    assert db.query(DBPiece).count() == 0
+    db.close()
@@ -0,0 +1,114 @@
+import logging
+import re
+import time
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.database import Base
+from app.dependencies import get_db
+from app.metrics import MetricsMiddleware, MetricsRegistry, install_metrics
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+install_metrics(engine)
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def metric(name, **labels):
+    # Value of one sample on /metrics, 0 when it is not there yet
+    body = client.get("/metrics").text
+    label_text = ",".join(f'{key}="{value}"' for key, value in labels.items())
+    match = re.search(rf"^{name}{{{re.escape(label_text)}}} (\S+)$", body, re.MULTILINE)
+    return float(match.group(1)) if match else 0
+
+
+def test_metrics_format():
+    client.get("/todos/")
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert "# TYPE notes_http_request_duration_seconds histogram" in response.text
+    assert 'notes_http_request_duration_seconds_bucket{method="GET",route="/todos/",le="+Inf"}' in response.text
+
+
+def test_metrics_per_route():
+    labels = {"method": "GET", "route": "/notes/{note_id}"}
+    requests = metric("notes_http_request_duration_seconds_count", **labels)
+    statements = metric("notes_sql_statements_total", **labels)
+    rows = metric("notes_rows_returned_total", **labels)
+    not_found = metric("notes_http_requests_total", **labels, status=404)
+
+    note_id = client.post("/notes", json={"pieces": [{"text": "a"}]}).json()["note_id"]
+    client.get(f"/notes/{note_id}")
+    client.get("/notes/9999")
+
+    assert metric("notes_http_request_duration_seconds_count", **labels) == requests + 2
+    # Route templates, not paths, are the labels
+    assert f'route="/notes/{note_id}"' not in client.get("/metrics").text
+    assert metric("notes_http_requests_total", **labels, status=404) == not_found + 1
+    assert metric("notes_sql_statements_total", **labels) > statements
+    assert metric("notes_rows_returned_total", **labels) == rows + 1
+    assert metric("notes_sql_duration_seconds_total", **labels) > 0
+    assert metric("notes_serialization_seconds_total", **labels) > 0
+
+
+def test_metrics_unmatched_route():
+    before = metric("notes_http_requests_total", method="GET", route="unmatched", status=404)
+    client.get("/no/such/path")
+    assert metric("notes_http_requests_total", method="GET", route="unmatched", status=404) == before + 1
+
+
+def slow_app(registry, slow_request_ms):
+    slow = FastAPI()
+
+    @slow.get("/query")
+    def query():
+        time.sleep(0.01)
+        with engine.connect() as connection:
+            return {"value": connection.execute(text("SELECT 42")).scalar()}
+
+    slow.add_middleware(MetricsMiddleware, registry=registry, slow_request_ms=slow_request_ms)
+    return TestClient(slow)
+
+
+def test_slow_request_log_includes_sql(caplog):
+    registry = MetricsRegistry()
+    with caplog.at_level(logging.WARNING, logger="app.metrics"):
+        slow_app(registry, slow_request_ms=5).get("/query")
+        slow_app(registry, slow_request_ms=0).get("/query")
+        slow_app(registry, slow_request_ms=60000).get("/query")
+    # Only the first request was over its threshold; 0 turns the log off
+    assert len(caplog.records) == 1
+    assert "SELECT 42" in caplog.records[0].getMessage()
+
+
+def test_metrics_disabled():
+    registry = MetricsRegistry(enabled=False)
+    slow_app(registry, slow_request_ms=0).get("/query")
+    assert "route=" not in registry.render()
@@ -0,0 +1,151 @@
+from datetime import datetime, timedelta
+
+from sqlalchemy import create_engine, inspect
+from sqlalchemy.orm import Session
+
+from app.database import Base, DBSyncState, DBTombstone
+from app.migrations import HEAD, get_version, set_version, upgrade_schema
+from tests.database import create_test_engine
+
+# Schema written by versions of the app from before migrations existed
+LEGACY_SCHEMA = [
+    "CREATE TABLE notes (id INTEGER NOT NULL PRIMARY KEY, creation_timestamp DATETIME, last_update_timestamp DATETIME)",
+    "CREATE TABLE pieces (id INTEGER NOT NULL PRIMARY KEY, text VARCHAR, timestamp DATETIME, note_id INTEGER REFERENCES notes (id))",
+    "CREATE TABLE todos (id INTEGER NOT NULL PRIMARY KEY, text VARCHAR, timestamp DATETIME, completed BOOLEAN, completion_timestamp DATETIME)",
+    "INSERT INTO notes VALUES (1, '2023-01-02 09:30:00', '2023-01-02 09:30:00')",
+    "INSERT INTO pieces VALUES (1, 'legacy piece', '2023-01-02 09:30:00', 1)",
+    "INSERT INTO pieces VALUES (2, 'second piece', '2023-01-02 09:30:00', 1)",
+    "INSERT INTO todos VALUES (1, 'legacy todo', '2023-01-02 09:30:00', 0, NULL)",
+]
+
+
+def index_names(engine, table):
+    return {index["name"] for index in inspect(engine).get_indexes(table)}
+
+
+def test_upgrade_fresh_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+    upgrade_schema(engine, Base.metadata)
+
+    with engine.connect() as connection:
+        assert get_version(connection) == HEAD
+    assert "ix_pieces_note_id_position" in index_names(engine, "pieces")
+    engine.dispose()
+
+
+def test_upgrade_test_database():
+    # The fresh path again, on the test database (PostgreSQL too, see tests/database.py)
+    engine = create_test_engine()
+    Base.metadata.drop_all(engine)
+    with engine.begin() as connection:
+        connection.exec_driver_sql("DROP TABLE IF EXISTS schema_version")
+
+    upgrade_schema(engine, Base.metadata)
+    # As every worker does at start-up
+    upgrade_schema(engine, Base.metadata)
+
+    with engine.connect() as connection:
+        assert get_version(connection) == HEAD
+        assert connection.exec_driver_sql("SELECT count(*) FROM stats_counters").scalar() == 4
+    assert "ix_pieces_note_id_position" in index_names(engine, "pieces")
+    Base.metadata.drop_all(engine)
+    engine.dispose()
+
+
+def test_upgrade_adds_tombstone_timestamps(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'v6.db'}")
+    upgrade_schema(engine, Base.metadata)
+    with engine.begin() as connection:
+        # The two tables as version 6 made them
+        for statement in [
+            "DROP TABLE tombstones",
+            "DROP TABLE sync_state",
+            "CREATE TABLE tombstones (id INTEGER NOT NULL PRIMARY KEY, entity VARCHAR, entity_id INTEGER, version INTEGER NOT NULL)",
+            "CREATE TABLE sync_state (id INTEGER NOT NULL PRIMARY KEY, version INTEGER NOT NULL)",
+            "INSERT INTO tombstones VALUES (1, 'todo', 3, 4)",
+            "INSERT INTO sync_state VALUES (1, 5)",
+        ]:
+            connection.exec_driver_sql(statement)
+        set_version(connection, 6)
+
+    upgrade_schema(engine, Base.metadata)
+
+    with Session(engine) as db:
+        # Existing tombstones start their retention now
+        assert db.query(DBTombstone.timestamp).scalar() > datetime.now() - timedelta(minutes=1)
+        assert db.query(DBSyncState.version, DBSyncState.pruned_version).one() == (5, 0)
+    assert "ix_tombstones_timestamp" in index_names(engine, "tombstones")
+    engine.dispose()
+
+
+def test_upgrade_adds_autoincrement(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'v7.db'}")
+    upgrade_schema(engine, Base.metadata)
+    with engine.begin() as connection:
+        # The todos table as version 7 made it, with todo 2 deleted
+        for statement in [
+            "DROP TABLE todos",
+            "CREATE TABLE todos (id INTEGER NOT NULL PRIMARY KEY, text VARCHAR, timestamp DATETIME, "
+            "completed BOOLEAN, completion_timestamp DATETIME, last_update_timestamp DATETIME, "
+            "version INTEGER NOT NULL DEFAULT 0)",
+            "INSERT INTO todos (id, text, completed, version) VALUES (1, 'kept todo', 0, 1)",
+            "INSERT INTO tombstones (entity, entity_id, version) VALUES ('todo', 2, 2)",
+        ]:
+            connection.exec_driver_sql(statement)
+        set_version(connection, 7)
+
+    upgrade_schema(engine, Base.metadata)
+
+    with engine.begin() as connection:
+        assert get_version(connection) == HEAD
+        assert "AUTOINCREMENT" in connection.exec_driver_sql(
+            "SELECT sql FROM sqlite_master WHERE name = 'todos'"
+        ).scalar()
+        # The deleted todo's id is not handed out again
+        connection.exec_driver_sql("INSERT INTO todos (text, completed) VALUES ('new todo', 0)")
+        assert connection.exec_driver_sql("SELECT id, text FROM todos ORDER BY id").all() == [
+            (1, "kept todo"), (3, "new todo")
+        ]
+        # The search triggers are back on the rebuilt table
+        assert connection.exec_driver_sql(
+            "SELECT rowid FROM todo_search WHERE todo_search MATCH 'new'"
+        ).scalar() == 3
+    assert "ix_todos_timestamp_id" in index_names(engine, "todos")
+    engine.dispose()
+
+
+def test_upgrade_legacy_database(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        for statement in LEGACY_SCHEMA:
+            connection.exec_driver_sql(statement)
+
+    upgrade_schema(engine, Base.metadata)
+    # Running it again is a no-op
+    upgrade_schema(engine, Base.metadata)
+
+    with engine.connect() as connection:
+        assert get_version(connection) == HEAD
+        assert connection.exec_driver_sql("SELECT text FROM pieces WHERE id = 1").scalar() == "legacy piece"
+        # Pieces keep their insertion order through the new position column
+        assert connection.exec_driver_sql(
+            "SELECT id, position FROM pieces ORDER BY id"
+        ).all() == [(1, 0), (2, 1024)]
+        # Existing rows were indexed for full-text search
+        assert connection.exec_driver_sql(
+            "SELECT rowid FROM piece_search WHERE piece_search MATCH 'legacy'"
+        ).scalar() == 1
+        # Existing rows predate sync versions, and the counter starts from zero
+        assert connection.exec_driver_sql("SELECT version FROM todos").scalar() == 0
+        assert connection.exec_driver_sql("SELECT version FROM sync_state").scalar() == 0
+        # Statistics count the existing rows
+        assert dict(connection.exec_driver_sql("SELECT name, value FROM stats_counters").all()) == {
+            "notes": 1, "pieces": 2, "todos_open": 1, "todos_completed": 0
+        }
+
+    assert "ix_pieces_note_id_position" in index_names(engine, "pieces")
+    assert "ix_pieces_note_id_id" not in index_names(engine, "pieces")
+    assert "ix_notes_last_update_timestamp_id" in index_names(engine, "notes")
+    assert "ix_todos_completed_timestamp" in index_names(engine, "todos")
+    assert "ix_pieces_version" in index_names(engine, "pieces")
+    engine.dispose()
@@ -1,19 +1,20 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 
 from main import app
-from app.database import Base, get_db, DBNote, DBPiece
-
-# Create a separate in-memory SQLite database for testing
-SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(
-    SQLALCHEMY_TEST_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,  # Ensures same connection is used
-)
+from app.conditional import http_date
+from app.database import Base, DBNote, DBPiece
+from app.dependencies import get_db
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create the tables
@@ -29,39 +30,36 @@ def override_get_db():
         db.close()
 
 
-app.dependency_overrides[get_db] = override_get_db
-
 client = TestClient(app)
 
 
-@pytest.fixture(autouse=True)
-def setup_database():
-    # Clear all data before each test
-    db = TestingSessionLocal()
-    try:
-        # Delete all data from tables
-        db.query(DBPiece).delete()
-        db.query(DBNote).delete()
-        db.commit()
-    except:
-        db.rollback()
-        raise
-    finally:
-        db.close()
+@contextmanager
+def record_statements():
+    # Collect every SQL statement sent to the test database
+    statements = []
 
-    yield
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
 
-    # Clear all data after each test
-    db = TestingSessionLocal()
+    event.listen(engine, "before_cursor_execute", before_cursor_execute)
     try:
-        db.query(DBPiece).delete()
-        db.query(DBNote).delete()
-        db.commit()
-    except:
-        db.rollback()
-        raise
+        yield statements
     finally:
-        db.close()
+        event.remove(engine, "before_cursor_execute", before_cursor_execute)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    # Each test module uses its own engine, so install the override per test
+    app.dependency_overrides[get_db] = override_get_db
+
+    # Create tables before each test: on a shared test database (see
+    # tests/database.py) other modules drop them
+    Base.metadata.create_all(bind=engine)
+    yield
+    # Clean up after each test, revisions and summary rows included
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
 
 
 def test_create_note():
@@ -198,3 +196,363 @@ def test_delete_note_not_found():
     assert response.json()["detail"] == "Note not found"
 
 
+def test_get_all_notes_paginated():
+    note_ids = []
+    for i in range(5):
+        create_response = client.post(
+            "/notes",
+            json={"pieces": [{"text": f"Note {i}"}]}
+        )
+        note_ids.append(create_response.json()["note_id"])
+
+    seen = []
+    response = client.get("/notes", params={"limit": 2})
+    while True:
+        assert response.status_code == 200
+        seen.extend(note["id"] for note in response.json())
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        response = client.get("/notes", params={"limit": 2, "after": cursor})
+
+    # Most recently updated notes come first, and every note appears exactly once
+    assert seen == list(reversed(note_ids))
+
+
+def test_get_all_notes_unpaginated_keeps_id_order():
+    first = create_note_with(["First"])
+    second = create_note_with(["Second"])
+
+    assert [note["id"] for note in client.get("/notes").json()] == [first, second]
+    # Pages start from the most recently updated note
+    assert [note["id"] for note in client.get("/notes", params={"limit": 2}).json()] == [second, first]
+
+
+def test_get_all_notes_last_page_has_no_cursor():
+    client.post("/notes", json={"pieces": [{"text": "Only note"}]})
+
+    response = client.get("/notes", params={"limit": 1})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+    assert "X-Next-Cursor" not in response.headers
+
+
+def test_get_all_notes_invalid_cursor():
+    response = client.get("/notes", params={"after": "not-a-cursor"})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid cursor"
+
+
+def test_get_all_notes_statement_count_is_bounded():
+    for i in range(3):
+        client.post("/notes", json={"pieces": [{"text": f"Piece {i}"}, {"text": "Other"}]})
+
+    with record_statements() as few_notes:
+        response = client.get("/notes", params={"limit": 50})
+    assert response.status_code == 200
+
+    for i in range(30):
+        client.post("/notes", json={"pieces": [{"text": f"Piece {i}"}, {"text": "Other"}]})
+
+    with record_statements() as many_notes:
+        response = client.get("/notes", params={"limit": 50})
+    assert response.status_code == 200
+    assert len(response.json()) == 33
+
+    # The ETag aggregate, the notes page and one batched query for their pieces
+    assert len(few_notes) == len(many_notes) <= 3
+
+
+def create_note_with(texts):
+    create_response = client.post("/notes", json={"pieces": [{"text": text} for text in texts]})
+    return create_response.json()["note_id"]
+
+
+def get_pieces(note_id):
+    return client.get(f"/notes/{note_id}").json()["pieces"]
+
+
+def test_update_note_only_writes_changed_pieces():
+    note_id = create_note_with([f"Piece {i}" for i in range(10)])
+    before = get_pieces(note_id)
+
+    with record_statements() as statements:
+        update_response = client.put(
+            f"/notes/{note_id}",
+            json={"pieces": [{"text": "New first piece"}] + [{"text": piece["text"]} for piece in before]}
+        )
+    assert update_response.status_code == 200
+
+    # One piece inserted, the note timestamp bumped, the change logged, the
+    # revision recorded, the piece counted and the sync version taken,
+    # nothing else written
+    writes = [s for s in statements if s.split()[0] in ("INSERT", "UPDATE", "DELETE")]
+    assert len([s for s in writes if "pieces" in s.split("(")[0]]) == 1
+    assert len([s for s in writes if "changes" in s.split("(")[0]]) == 1
+    assert len([s for s in writes if "note_revisions" in s.split("(")[0]]) == 1
+    assert len([s for s in writes if "stats_counters" in s.split("(")[0]]) == 1
+    assert len([s for s in writes if "sync_state" in s.split("(")[0]]) == 1
+    assert len(writes) == 6
+
+    after = get_pieces(note_id)
+    assert after[0]["text"] == "New first piece"
+    # Existing pieces keep their ids and timestamps
+    assert after[1:] == before
+
+
+def test_update_note_diff_replaces_and_deletes():
+    note_id = create_note_with(["a", "b", "c", "d"])
+    before = get_pieces(note_id)
+
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "a"}, {"text": "B"}, {"text": "d"}, {"text": "e"}]})
+
+    after = get_pieces(note_id)
+    assert [piece["text"] for piece in after] == ["a", "B", "d", "e"]
+    assert after[0] == before[0]
+    assert after[2] == before[3]
+    # Written pieces carry the note's update time
+    last_update = client.get(f"/notes/{note_id}").json()["last_update_timestamp"]
+    assert after[1]["timestamp"] == after[3]["timestamp"] == last_update
+
+
+def test_update_note_unchanged_keeps_timestamp():
+    note_id = create_note_with(["a", "b"])
+    before = client.get(f"/notes/{note_id}").json()
+
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "a"}, {"text": "b"}]})
+
+    assert client.get(f"/notes/{note_id}").json() == before
+
+
+def test_patch_note_pieces():
+    note_id = create_note_with(["a", "b", "c"])
+    a, b, c = [piece["id"] for piece in get_pieces(note_id)]
+
+    patch_response = client.patch(
+        f"/notes/{note_id}/pieces",
+        json={"operations": [
+            {"op": "insert", "after": a, "text": "a2"},
+            {"op": "insert", "text": "first"},
+            {"op": "update", "id": b, "text": "B"},
+            {"op": "move", "id": c, "after": None},
+            {"op": "delete", "id": a},
+        ]}
+    )
+    assert patch_response.status_code == 200
+    assert len(patch_response.json()["inserted_ids"]) == 2
+
+    assert [piece["text"] for piece in get_pieces(note_id)] == ["c", "first", "a2", "B"]
+
+
+def test_patch_note_pieces_renumbers_when_out_of_gap():
+    note_id = create_note_with(["a", "z"])
+    a, z = [piece["id"] for piece in get_pieces(note_id)]
+
+    # Every insert lands right after "a", halving the gap each time
+    for i in range(20):
+        client.patch(f"/notes/{note_id}/pieces", json={"operations": [{"op": "insert", "after": a, "text": str(i)}]})
+
+    texts = [piece["text"] for piece in get_pieces(note_id)]
+    assert texts == ["a"] + [str(i) for i in reversed(range(20))] + ["z"]
+
+
+def test_patch_note_pieces_unknown_piece_rolls_back():
+    note_id = create_note_with(["a"])
+    other_note_id = create_note_with(["other"])
+    other_piece = get_pieces(other_note_id)[0]["id"]
+
+    patch_response = client.patch(
+        f"/notes/{note_id}/pieces",
+        json={"operations": [
+            {"op": "insert", "text": "kept?"},
+            {"op": "delete", "id": other_piece},
+        ]}
+    )
+    assert patch_response.status_code == 404
+    assert patch_response.json()["detail"] == "Piece not found"
+    assert [piece["text"] for piece in get_pieces(note_id)] == ["a"]
+
+
+def test_patch_note_pieces_missing_text():
+    note_id = create_note_with(["a"])
+    patch_response = client.patch(f"/notes/{note_id}/pieces", json={"operations": [{"op": "insert"}]})
+    assert patch_response.status_code == 400
+
+
+def test_patch_note_not_found():
+    patch_response = client.patch("/notes/999/pieces", json={"operations": []})
+    assert patch_response.status_code == 404
+    assert patch_response.json()["detail"] == "Note not found"
+
+
+def test_get_all_notes_not_modified():
+    note_id = create_note_with(["Polled piece"])
+
+    first_response = client.get("/notes")
+    etag = first_response.headers["ETag"]
+    assert etag.startswith('W/"')
+    assert "Last-Modified" not in first_response.headers
+
+    # An unchanged poll answers 304 without reading any piece
+    with record_statements() as statements:
+        poll_response = client.get("/notes", headers={"If-None-Match": etag})
+    assert poll_response.status_code == 304
+    assert poll_response.content == b""
+    assert not [s for s in statements if "pieces" in s]
+
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Edited piece"}]})
+    changed_response = client.get("/notes", headers={"If-None-Match": etag})
+    assert changed_response.status_code == 200
+    assert changed_response.headers["ETag"] != etag
+
+
+def test_get_all_notes_etag_changes_on_create_and_delete():
+    note_id = create_note_with(["First"])
+    etag = client.get("/notes").headers["ETag"]
+
+    create_note_with(["Second"])
+    created_etag = client.get("/notes").headers["ETag"]
+    assert created_etag != etag
+
+    client.delete(f"/notes/{note_id}")
+    assert client.get("/notes", headers={"If-None-Match": created_etag}).status_code == 200
+
+
+def test_get_all_notes_ignores_if_modified_since():
+    first = create_note_with(["First"])
+    create_note_with(["Second"])
+    since = http_date(datetime.now() + timedelta(days=1))
+
+    # A delete leaves the latest update as it was; only the ETag notices it
+    client.delete(f"/notes/{first}")
+    response = client.get("/notes", headers={"If-Modified-Since": since})
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+
+def test_get_all_notes_etag_depends_on_page():
+    create_note_with(["First"])
+    create_note_with(["Second"])
+    etag = client.get("/notes").headers["ETag"]
+
+    response = client.get("/notes", params={"limit": 1}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+
+
+def test_get_single_note_not_modified():
+    note_id = create_note_with(["Polled piece"])
+    first_response = client.get(f"/notes/{note_id}")
+    etag = first_response.headers["ETag"]
+    last_modified = first_response.headers["Last-Modified"]
+
+    with record_statements() as statements:
+        assert client.get(f"/notes/{note_id}", headers={"If-None-Match": etag}).status_code == 304
+    assert not [s for s in statements if "pieces" in s]
+
+    # The note may have changed again within the second Last-Modified names
+    assert client.get(
+        f"/notes/{note_id}", headers={"If-Modified-Since": last_modified}
+    ).status_code == 200
+    next_second = http_date(parsedate_to_datetime(last_modified) + timedelta(seconds=1))
+    assert client.get(
+        f"/notes/{note_id}", headers={"If-Modified-Since": next_second}
+    ).status_code == 304
+    # A stale ETag wins over a later date
+    assert client.get(
+        f"/notes/{note_id}", headers={"If-None-Match": 'W/"stale"', "If-Modified-Since": next_second}
+    ).status_code == 200
+
+    client.patch(f"/notes/{note_id}/pieces", json={"operations": [{"op": "insert", "text": "More"}]})
+    assert client.get(f"/notes/{note_id}", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_batch_notes():
+    updated = create_note_with(["Keep", "Change"])
+    removed = create_note_with(["Gone"])
+
+    response = client.post("/notes/batch", json={"operations": [
+        {"op": "create", "pieces": [{"text": "First"}, {"text": "Second"}]},
+        {"op": "create", "pieces": [{"text": "Another"}]},
+        {"op": "update", "id": updated, "pieces": [{"text": "Keep"}, {"text": "Changed"}]},
+        {"op": "delete", "id": removed},
+        {"op": "update", "id": removed, "pieces": []},
+        {"op": "update", "id": updated},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [201, 201, 200, 204, 404, 400]
+
+    assert [piece["text"] for piece in get_pieces(results[0]["id"])] == ["First", "Second"]
+    assert [piece["text"] for piece in get_pieces(results[1]["id"])] == ["Another"]
+    assert [piece["text"] for piece in get_pieces(updated)] == ["Keep", "Changed"]
+    assert client.get(f"/notes/{removed}").status_code == 404
+
+
+def test_batch_notes_commit_once():
+    commits = []
+
+    def listener(conn):
+        commits.append(conn)
+
+    event.listen(engine, "commit", listener)
+    try:
+        response = client.post("/notes/batch", json={"operations": [
+            {"op": "create", "pieces": [{"text": f"Note {i} piece {j}"} for j in range(3)]}
+            for i in range(10)
+        ]})
+    finally:
+        event.remove(engine, "commit", listener)
+    assert response.status_code == 200
+    assert len(commits) == 1
+    assert len(client.get("/notes").json()) == 10
+
+
+def test_get_note_pieces_pages_in_order():
+    note_id = create_note_with([f"Piece {i}" for i in range(25)])
+    # A piece moved to the front comes first, whatever its id
+    last = get_pieces(note_id)[-1]["id"]
+    client.patch(f"/notes/{note_id}/pieces", json={"operations": [{"op": "move", "id": last, "after": None}]})
+    expected = ["Piece 24"] + [f"Piece {i}" for i in range(24)]
+
+    texts = []
+    params = {"limit": 10}
+    while True:
+        response = client.get(f"/notes/{note_id}/pieces", params=params)
+        assert response.status_code == 200
+        texts.extend(piece["text"] for piece in response.json())
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params = {"limit": 10, "after": response.headers["X-Next-Cursor"]}
+    assert texts == expected
+
+    response = client.get(f"/notes/{note_id}/pieces", params={"offset": 20, "limit": 10})
+    assert [piece["text"] for piece in response.json()] == expected[20:]
+
+
+def test_get_note_pieces_reads_one_page():
+    note_id = create_note_with([f"Piece {i}" for i in range(500)])
+    first = client.get(f"/notes/{note_id}/pieces", params={"limit": 5})
+
+    with record_statements() as statements:
+        response = client.get(f"/notes/{note_id}/pieces", params={"limit": 5, "after": first.headers["X-Next-Cursor"]})
+    assert [piece["text"] for piece in response.json()] == [f"Piece {i}" for i in range(5, 10)]
+    # The note's timestamp for the ETag, then the page
+    assert len(statements) == 2
+
+
+def test_get_note_pieces_errors():
+    assert client.get("/notes/999/pieces").status_code == 404
+    note_id = create_note_with(["a"])
+    assert client.get(f"/notes/{note_id}/pieces", params={"after": "not a cursor"}).status_code == 400
+
+
+def test_get_single_note_without_pieces():
+    note_id = create_note_with(["a", "b", "c"])
+    response = client.get(f"/notes/{note_id}", params={"include_pieces": "false"})
+    assert response.status_code == 200
+    note = response.json()
+    assert note["piece_count"] == 3
+    assert "pieces" not in note
+
+    # Its own validator, so a cached full note is never taken for it
+    assert response.headers["etag"] != client.get(f"/notes/{note_id}").headers["etag"]
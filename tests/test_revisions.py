@@ -0,0 +1,223 @@
+from collections import namedtuple
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.database import Base, DBNoteRevision, DBPiece
+from app.dependencies import get_db
+from app.revisions import apply_delta, compact_revisions, delta_ops, kept_revisions, load_revision
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Create the tables
+Base.metadata.create_all(bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    # Each test module uses its own engine, so install the override per test
+    app.dependency_overrides[get_db] = override_get_db
+
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def create_note(texts):
+    return client.post("/notes", json={"pieces": [{"text": text} for text in texts]}).json()["note_id"]
+
+
+def update_note(note_id, texts):
+    return client.put(f"/notes/{note_id}", json={"pieces": [{"text": text} for text in texts]})
+
+
+def revision_texts(note_id, rev):
+    return [piece["text"] for piece in client.get(f"/notes/{note_id}/revisions/{rev}").json()["pieces"]]
+
+
+def stored_revisions(note_id):
+    db = TestingSessionLocal()
+    try:
+        return db.query(DBNoteRevision.rev, DBNoteRevision.depth).filter(
+            DBNoteRevision.note_id == note_id
+        ).order_by(DBNoteRevision.rev).all()
+    finally:
+        db.close()
+
+
+def test_every_write_adds_a_revision():
+    versions = [["a", "b", "c"], ["a", "B", "c"], ["a", "B", "c", "d"], ["d"]]
+    note_id = create_note(versions[0])
+    for texts in versions[1:]:
+        update_note(note_id, texts)
+    # Unchanged content adds nothing
+    update_note(note_id, versions[-1])
+
+    response = client.get(f"/notes/{note_id}/revisions")
+    assert response.status_code == 200
+    assert [(item["rev"], item["piece_count"]) for item in response.json()] == [(4, 1), (3, 4), (2, 3), (1, 3)]
+    for rev, texts in enumerate(versions, start=1):
+        assert revision_texts(note_id, rev) == texts
+
+
+def test_revisions_page_backwards():
+    note_id = create_note(["v0"])
+    for version in range(1, 10):
+        update_note(note_id, [f"v{version}"])
+
+    first = client.get(f"/notes/{note_id}/revisions", params={"limit": 4}).json()
+    assert [item["rev"] for item in first] == [10, 9, 8, 7]
+    second = client.get(f"/notes/{note_id}/revisions", params={"limit": 4, "before": 7}).json()
+    assert [item["rev"] for item in second] == [6, 5, 4, 3]
+
+
+def test_snapshots_bound_delta_chains(monkeypatch):
+    monkeypatch.setattr("app.revisions.REVISION_SNAPSHOT_EVERY", 3)
+    texts = [f"piece {i}" for i in range(20)]
+    note_id = create_note(texts)
+    history = [list(texts)]
+    for version in range(6):
+        texts[version] = f"edited {version}"
+        update_note(note_id, texts)
+        history.append(list(texts))
+
+    assert [depth for _, depth in stored_revisions(note_id)] == [0, 1, 2, 0, 1, 2, 0]
+    for rev, expected in enumerate(history, start=1):
+        assert revision_texts(note_id, rev) == expected
+
+
+def test_delta_is_smaller_than_snapshot():
+    texts = [f"a fairly long piece of text number {i}" for i in range(200)]
+    note_id = create_note(texts)
+    texts[100] = "edited"
+    update_note(note_id, texts)
+
+    db = TestingSessionLocal()
+    try:
+        snapshot, delta = db.query(DBNoteRevision.data).filter(DBNoteRevision.note_id == note_id).order_by(
+            DBNoteRevision.rev
+        ).all()
+    finally:
+        db.close()
+    assert len(delta.data) * 10 < len(snapshot.data)
+
+
+def test_patch_and_batch_add_revisions():
+    note_id = create_note(["a", "b"])
+    piece_id = client.get(f"/notes/{note_id}").json()["pieces"][0]["id"]
+    client.patch(f"/notes/{note_id}/pieces", json={"operations": [{"op": "update", "id": piece_id, "text": "A"}]})
+    client.post("/notes/batch", json={"operations": [{"op": "update", "id": note_id, "pieces": [{"text": "A"}]}]})
+
+    assert revision_texts(note_id, 2) == ["A", "b"]
+    assert revision_texts(note_id, 3) == ["A"]
+
+
+def test_write_outside_history_starts_snapshot():
+    note_id = create_note(["a", "b"])
+    # Pieces changed by something that records no revision
+    db = TestingSessionLocal()
+    db.query(DBPiece).filter(DBPiece.text == "b").update({"text": "imported"})
+    db.commit()
+    db.close()
+
+    update_note(note_id, ["a", "imported", "c"])
+    assert [depth for _, depth in stored_revisions(note_id)] == [0, 0]
+    assert revision_texts(note_id, 2) == ["a", "imported", "c"]
+
+
+def test_missing_note_or_revision():
+    assert client.get("/notes/999/revisions").status_code == 404
+    note_id = create_note(["a"])
+    response = client.get(f"/notes/{note_id}/revisions/2")
+    assert response.status_code == 404
+    assert response.json()["detail"] == "Revision not found"
+
+
+def test_delete_note_deletes_revisions():
+    note_id = create_note(["a"])
+    update_note(note_id, ["b"])
+    client.delete(f"/notes/{note_id}")
+    assert stored_revisions(note_id) == []
+
+
+def test_revisions_without_orjson(monkeypatch):
+    note_id = create_note(["a", "b", "é"])
+    monkeypatch.setattr("app.revisions.orjson", None)
+    update_note(note_id, ["a", "c", "é"])
+
+    # The checksum written through orjson matches the fallback's, so the
+    # new revision is a delta from the first
+    assert [depth for _, depth in stored_revisions(note_id)] == [0, 1]
+    assert revision_texts(note_id, 1) == ["a", "b", "é"]
+    assert revision_texts(note_id, 2) == ["a", "c", "é"]
+
+
+def test_delta_round_trip():
+    old = ["a", "b", "c", "d", "e"]
+    for new in (["a", "x", "c", "d", "e"], ["e", "d"], [], ["a", "b", "c", "d", "e", "f"], ["z"] + old):
+        assert apply_delta(old, delta_ops(old, new)) == new
+
+
+Row = namedtuple("Row", "rev timestamp")
+
+
+def test_kept_revisions_policy():
+    now = datetime(2024, 5, 10, 12, 0)
+    # Every ten minutes for two days
+    rows = [Row(rev, now - timedelta(minutes=10 * (288 - rev))) for rev in range(1, 289)]
+
+    kept = kept_revisions(rows, now, keep=0, max_age=timedelta(0), compact_after=timedelta(hours=24))
+    recent = [row.rev for row in rows if now - row.timestamp <= timedelta(hours=24)]
+    assert set(recent) <= kept
+    # One per hour for the older day
+    assert len(kept) == len(recent) + 24
+
+    assert len(kept_revisions(rows, now, keep=10, max_age=timedelta(0), compact_after=timedelta(hours=24))) == 10
+    aged = kept_revisions(rows, now, keep=0, max_age=timedelta(hours=1), compact_after=timedelta(hours=24))
+    assert aged == {row.rev for row in rows if now - row.timestamp <= timedelta(hours=1)}
+
+
+def test_compaction_keeps_revisions_readable(monkeypatch):
+    monkeypatch.setattr("app.revisions.REVISION_SNAPSHOT_EVERY", 4)
+    texts = [f"piece {i}" for i in range(10)]
+    note_id = create_note(texts)
+    for version in range(20):
+        texts[version % 10] = f"edit {version}"
+        update_note(note_id, texts)
+    expected = {rev: revision_texts(note_id, rev) for rev in range(1, 22)}
+
+    db = TestingSessionLocal()
+    try:
+        # Age the first fifteen revisions into the same hour, two days ago
+        old = datetime.now() - timedelta(days=2)
+        db.query(DBNoteRevision).filter(DBNoteRevision.note_id == note_id, DBNoteRevision.rev <= 15).update(
+            {"timestamp": old}
+        )
+        assert compact_revisions(db, note_id, datetime.now()) == 14
+        db.commit()
+
+        remaining = [rev for rev, _ in stored_revisions(note_id)]
+        assert remaining == [15] + list(range(16, 22))
+        for rev in remaining:
+            assert load_revision(db, note_id, rev)[1] == expected[rev]
+    finally:
+        db.close()
@@ -0,0 +1,106 @@
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.database import Base, rebuild_search_index
+from app.dependencies import get_db
+from app.search import build_match_query, build_tsquery
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def test_search_empty_query():
+    response = client.get("/search", params={"q": "  !? "})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_search_note_pieces():
+    create_response = client.post(
+        "/notes",
+        json={"pieces": [{"text": "Buy some bread"}, {"text": "Call the plumber about the sink"}]}
+    )
+    note_id = create_response.json()["note_id"]
+
+    response = client.get("/search", params={"q": "plumber"})
+    assert response.status_code == 200
+    hits = response.json()
+    assert len(hits) == 1
+    assert hits[0]["kind"] == "piece"
+    assert hits[0]["note_id"] == note_id
+    assert hits[0]["piece_index"] == 1
+    assert "<mark>plumber</mark>" in hits[0]["snippet"]
+
+
+def test_search_todos():
+    create_response = client.post("/todos/", json={"text": "Renew the passport"})
+    todo_id = create_response.json()["todo_id"]
+
+    hits = client.get("/search", params={"q": "passport"}).json()
+    assert len(hits) == 1
+    assert hits[0]["kind"] == "todo"
+    assert hits[0]["todo_id"] == todo_id
+    assert hits[0]["note_id"] is None
+
+
+def test_search_prefix_and_ranking():
+    client.post("/notes", json={"pieces": [{"text": "garden garden garden"}]})
+    client.post("/notes", json={"pieces": [{"text": "the garden and many other unrelated words here"}]})
+
+    hits = client.get("/search", params={"q": "gard"}).json()
+    assert len(hits) == 2
+    assert hits[0]["snippet"].count("<mark>") == 3
+    assert hits[0]["rank"] <= hits[1]["rank"]
+
+
+def test_search_follows_updates_and_deletes():
+    note_id = client.post("/notes", json={"pieces": [{"text": "old words"}]}).json()["note_id"]
+    todo_id = client.post("/todos/", json={"text": "old chores"}).json()["todo_id"]
+
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "new words"}]})
+    client.put(f"/todos/{todo_id}", json={"text": "new chores", "switchCompletion": False})
+    assert client.get("/search", params={"q": "old"}).json() == []
+    assert len(client.get("/search", params={"q": "new"}).json()) == 2
+
+    client.delete(f"/notes/{note_id}")
+    client.delete(f"/todos/{todo_id}")
+    assert client.get("/search", params={"q": "new"}).json() == []
+
+
+def test_rebuild_search_index():
+    client.post("/notes", json={"pieces": [{"text": "rebuilt index"}]})
+
+    with engine.begin() as connection:
+        rebuild_search_index(connection)
+
+    hits = client.get("/search", params={"q": "rebuilt"}).json()
+    assert len(hits) == 1
+
+
+def test_query_builders_escape_syntax():
+    assert build_match_query('gard "OR" NOT(x*') == '"gard"* "OR"* "NOT"* "x"*'
+    assert build_tsquery("gard & !plumb:*|(x)") == "gard:* & plumb:* & x:*"
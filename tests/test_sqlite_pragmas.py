@@ -0,0 +1,46 @@
+import pytest
+from sqlalchemy import create_engine
+
+from app.sqlite_pragmas import effective_pragmas, install_pragmas, resolve_pragmas
+from tests.database import sqlite_only
+
+pytestmark = sqlite_only
+
+
+def test_resolve_production_profile():
+    pragmas = resolve_pragmas("production", environ={})
+    assert pragmas["journal_mode"] == "WAL"
+    assert pragmas["synchronous"] == "NORMAL"
+    assert pragmas["busy_timeout"] == 5000
+
+
+def test_resolve_environment_overrides():
+    pragmas = resolve_pragmas(
+        "default",
+        environ={"NOTES_SQLITE_SYNCHRONOUS": "FULL", "NOTES_SQLITE_CACHE_SIZE": "-2000"}
+    )
+    assert pragmas == {"synchronous": "FULL", "cache_size": "-2000"}
+
+
+def test_resolve_rejects_unknown_profile():
+    with pytest.raises(ValueError):
+        resolve_pragmas("fastest", environ={})
+
+
+def test_resolve_rejects_injected_values():
+    with pytest.raises(ValueError):
+        resolve_pragmas("default", environ={"NOTES_SQLITE_SYNCHRONOUS": "OFF; DROP TABLE notes"})
+
+
+def test_pragmas_applied_on_connect(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    install_pragmas(engine, resolve_pragmas("production", environ={}))
+
+    with engine.connect() as connection:
+        effective = effective_pragmas(connection)
+
+    assert effective["journal_mode"] == "wal"
+    assert effective["synchronous"] == 1  # NORMAL
+    assert effective["busy_timeout"] == 5000
+    assert effective["temp_store"] == 2  # MEMORY
+    engine.dispose()
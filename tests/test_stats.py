@@ -0,0 +1,157 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.database import Base, DBNote, DBPiece, DBStatsCounter, DBTodo
+from app.dependencies import get_db
+from app.stats import compute_stats, rebuild_stats, stats_differences, stored_stats
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Create the tables
+Base.metadata.create_all(bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    # Each test module uses its own engine, so install the override per test
+    app.dependency_overrides[get_db] = override_get_db
+
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+def differences():
+    with engine.connect() as connection:
+        return stats_differences(compute_stats(connection), stored_stats(connection))
+
+
+def create_note(*texts):
+    return client.post("/notes", json={"pieces": [{"text": text} for text in texts]}).json()["note_id"]
+
+
+def test_empty_stats():
+    stats = client.get("/stats").json()
+    assert stats["notes"] == 0
+    assert stats["pieces_per_note"] is None
+    assert stats["notes_per_day"] == []
+    assert stats["todos"] == {"open": 0, "completed": 0}
+    assert stats["completion_time"]["mean_seconds"] is None
+
+
+def test_stats_follow_writes():
+    first = create_note("a", "b", "c")
+    create_note("d")
+    todo_ids = [client.post("/todos/", json={"text": f"Todo {i}"}).json()["todo_id"] for i in range(3)]
+    client.put(f"/todos/{todo_ids[0]}", json={"text": "Todo 0", "switchCompletion": True})
+
+    stats = client.get("/stats").json()
+    assert stats["notes"] == 2
+    assert stats["pieces"] == 4
+    assert stats["pieces_per_note"] == 2
+    assert stats["notes_per_day"] == [{"day": date.today().isoformat(), "notes": 2}]
+    assert stats["todos"] == {"open": 2, "completed": 1}
+    assert stats["completion_time"]["todos"] == 1
+    assert stats["completion_time"]["buckets"][0] == {"max_seconds": 3600, "todos": 1}
+
+    client.delete(f"/notes/{first}")
+    client.put(f"/todos/{todo_ids[0]}", json={"text": "Todo 0", "switchCompletion": True})
+    client.delete(f"/todos/{todo_ids[1]}")
+    stats = client.get("/stats").json()
+    assert (stats["notes"], stats["pieces"]) == (1, 1)
+    assert stats["todos"] == {"open": 2, "completed": 0}
+    assert stats["completion_time"]["todos"] == 0
+
+
+def test_every_write_path_keeps_stats_exact():
+    note_id = create_note("a", "b", "c")
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "a"}, {"text": "x"}, {"text": "y"}, {"text": "z"}]})
+    piece_id = client.get(f"/notes/{note_id}").json()["pieces"][0]["id"]
+    client.patch(f"/notes/{note_id}/pieces", json={"operations": [
+        {"op": "delete", "id": piece_id}, {"op": "insert", "text": "new", "after": None},
+    ]})
+    other = create_note("gone", "too")
+    client.post("/notes/batch", json={"operations": [
+        {"op": "create", "pieces": [{"text": "one"}, {"text": "two"}]},
+        {"op": "update", "id": note_id, "pieces": [{"text": "only"}]},
+        {"op": "delete", "id": other},
+    ]})
+    todo_id = client.post("/todos/", json={"text": "todo"}).json()["todo_id"]
+    client.post("/todos/batch", json={"operations": [
+        {"op": "create", "text": "batched"},
+        {"op": "toggle", "id": todo_id},
+        {"op": "update", "id": todo_id, "text": "renamed"},
+    ]})
+
+    assert differences() == []
+    assert client.get("/stats").json()["todos"] == {"open": 1, "completed": 1}
+
+
+def test_session_writers_keep_stats_exact():
+    # What the import script does: notes, pieces and todos added to a session
+    db = TestingSessionLocal()
+    old = datetime(2023, 1, 2, 9, 30)
+    db.add(DBNote(creation_timestamp=old, last_update_timestamp=old, pieces=[DBPiece(text="a", position=0)]))
+    db.add(DBTodo(text="done", timestamp=old, completed=True, completion_timestamp=old + timedelta(days=2)))
+    db.commit()
+    db.close()
+
+    assert differences() == []
+    stats = client.get("/stats", params={"days": 3660}).json()
+    assert {"day": "2023-01-02", "notes": 1} in stats["notes_per_day"]
+    assert stats["completion_time"]["mean_seconds"] == 2 * 86400
+    assert stats["completion_time"]["buckets"][2]["todos"] == 1
+
+
+def test_rebuild_fixes_drift():
+    create_note("a")
+    with engine.begin() as connection:
+        connection.execute(DBStatsCounter.__table__.update().values(value=42))
+    assert len(differences()) == 4
+
+    with engine.begin() as connection:
+        rebuild_stats(connection)
+    assert differences() == []
+
+
+def test_stats_cost_does_not_grow_with_corpus():
+    def count_statements():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            assert client.get("/stats").status_code == 200
+        finally:
+            event.remove(engine, "before_cursor_execute", before_cursor_execute)
+        return statements
+
+    create_note("a")
+    few = count_statements()
+    client.post("/notes/batch", json={"operations": [{"op": "create", "pieces": [{"text": "p"}] * 5}] * 50})
+    many = count_statements()
+    assert len(few) == len(many) == 3
+    assert not any("FROM notes" in statement or "FROM pieces" in statement for statement in many)
@@ -0,0 +1,160 @@
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.database import Base, DBSyncState, DBTombstone, prune_tombstones
+from app.dependencies import get_db
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def setup_database():
+    app.dependency_overrides[get_db] = override_get_db
+    Base.metadata.create_all(bind=engine)
+    yield
+    Base.metadata.drop_all(bind=engine)
+
+
+def sync(since=None):
+    params = {} if since is None else {"since": since}
+    response = client.get("/sync", params=params)
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_full_sync():
+    note_id = client.post("/notes", json={"pieces": [{"text": "a"}, {"text": "b"}]}).json()["note_id"]
+    todo_id = client.post("/todos/", json={"text": "Todo"}).json()["todo_id"]
+
+    data = sync()
+    assert data["full"] is True
+    assert data["token"] == 2
+    assert [note["id"] for note in data["notes"]] == [note_id]
+    assert [piece["text"] for piece in data["pieces"]] == ["a", "b"]
+    assert [todo["id"] for todo in data["todos"]] == [todo_id]
+    assert data["deleted"] == {"notes": [], "pieces": [], "todos": []}
+
+
+def test_sync_returns_only_changes():
+    note_id = client.post("/notes", json={"pieces": [{"text": "a"}, {"text": "b"}, {"text": "c"}]}).json()["note_id"]
+    kept_todo = client.post("/todos/", json={"text": "Kept"}).json()["todo_id"]
+    removed_todo = client.post("/todos/", json={"text": "Removed"}).json()["todo_id"]
+    token = sync()["token"]
+
+    # Nothing changed yet
+    data = sync(token)
+    assert data["full"] is False
+    assert data["token"] == token
+    assert data["notes"] == data["pieces"] == data["todos"] == []
+
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "a"}, {"text": "B"}]})
+    client.put(f"/todos/{kept_todo}", json={"text": "Kept", "switchCompletion": True})
+    client.delete(f"/todos/{removed_todo}")
+
+    data = sync(token)
+    assert data["token"] > token
+    assert [note["id"] for note in data["notes"]] == [note_id]
+    assert [piece["text"] for piece in data["pieces"]] == ["B"]
+    assert [(todo["id"], todo["completed"]) for todo in data["todos"]] == [(kept_todo, True)]
+    # "b" is rewritten in place, "c" deleted
+    assert len(data["deleted"]["pieces"]) == 1
+    assert data["deleted"]["todos"] == [removed_todo]
+
+    # The new token catches up with everything
+    assert sync(data["token"])["todos"] == []
+
+
+def test_sync_note_delete_tombstone():
+    note_id = client.post("/notes", json={"pieces": [{"text": "a"}]}).json()["note_id"]
+    token = sync()["token"]
+
+    client.delete(f"/notes/{note_id}")
+
+    data = sync(token)
+    assert data["notes"] == []
+    assert data["deleted"]["notes"] == [note_id]
+
+
+def test_sync_deleted_highest_id_is_not_reused():
+    old_note = client.post("/notes", json={"pieces": [{"text": "Old"}]}).json()["note_id"]
+    old_piece = client.get(f"/notes/{old_note}").json()["pieces"][0]["id"]
+    old_todo = client.post("/todos/", json={"text": "First"}).json()["todo_id"]
+    token = sync()["token"]
+
+    client.delete(f"/notes/{old_note}")
+    client.delete(f"/todos/{old_todo}")
+    new_note = client.post("/notes", json={"pieces": [{"text": "New"}]}).json()["note_id"]
+    new_todo = client.post("/todos/", json={"text": "Second"}).json()["todo_id"]
+    assert new_note != old_note and new_todo != old_todo
+
+    data = sync(token)
+    assert [note["id"] for note in data["notes"]] == [new_note]
+    assert [piece["text"] for piece in data["pieces"]] == ["New"]
+    assert old_piece not in [piece["id"] for piece in data["pieces"]]
+    assert data["deleted"] == {"notes": [old_note], "pieces": [], "todos": [old_todo]}
+
+
+def test_sync_token_older_than_pruned_tombstones_gets_full_sync():
+    first = client.post("/todos/", json={"text": "First"}).json()["todo_id"]
+    second = client.post("/todos/", json={"text": "Second"}).json()["todo_id"]
+    old_token = sync()["token"]
+    client.delete(f"/todos/{first}")
+    recent_token = sync()["token"]
+    client.delete(f"/todos/{second}")
+
+    with TestingSessionLocal() as db:
+        # Only the first deletion is past the retention
+        db.query(DBTombstone).filter(DBTombstone.entity_id == first).update(
+            {"timestamp": datetime.now() - timedelta(days=31)}
+        )
+        prune_tombstones(db, datetime.now(), retention_days=30)
+        db.commit()
+        assert db.query(DBTombstone.entity_id).all() == [(second,)]
+
+    data = sync(old_token)
+    assert data["full"] is True
+    assert data["todos"] == []
+    data = sync(recent_token)
+    assert data["full"] is False
+    assert data["deleted"]["todos"] == [second]
+
+
+def test_deletes_prune_old_tombstones(monkeypatch):
+    monkeypatch.setattr("app.database.TOMBSTONE_PRUNE_EVERY", 1)
+    old = client.post("/todos/", json={"text": "Old"}).json()["todo_id"]
+    client.delete(f"/todos/{old}")
+    with TestingSessionLocal() as db:
+        db.query(DBTombstone).update({"timestamp": datetime.now() - timedelta(days=365)})
+        db.commit()
+
+    new = client.post("/todos/", json={"text": "New"}).json()["todo_id"]
+    client.delete(f"/todos/{new}")
+    with TestingSessionLocal() as db:
+        assert db.query(DBTombstone.timestamp).filter(DBTombstone.timestamp < datetime.now() - timedelta(days=1)).all() == []
+        assert db.query(DBSyncState.pruned_version).scalar() > 0
+
+
+def test_sync_token_from_the_future_gets_full_sync():
+    client.post("/todos/", json={"text": "Todo"})
+    data = sync(1000)
+    assert data["full"] is True
+    assert len(data["todos"]) == 1
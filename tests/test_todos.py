@@ -1,19 +1,18 @@
+from datetime import datetime, timedelta
+from email.utils import parsedate_to_datetime
+
 import pytest
 from fastapi.testclient import TestClient
-from sqlalchemy import create_engine
 from sqlalchemy.orm import sessionmaker
-from sqlalchemy.pool import StaticPool
 
 from main import app
-from app.database import Base, get_db, DBTodo
-
-# Create a separate in-memory SQLite database for testing
-SQLALCHEMY_TEST_DATABASE_URL = "sqlite:///:memory:"
-engine = create_engine(
-    SQLALCHEMY_TEST_DATABASE_URL,
-    connect_args={"check_same_thread": False},
-    poolclass=StaticPool,  # Ensures same connection is used
-)
+from app.conditional import http_date
+from app.database import Base, DBTodo
+from app.dependencies import get_db
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
 TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 # Create the tables
@@ -29,13 +28,14 @@ def override_get_db():
         db.close()
 
 
-app.dependency_overrides[get_db] = override_get_db
-
 client = TestClient(app)
 
 
 @pytest.fixture(autouse=True)
 def setup_database():
+    # Each test module uses its own engine, so install the override per test
+    app.dependency_overrides[get_db] = override_get_db
+
     # Create tables before each test
     Base.metadata.create_all(bind=engine)
     yield
@@ -192,3 +192,233 @@ def test_delete_todo_not_found():
     response = client.delete("/todos/999")
     assert response.status_code == 404
     assert response.json()["detail"] == "Todo not found"
+
+
+def test_get_all_todos_not_modified():
+    create_response = client.post("/todos/", json={"text": "Todo item"})
+    todo_id = create_response.json()["todo_id"]
+
+    etag = client.get("/todos/").headers["ETag"]
+    assert client.get("/todos/", headers={"If-None-Match": etag}).status_code == 304
+
+    client.put(f"/todos/{todo_id}", json={"text": "Todo item", "switchCompletion": True})
+    response = client.get("/todos/", headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json()[0]["completed"] == True
+
+
+def test_filtered_todos_ignore_if_modified_since():
+    first = client.post("/todos/", json={"text": "First"}).json()["todo_id"]
+    client.post("/todos/", json={"text": "Second"})
+    response = client.get("/todos/", params={"completed": False})
+    assert "Last-Modified" not in response.headers
+
+    # Completing the older todo takes it out of the set without moving the
+    # latest update of the todos left in it
+    client.post("/todos/batch", json={"operations": [{"op": "toggle", "id": first}]})
+    since = http_date(datetime.now() + timedelta(days=1))
+    response = client.get("/todos/", params={"completed": False}, headers={"If-Modified-Since": since})
+    assert response.status_code == 200
+    assert [todo["text"] for todo in response.json()] == ["Second"]
+
+
+def test_get_single_todo_not_modified():
+    create_response = client.post("/todos/", json={"text": "Todo item"})
+    todo_id = create_response.json()["todo_id"]
+
+    first_response = client.get(f"/todos/{todo_id}")
+    etag = first_response.headers["ETag"]
+    assert client.get(f"/todos/{todo_id}", headers={"If-None-Match": etag}).status_code == 304
+    last_modified = first_response.headers["Last-Modified"]
+    # The todo may have changed again within the second Last-Modified names
+    assert client.get(f"/todos/{todo_id}", headers={"If-Modified-Since": last_modified}).status_code == 200
+    next_second = http_date(parsedate_to_datetime(last_modified) + timedelta(seconds=1))
+    assert client.get(f"/todos/{todo_id}", headers={"If-Modified-Since": next_second}).status_code == 304
+
+    client.put(f"/todos/{todo_id}", json={"text": "Renamed", "switchCompletion": False})
+    assert client.get(f"/todos/{todo_id}", headers={"If-None-Match": etag}).status_code == 200
+
+
+def test_get_single_todo_updated_in_the_same_second():
+    todo_id = client.post("/todos/", json={"text": "Todo item"}).json()["todo_id"]
+    last_modified = client.get(f"/todos/{todo_id}").headers["Last-Modified"]
+
+    client.put(f"/todos/{todo_id}", json={"text": "Renamed", "switchCompletion": False})
+    with TestingSessionLocal() as db:
+        # Both writes fall in the second the first Last-Modified names
+        db.query(DBTodo).filter(DBTodo.id == todo_id).update({
+            "last_update_timestamp": parsedate_to_datetime(last_modified).astimezone().replace(tzinfo=None)
+            + timedelta(microseconds=500000)
+        })
+        db.commit()
+
+    response = client.get(f"/todos/{todo_id}", headers={"If-Modified-Since": last_modified})
+    assert response.status_code == 200
+    assert response.json()["text"] == "Renamed"
+
+
+def test_batch_todos():
+    existing = client.post("/todos/", json={"text": "Existing"}).json()["todo_id"]
+    removed = client.post("/todos/", json={"text": "Removed"}).json()["todo_id"]
+
+    response = client.post("/todos/batch", json={"operations": [
+        {"op": "create", "text": "New todo"},
+        {"op": "update", "id": existing, "text": "Renamed"},
+        {"op": "toggle", "id": existing},
+        {"op": "delete", "id": removed},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [201, 200, 200, 204]
+    assert [result["index"] for result in results] == [0, 1, 2, 3]
+
+    todos = {todo["id"]: todo for todo in client.get("/todos/").json()}
+    assert set(todos) == {existing, results[0]["id"]}
+    assert todos[existing]["text"] == "Renamed"
+    assert todos[existing]["completed"] is True
+    assert todos[results[0]["id"]]["text"] == "New todo"
+
+
+def test_batch_todos_reports_failed_items():
+    todo_id = client.post("/todos/", json={"text": "Todo"}).json()["todo_id"]
+
+    response = client.post("/todos/batch", json={"operations": [
+        {"op": "update", "id": 9999, "text": "Missing"},
+        {"op": "create"},
+        {"op": "delete", "id": todo_id},
+        {"op": "toggle", "id": todo_id},
+    ]})
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [result["status"] for result in results] == [404, 400, 204, 404]
+    assert results[0]["detail"] == "Todo not found"
+    assert client.get("/todos/").json() == []
+
+
+def create_todos_at(*specs):
+    # (text, created, completed_at or None) -> ids, with the timestamps set directly
+    ids = [client.post("/todos/", json={"text": text}).json()["todo_id"] for text, _, _ in specs]
+    with TestingSessionLocal() as db:
+        for todo_id, (_, created, completed_at) in zip(ids, specs):
+            todo = db.get(DBTodo, todo_id)
+            todo.timestamp = created
+            todo.completed = completed_at is not None
+            todo.completion_timestamp = completed_at
+        db.commit()
+    return ids
+
+
+def todo_texts(**params):
+    response = client.get("/todos/", params=params)
+    assert response.status_code == 200
+    return [todo["text"] for todo in response.json()]
+
+
+def test_get_all_todos_filters():
+    day = datetime(2024, 1, 1)
+    create_todos_at(
+        ("old done", day, day + timedelta(days=1)),
+        ("old open", day + timedelta(days=2), None),
+        ("new done", day + timedelta(days=10), day + timedelta(days=11)),
+        ("new open", day + timedelta(days=12), None),
+    )
+
+    assert todo_texts(completed=False) == ["old open", "new open"]
+    assert todo_texts(completed=True) == ["old done", "new done"]
+    assert todo_texts(created_after=(day + timedelta(days=5)).isoformat()) == ["new done", "new open"]
+    assert todo_texts(created_before=(day + timedelta(days=5)).isoformat()) == ["old done", "old open"]
+    assert todo_texts(completed_since=(day + timedelta(days=5)).isoformat()) == ["new done"]
+
+
+def test_get_all_todos_sort():
+    day = datetime(2024, 1, 1)
+    create_todos_at(
+        ("first", day, day + timedelta(days=9)),
+        ("second", day + timedelta(days=1), day + timedelta(days=2)),
+        ("open", day + timedelta(days=2), None),
+    )
+
+    assert todo_texts() == ["first", "second", "open"]
+    assert todo_texts(sort="-created") == ["open", "second", "first"]
+    # Sorting by completion only lists completed todos
+    assert todo_texts(sort="completed") == ["second", "first"]
+    assert todo_texts(sort="-completed") == ["first", "second"]
+    assert client.get("/todos/", params={"sort": "completed", "completed": False}).status_code == 400
+
+
+def test_get_all_todos_paginated():
+    day = datetime(2024, 1, 1)
+    create_todos_at(*[(f"todo {i}", day + timedelta(hours=i), None) for i in range(5)])
+
+    texts = []
+    params = {"limit": 2, "sort": "-created", "completed": False}
+    while True:
+        response = client.get("/todos/", params=params)
+        assert response.status_code == 200
+        texts += [todo["text"] for todo in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+        params["after"] = cursor
+
+    assert texts == [f"todo {i}" for i in reversed(range(5))]
+    assert client.get("/todos/", params={"after": "not a cursor"}).status_code == 400
+
+
+def test_get_all_todos_paginated_by_completion_with_legacy_rows():
+    day = datetime(2024, 1, 1)
+    ids = create_todos_at(
+        ("legacy a", day, None),
+        ("done", day + timedelta(days=1), day + timedelta(days=2)),
+        ("legacy b", day + timedelta(days=3), None),
+    )
+    with TestingSessionLocal() as db:
+        # Completed before completion times were recorded
+        db.query(DBTodo).filter(DBTodo.id.in_([ids[0], ids[2]])).update({"completed": True})
+        db.commit()
+
+    for sort, expected in (
+        ("completed", ["legacy a", "legacy b", "done"]),
+        ("-completed", ["done", "legacy b", "legacy a"]),
+    ):
+        texts = []
+        params = {"limit": 1, "sort": sort}
+        while True:
+            response = client.get("/todos/", params=params)
+            assert response.status_code == 200
+            texts += [todo["text"] for todo in response.json()]
+            cursor = response.headers.get("X-Next-Cursor")
+            if cursor is None:
+                break
+            params["after"] = cursor
+        assert texts == expected
+        assert todo_texts(sort=sort) == expected
+
+
+def test_get_all_todos_filtered_etag():
+    create_todos_at(("open", datetime(2024, 1, 1), None))
+    response = client.get("/todos/", params={"completed": False})
+    etag = response.headers["ETag"]
+    assert client.get("/todos/", params={"completed": False}, headers={"If-None-Match": etag}).status_code == 304
+
+    # Completing the todo drops it from the open list
+    todo_id = response.json()[0]["id"]
+    client.put(f"/todos/{todo_id}", json={"text": "open", "switchCompletion": True})
+    response = client.get("/todos/", params={"completed": False}, headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.json() == []
+
+
+def test_count_todos():
+    day = datetime(2024, 1, 1)
+    create_todos_at(
+        ("done", day, day + timedelta(days=1)),
+        ("open", day, None),
+        ("also open", day + timedelta(days=3), None),
+    )
+
+    assert client.get("/todos/count").json() == {"count": 3}
+    assert client.get("/todos/count", params={"completed": False}).json() == {"count": 2}
+    assert client.get("/todos/count", params={
+        "completed": False, "created_after": (day + timedelta(days=1)).isoformat()
+    }).json() == {"count": 1}
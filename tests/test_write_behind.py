@@ -0,0 +1,179 @@
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.database import Base, DBPiece, DBTodo
+from app.dependencies import get_db
+from app.write_behind import WriteBehindQueue
+from tests.database import create_test_engine
+
+# A separate database for testing, see tests/database.py
+engine = create_test_engine()
+TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+# Create the tables
+Base.metadata.create_all(bind=engine)
+
+
+# Override the dependency
+def override_get_db():
+    try:
+        db = TestingSessionLocal()
+        yield db
+    finally:
+        db.close()
+
+
+client = TestClient(app)
+
+
+@pytest.fixture(autouse=True)
+def queue(monkeypatch):
+    # Each test gets its own enabled queue; nothing is flushed in the
+    # background unless the test starts it
+    app.dependency_overrides[get_db] = override_get_db
+    queue = WriteBehindQueue(enabled=True, interval_ms=60000)
+    monkeypatch.setattr("app.write_behind.write_behind_queue", queue)
+    monkeypatch.setattr("app.routes.write_behind_queue", queue)
+    Base.metadata.create_all(bind=engine)
+    yield queue
+    queue.stop()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+
+
+@pytest.fixture
+def file_engine(tmp_path):
+    # The background flusher needs connections of its own, which the shared
+    # in-memory connection cannot give it
+    file_engine = create_engine(f"sqlite:///{tmp_path / 'notes.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=file_engine)
+    FileSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=file_engine)
+
+    def override_get_file_db():
+        db = FileSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_file_db
+    yield file_engine
+    file_engine.dispose()
+
+
+def stored_texts(bind=engine):
+    # A plain connection, unlike a session, does not settle the queue
+    with bind.connect() as connection:
+        return connection.scalars(select(DBPiece.text).order_by(DBPiece.position)).all()
+
+
+def stored_todo(todo_id):
+    with engine.connect() as connection:
+        return connection.execute(select(DBTodo.text, DBTodo.completed).where(DBTodo.id == todo_id)).one()
+
+
+def create_note(*texts):
+    response = client.post("/notes", json={"pieces": [{"text": text} for text in texts]})
+    return response.json()["note_id"]
+
+
+def test_update_is_queued(queue):
+    note_id = create_note("Original text")
+
+    response = client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Autosaved"}]})
+    assert response.status_code == 202
+    assert response.json()["message"] == "Note update queued"
+    assert len(queue.pending) == 1
+    assert stored_texts() == ["Original text"]
+
+
+def test_read_sees_queued_update(queue):
+    note_id = create_note("Original text")
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Autosaved"}]})
+
+    response = client.get(f"/notes/{note_id}")
+    assert [piece["text"] for piece in response.json()["pieces"]] == ["Autosaved"]
+    assert not queue.pending
+    # Stamped with the time of the request, not of the flush
+    note = response.json()
+    assert note["pieces"][0]["timestamp"] == note["last_update_timestamp"]
+
+
+def test_rapid_updates_coalesce(queue):
+    note_id = create_note("v0")
+    for version in range(1, 6):
+        client.put(f"/notes/{note_id}", json={"pieces": [{"text": f"v{version}"}, {"text": "tail"}]})
+
+    assert queue.coalesced == 4
+    assert queue.flush() == 1
+    assert stored_texts() == ["v5", "tail"]
+
+
+def test_todo_toggles_coalesce(queue):
+    todo_id = client.post("/todos/", json={"text": "Buy milk"}).json()["todo_id"]
+
+    client.put(f"/todos/{todo_id}", json={"text": "Buy milk", "switchCompletion": True})
+    client.put(f"/todos/{todo_id}", json={"text": "Buy milk", "switchCompletion": True})
+    client.put(f"/todos/{todo_id}", json={"text": "Buy oat milk", "switchCompletion": True})
+    client.put(f"/todos/{todo_id}", json={"text": "Buy oat milk", "switchCompletion": False})
+    queue.flush()
+
+    text, completed = stored_todo(todo_id)
+    assert text == "Buy oat milk"
+    assert completed
+
+
+def test_missing_entity_not_queued(queue):
+    assert client.put("/notes/999", json={"pieces": [{"text": "x"}]}).status_code == 404
+    assert client.put("/todos/999", json={"text": "x", "switchCompletion": True}).status_code == 404
+    assert not queue.pending
+
+
+def test_delete_after_queued_update(queue):
+    note_id = create_note("Original text")
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Autosaved"}]})
+
+    assert client.delete(f"/notes/{note_id}").status_code == 204
+    assert not queue.pending
+    assert client.get(f"/notes/{note_id}").status_code == 404
+    assert stored_texts() == []
+
+
+def test_flushes_in_background(queue, file_engine):
+    queue.interval = 0.01
+    queue.start()
+    note_id = create_note("Original text")
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Autosaved"}]})
+
+    deadline = time.monotonic() + 5
+    while stored_texts(file_engine) != ["Autosaved"] and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert stored_texts(file_engine) == ["Autosaved"]
+
+
+def test_flushes_when_full(queue, file_engine):
+    queue.max_pending = 2
+    queue.start()
+    first, second = create_note("a"), create_note("b")
+    client.put(f"/notes/{first}", json={"pieces": [{"text": "a2"}]})
+    client.put(f"/notes/{second}", json={"pieces": [{"text": "b2"}]})
+
+    deadline = time.monotonic() + 5
+    while not queue.flushes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert sorted(stored_texts(file_engine)) == ["a2", "b2"]
+
+
+def test_stop_drains_queue(queue, file_engine):
+    queue.start()
+    note_id = create_note("Original text")
+    client.put(f"/notes/{note_id}", json={"pieces": [{"text": "Autosaved"}]})
+
+    queue.stop()
+    assert not queue.pending
+    assert stored_texts(file_engine) == ["Autosaved"]
@@ -0,0 +1,91 @@
+import sqlite3
+import threading
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from main import app
+from app.database import Base, write_retry_delays
+from app.dependencies import get_db
+from app.sqlite_pragmas import install_pragmas
+from tests.database import sqlite_only
+
+pytestmark = sqlite_only
+
+# Writers in other processes are played by a plain sqlite3 connection holding
+# the write lock on a file database
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    path = str(tmp_path / "notes.db")
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False})
+    install_pragmas(engine, {"journal_mode": "WAL", "busy_timeout": 50})
+    Base.metadata.create_all(bind=engine)
+    TestingSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+    def override_get_db():
+        db = TestingSessionLocal()
+        try:
+            yield db
+        finally:
+            db.close()
+
+    app.dependency_overrides[get_db] = override_get_db
+    yield path
+    engine.dispose()
+
+
+@pytest.fixture
+def client():
+    # Failed requests come back as responses instead of raised exceptions
+    return TestClient(app, raise_server_exceptions=False)
+
+
+def hold_write_lock(path):
+    connection = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    connection.execute("BEGIN IMMEDIATE")
+    return connection
+
+
+def test_write_waits_for_lock(database_path, client):
+    other = hold_write_lock(database_path)
+    # Released while the request is still retrying
+    threading.Timer(0.1, other.rollback).start()
+    response = client.post("/todos/", json={"text": "after the other writer"})
+    assert response.status_code == 201
+    other.close()
+
+
+def test_busy_database_returns_503(database_path, client, monkeypatch):
+    monkeypatch.setattr("app.database.write_retry_delays", lambda: [0.01, 0.01])
+    other = hold_write_lock(database_path)
+    try:
+        response = client.post("/todos/", json={"text": "blocked"})
+    finally:
+        other.rollback()
+        other.close()
+    assert response.status_code == 503
+    assert response.headers["retry-after"] == "1"
+    assert client.get("/todos/").json() == []
+
+
+def test_reads_not_blocked_by_writer(database_path, client):
+    client.post("/todos/", json={"text": "existing"})
+    other = hold_write_lock(database_path)
+    try:
+        response = client.get("/todos/")
+    finally:
+        other.rollback()
+        other.close()
+    assert response.status_code == 200
+    assert len(response.json()) == 1
+
+
+def test_write_retry_delays_back_off():
+    delays = write_retry_delays(retries=4, backoff_ms=100)
+    assert len(delays) == 4
+    for attempt, delay in enumerate(delays):
+        assert 0.05 * 2 ** attempt <= delay <= 0.15 * 2 ** attempt